@@ -0,0 +1,614 @@
+"""
+Reusable Secrets Safe client for in-process use.
+
+SecretsSafeClient holds the configuration, the HTTP session and the
+authenticated session of the action, independently of its environment
+variables and step outputs. Python tooling and long-running services can
+import it to create batches of secrets under one sign-in, without starting
+the action container for every call. The action entrypoint is a thin wrapper
+around it and shares its planning and writing steps.
+"""
+
+import concurrent.futures
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+import requests
+import secrets_safe_library
+from secrets_safe_library import (
+    authentication,
+    exceptions,
+    folders,
+    password_rules,
+    secrets_safe,
+    utils,
+)
+from secrets_safe_library.security import sanitize_sensitive_data
+from src import (
+    metrics,
+    rotation,
+    streaming,
+    structured_logging,
+    tracing,
+    transport,
+    upsert,
+)
+
+DEFAULT_TIMEOUT_SECONDS = 30
+
+
+class ClientConfig(NamedTuple):
+    """
+    Connection settings of a SecretsSafeClient. Either api_key, or client_id
+    and client_secret, are required.
+    """
+
+    api_url: str
+    api_key: Optional[str] = None
+    client_id: Optional[str] = None
+    client_secret: Optional[str] = None
+    api_version: Optional[str] = None
+    verify_ca: bool = True
+    certificate: str = ""
+    certificate_key: str = ""
+    timeout_connection_seconds: int = DEFAULT_TIMEOUT_SECONDS
+    timeout_request_seconds: int = DEFAULT_TIMEOUT_SECONDS
+    probe_timeout_seconds: float = transport.DEFAULT_PROBE_TIMEOUT_SECONDS
+    rate_limit_rps: float = 0
+    rate_limit_burst: float = 0
+    startup_jitter_seconds: float = 0
+
+
+class SecretSpec(NamedTuple):
+    """
+    A secret to write. The type follows the library precedence: a credential
+    secret when username is set, a text secret when text is set, a file
+    secret otherwise. A credential without password gets a password
+    generated from password_rule_id.
+    """
+
+    title: str
+    folder: str
+    username: str = ""
+    password: str = ""
+    text: str = ""
+    file_path: str = ""
+    description: str = ""
+    owner_id: Optional[int] = None
+    owner_type: str = ""
+    owners: Optional[list] = None
+    password_rule_id: Optional[int] = None
+    notes: str = ""
+    urls: Optional[list] = None
+
+    @property
+    def secret_type(self) -> str:
+        if self.username:
+            return upsert.CREDENTIAL_TYPE
+        if self.text:
+            return upsert.TEXT_TYPE
+        return upsert.FILE_TYPE
+
+    @property
+    def generates_password(self) -> bool:
+        return bool(
+            self.username and not self.password and self.password_rule_id is not None
+        )
+
+    def desired_digest(self) -> Optional[str]:
+        """
+        Hash the requested content. When the password is generated, only the
+        username is hashed, so an existing credential is not rotated on
+        every run.
+
+        Returns:
+            str, optional: Hex SHA-256 digest, None for named pipes.
+        """
+        if self.secret_type == upsert.CREDENTIAL_TYPE:
+            if self.generates_password:
+                return upsert.content_digest(self.username)
+            return upsert.content_digest(self.username, self.password)
+        if self.secret_type == upsert.TEXT_TYPE:
+            return upsert.content_digest(self.text)
+        return upsert.file_digest(self.file_path)
+
+    def attributes(self, folder_id: str) -> dict:
+        """
+        Get the keyword arguments of the library create_secret and
+        update_secret methods.
+
+        Args:
+            folder_id (str): The parent folder GUID.
+
+        Returns:
+            dict: The secret attributes.
+        """
+        return {
+            "title": self.title,
+            "folder_id": folder_id,
+            "description": self.description,
+            "username": self.username,
+            "password": self.password,
+            "text": self.text,
+            "file_path": self.file_path,
+            "owner_id": self.owner_id,
+            "owner_type": self.owner_type,
+            "owners": self.owners,
+            "password_rule_id": self.password_rule_id,
+            "notes": self.notes,
+            "urls": self.urls,
+        }
+
+
+class CreateResult(NamedTuple):
+    """
+    Outcome of writing one SecretSpec.
+    """
+
+    title: str
+    action: Optional[str]
+    password: Optional[str] = None
+    error: Optional[str] = None
+
+
+def get_folder(
+    folders_obj: folders.Folder,
+    folder_name: str,
+) -> Optional[Dict[str, Any]]:
+    """
+    Retrieve a folder by its name.
+
+    Args:
+        folders_obj (folders.Folder): Instance of the Folders client used
+            to interact with the Secrets Safe folders API.
+        folder_name (str): Name of the folder to search for.
+
+    Returns:
+        Optional[Dict[str, Any]]: Folder dictionary if found, otherwise None.
+    """
+    folder_list = folders_obj.list_folders(folder_name=folder_name)
+    matched_folders = [x for x in folder_list if x["Name"] == folder_name]
+
+    if not matched_folders:
+        return None
+
+    return matched_folders[0]
+
+
+def plan_secret(
+    secrets_safe_obj: secrets_safe.SecretsSafe,
+    spec: SecretSpec,
+    if_exists: str,
+    folder_id: str,
+    index: Optional[Dict[str, dict]] = None,
+) -> Tuple[str, Optional[dict]]:
+    """
+    Decide whether a secret has to be created, updated or skipped.
+
+    Unless if_exists is "fail", the folder titles are indexed with one listing
+    call, and an existing secret is only read when it may be updated.
+
+    Args:
+        secrets_safe_obj (secrets_safe.SecretsSafe): Secrets Safe client.
+        spec (SecretSpec): The requested secret.
+        if_exists (str): One of upsert.IF_EXISTS_MODES.
+        folder_id (str): The parent folder GUID.
+        index (Dict[str, dict], optional): Title index of the folder, built
+            when not given.
+
+    Returns:
+        Tuple[str, Optional[dict]]: The action and the existing secret record.
+    """
+    if if_exists == upsert.IF_EXISTS_FAIL:
+        return upsert.CREATE, None
+
+    if index is None:
+        index = upsert.build_title_index(secrets_safe_obj, folder_id)
+    record = index.get(spec.title)
+    action = upsert.decide(
+        record,
+        if_exists,
+        spec.secret_type,
+        desired_digest=spec.desired_digest,
+        current_digest=lambda: upsert.existing_digest(
+            secrets_safe_obj, record, include_password=not spec.generates_password
+        ),
+    )
+    return action, record
+
+
+def write_secret(
+    secrets_safe_obj: secrets_safe.SecretsSafe,
+    action: str,
+    record: Optional[dict],
+    secret_attributes: dict,
+    logger: logging.Logger,
+) -> Optional[dict]:
+    """
+    Create, update or skip a secret according to the planned action.
+
+    Args:
+        secrets_safe_obj (secrets_safe.SecretsSafe): Secrets Safe client.
+        action (str): The action returned by plan_secret.
+        record (dict, optional): The existing secret record, for updates.
+        secret_attributes (dict): Secret attributes for create_secret and
+            update_secret.
+        logger (logging.Logger): Logger.
+
+    Returns:
+        Optional[dict]: The created secret record, None unless created.
+    """
+    title = secret_attributes["title"]
+    if action == upsert.SKIP:
+        logger.info(f"Secret {title!r} already exists and is up to date, skipping")
+    elif action == upsert.UPDATE:
+        secrets_safe_obj.update_secret(record["Id"], **secret_attributes)
+        logger.info(f"Secret {title!r} updated successfully")
+    else:
+        created = secrets_safe_obj.create_secret(**secret_attributes)
+        logger.info(f"Secret {title!r} created successfully")
+        return created
+    return None
+
+
+class SessionGuard:
+    """
+    Tracks whether a shared authenticated session is still signed in. The
+    library signs the session out on every unsuccessful request, so after a
+    failed write the guard signs in again before the next one.
+    """
+
+    def __init__(self, authentication_obj: authentication.Authentication):
+        """
+        Args:
+            authentication_obj (Authentication): The shared session.
+        """
+        self._authentication_obj = authentication_obj
+        self._lock = threading.Lock()
+        self._session_valid = True
+
+    def ensure(self) -> None:
+        """
+        Sign in again if the session was invalidated.
+
+        Raises:
+            exceptions.AuthenticationFailure: If signing in fails.
+        """
+        with self._lock:
+            if self._session_valid:
+                return
+            response = self._authentication_obj.get_api_access()
+            if response.status_code != 200:
+                raise exceptions.AuthenticationFailure(
+                    "Could not re-authenticate against Secrets Safe"
+                )
+            self._session_valid = True
+
+    def invalidate(self) -> None:
+        """
+        Mark the session as signed out.
+        """
+        with self._lock:
+            self._session_valid = False
+
+    def call(self, function: Callable[..., Any], *args, **kwargs) -> Any:
+        """
+        Call a function using the session, signing in again first if a
+        previous call failed.
+
+        Args:
+            function (Callable): The function.
+            args, kwargs: Its arguments.
+
+        Returns:
+            Any: The result of the function.
+        """
+        self.ensure()
+        try:
+            return function(*args, **kwargs)
+        except Exception:
+            self.invalidate()
+            raise
+
+
+class SecretsSafeClient:
+    """
+    Client holding one HTTP session and one authenticated Secrets Safe
+    session. Use it as a context manager, or call sign_in() and close().
+    """
+
+    def __init__(
+        self,
+        config: ClientConfig,
+        logger: Optional[logging.Logger] = None,
+        metrics_registry: Optional[metrics.Metrics] = None,
+        trace_recorder: Optional[tracing.TraceRecorder] = None,
+    ):
+        """
+        Args:
+            config (ClientConfig): Connection settings.
+            logger (logging.Logger, optional): Logger, also used by the
+                library.
+            metrics_registry (metrics.Metrics, optional): Registry collecting
+                the HTTP and sign-in metrics.
+            trace_recorder (tracing.TraceRecorder, optional): Recorder of the
+                HTTP calls.
+        """
+        self.config = config
+        self._logger = logger or logging.getLogger(__name__)
+        self._metrics = metrics_registry
+        self._trace = trace_recorder
+        self._session: Optional[requests.Session] = None
+        self._authentication_obj: Optional[authentication.Authentication] = None
+        self._session_guard: Optional[SessionGuard] = None
+        self._pending_sign_in: Optional[concurrent.futures.Future] = None
+        self._folder_ids: Dict[str, str] = {}
+
+    def __enter__(self) -> "SecretsSafeClient":
+        if self._authentication_obj is None:
+            self.wait_signed_in()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    @property
+    def authentication_obj(self) -> authentication.Authentication:
+        """
+        The authenticated session, signing in on first use.
+        """
+        if self._authentication_obj is None:
+            self.wait_signed_in()
+        return self._authentication_obj
+
+    def _auth_config(self, api_url: str) -> dict:
+        config = self.config
+        certificate, certificate_key = utils.prepare_certificate_info(
+            config.certificate, config.certificate_key
+        )
+        auth_config = {
+            "req": self._session,
+            "timeout_connection": config.timeout_connection_seconds,
+            "timeout_request": config.timeout_request_seconds,
+            "api_url": api_url,
+            "certificate": certificate,
+            "certificate_key": certificate_key,
+            "verify_ca": config.verify_ca,
+            "logger": self._logger,
+        }
+
+        # The recommended version is 3.1. If no version is specified,
+        # the default API version 3.0 will be used
+        if config.api_version:
+            auth_config["api_version"] = config.api_version
+
+        # If api_key is set, we're using API Key authentication
+        # otherwise we're using OAuth/Client Credentials.
+        if config.api_key:
+            auth_config["api_key"] = config.api_key
+        else:
+            auth_config["client_id"] = config.client_id
+            auth_config["client_secret"] = config.client_secret
+        return auth_config
+
+    def sign_in(self) -> authentication.Authentication:
+        """
+        Open the HTTP session and sign in to Secrets Safe.
+
+        Returns:
+            authentication.Authentication: The authenticated session.
+
+        Raises:
+            exceptions.AuthenticationFailure: If signing in fails.
+        """
+        config = self.config
+        self._session = requests.Session()
+        if self._metrics is not None:
+            self._metrics.instrument_session(self._session)
+
+        # probes the nodes when api_url lists several, see transport
+        api_url = transport.mount_adapter(
+            self._session,
+            transport.parse_api_urls(config.api_url),
+            self._logger,
+            probe_timeout=config.probe_timeout_seconds,
+            verify=config.verify_ca,
+            rate_limiter=transport.build_rate_limiter(
+                config.rate_limit_rps, config.rate_limit_burst
+            ),
+            startup_jitter_seconds=config.startup_jitter_seconds,
+        )
+        if self._trace is not None:
+            self._trace.instrument_session(self._session, api_url or config.api_url)
+
+        authentication_obj = authentication.Authentication(
+            **self._auth_config(api_url or config.api_url)
+        )
+        started = time.perf_counter()
+        response = authentication_obj.get_api_access()
+        if self._metrics is not None:
+            self._metrics.observe(
+                "auth_seconds",
+                time.perf_counter() - started,
+                help_text="Latency of the sign-in to Secrets Safe.",
+            )
+
+        utils.print_log(
+            self._logger,
+            f"{secrets_safe_library.__library_name__} "
+            f"version: {secrets_safe_library.__version__}",
+            logging.DEBUG,
+        )
+
+        if response.status_code != 200:
+            self._close_session()
+            raise exceptions.AuthenticationFailure(
+                f"Please check credentials, error {response.text}"
+            )
+
+        self._authentication_obj = authentication_obj
+        self._session_guard = SessionGuard(authentication_obj)
+        # a request failed over to another node signs in again there
+        transport.guard_session(self._session, self._session_guard)
+        self._folder_ids = {}
+        return authentication_obj
+
+    def start_sign_in(self) -> None:
+        """
+        Sign in on a background thread, so that the TLS handshake and the
+        sign-in overlap with local work, e.g. parsing the inputs.
+        wait_signed_in() waits for it and raises its error.
+        """
+        executor = concurrent.futures.ThreadPoolExecutor(
+            1, thread_name_prefix="sign-in"
+        )
+        self._pending_sign_in = executor.submit(self.sign_in)
+        executor.shutdown(wait=False)
+
+    def wait_signed_in(self) -> authentication.Authentication:
+        """
+        Wait for the sign-in started with start_sign_in(), or sign in now
+        when none was started.
+
+        Returns:
+            authentication.Authentication: The authenticated session.
+
+        Raises:
+            exceptions.AuthenticationFailure: If signing in fails.
+        """
+        pending, self._pending_sign_in = self._pending_sign_in, None
+        if pending is None:
+            return self.sign_in()
+        return pending.result()
+
+    def close(self) -> None:
+        """
+        Wait for a sign-in still running, sign out and close the HTTP session.
+        """
+        pending, self._pending_sign_in = self._pending_sign_in, None
+        if pending is not None and pending.exception() is not None:
+            # the caller is already failing, e.g. on invalid inputs
+            self._logger.debug(f"Sign-in failed: {pending.exception()}")
+        self._close_session()
+
+    def _close_session(self) -> None:
+        if self._authentication_obj is not None:
+            self._authentication_obj.sign_app_out()
+            self._authentication_obj = None
+        if self._session is not None:
+            transport.log_throttling(self._session, self._logger)
+            self._session.close()
+            self._session = None
+
+    def folder_id(self, folder_name: str) -> str:
+        """
+        Get the GUID of a folder, looking each folder up once.
+
+        Args:
+            folder_name (str): Name of the folder.
+
+        Returns:
+            str: The folder GUID.
+
+        Raises:
+            exceptions.LookupError: If the folder was not found.
+        """
+        if folder_name not in self._folder_ids:
+            folders_obj = folders.Folder(
+                authentication=self.authentication_obj, logger=self._logger
+            )
+            folder = get_folder(folders_obj, folder_name)
+            if not folder:
+                raise exceptions.LookupError(f"Folder {folder_name!r} was not found")
+            self._folder_ids[folder_name] = folder["Id"]
+        return self._folder_ids[folder_name]
+
+    def create_many(
+        self,
+        specs: List[SecretSpec],
+        if_exists: str = upsert.IF_EXISTS_FAIL,
+    ) -> List[CreateResult]:
+        """
+        Create, update or skip a batch of secrets. Each folder is looked up
+        and, unless if_exists is "fail", indexed once for the whole batch.
+        A failed secret does not stop the remaining ones, the session the
+        library signs out on failure is signed in again before the next one.
+
+        Args:
+            specs (List[SecretSpec]): The secrets to write.
+            if_exists (str): One of upsert.IF_EXISTS_MODES.
+
+        Returns:
+            List[CreateResult]: One result per spec, in the same order, with
+            the generated password if any.
+        """
+        secrets_safe_obj = streaming.StreamingSecretsSafe(
+            authentication=self.authentication_obj, logger=self._logger
+        )
+        generator = rotation.PasswordGenerator(
+            password_rules.PasswordRule(self.authentication_obj, self._logger)
+        )
+        session_guard = self._session_guard
+        indexes: Dict[str, Dict[str, dict]] = {}
+
+        results = []
+        for spec in specs:
+            started = time.perf_counter()
+            try:
+                action, password = session_guard.call(
+                    self._write, secrets_safe_obj, generator, indexes, spec, if_exists
+                )
+            except Exception as e:
+                self._logger.error(f"Error writing secret {spec.title!r}: {e}")
+                error = sanitize_sensitive_data(str(e))
+                results.append(CreateResult(spec.title, None, error=error))
+                self._log_write(spec, started, "failed")
+                continue
+
+            results.append(CreateResult(spec.title, action, password))
+            self._log_write(spec, started, action)
+
+        return results
+
+    def _write(
+        self,
+        secrets_safe_obj: secrets_safe.SecretsSafe,
+        generator: rotation.PasswordGenerator,
+        indexes: Dict[str, Dict[str, dict]],
+        spec: SecretSpec,
+        if_exists: str,
+    ) -> Tuple[str, Optional[str]]:
+        folder_id = self.folder_id(spec.folder)
+        if if_exists != upsert.IF_EXISTS_FAIL and folder_id not in indexes:
+            indexes[folder_id] = upsert.build_title_index(secrets_safe_obj, folder_id)
+        action, record = plan_secret(
+            secrets_safe_obj, spec, if_exists, folder_id, indexes.get(folder_id)
+        )
+        attributes = spec.attributes(folder_id)
+        password = None
+        if action != upsert.SKIP and spec.generates_password:
+            password = generator.generate(spec.password_rule_id)
+            attributes["password"] = password
+        created = write_secret(
+            secrets_safe_obj, action, record, attributes, self._logger
+        )
+        if action == upsert.CREATE and folder_id in indexes:
+            # a later spec with the same title must see the created secret
+            if isinstance(created, dict) and "Id" in created:
+                created.setdefault("SecretType", spec.secret_type)
+                indexes[folder_id][spec.title] = created
+            else:
+                del indexes[folder_id]
+        return action, password
+
+    def _log_write(self, spec: SecretSpec, started: float, status: str) -> None:
+        structured_logging.log_event(
+            self._logger,
+            logging.DEBUG,
+            "create_secret",
+            path=f"{spec.folder}/{spec.title}",
+            started=started,
+            status=status,
+        )
@@ -6,29 +6,99 @@ This module is responsible for:
 - Authenticating against the Secrets Safe API
 - Locating parent folders
 - Creating secrets of type CREDENTIAL, TEXT, or FILE
+- Streaming large FILE secrets from the workspace without staging them
+- Updating or skipping existing secrets when the content has not changed
+- Generating passwords, rotating credentials and publishing them as outputs
+- Planning dry runs, listing the API calls a run would make
 - Handling errors and logging
 """
 
-import json
 import logging
 import os
-from typing import Any, Dict, Optional
+import time
+import uuid
+from typing import List, Optional
 
-import requests
-import secrets_safe_library
-from requests.adapters import HTTPAdapter
 from secrets_safe_library import (
     authentication,
     exceptions,
     folders,
+    password_rules,
     secrets_safe,
-    utils,
 )
 from secrets_safe_library.integrations.github_actions.common_utils import common
-from urllib3.util.retry import Retry
+from src import (
+    client,
+    metrics,
+    plan,
+    rotation,
+    schema,
+    streaming,
+    structured_logging,
+    tracing,
+    transport,
+    upsert,
+)
+from src.client import get_folder
 
 env = os.environ
 
+# invalid settings, which fall back to their defaults, reported by
+# check_settings
+INVALID_SETTINGS = []
+
+
+def number_setting(name: str, default: float, parse=float, valid=None) -> float:
+    """
+    Read a numeric setting from the environment. A value that cannot be
+    parsed, or is rejected by valid, is recorded in INVALID_SETTINGS, to be
+    reported once the run starts, and the default is used meanwhile.
+
+    Args:
+        name (str): Name of the environment variable.
+        default (float): Value used when the variable is unset or empty.
+        parse (callable, optional): Conversion of the value, int or float.
+        valid (callable, optional): Check of the parsed value.
+
+    Returns:
+        float: The setting.
+    """
+    value = env.get(name, "").strip()
+    if not value:
+        return default
+    try:
+        number = parse(value)
+    except ValueError:
+        number = None
+    if number is None or (valid is not None and not valid(number)):
+        INVALID_SETTINGS.append(f"{name}={value!r}")
+        return default
+    return number
+
+
+def choice_setting(name: str, choices: tuple, default: str) -> str:
+    """
+    Read a setting with a fixed set of values from the environment,
+    case-insensitively. Any other value is recorded in INVALID_SETTINGS
+    and the default is used meanwhile.
+
+    Args:
+        name (str): Name of the environment variable.
+        choices (tuple): The accepted values, in lower case.
+        default (str): Value used when the variable is unset or empty.
+
+    Returns:
+        str: The setting.
+    """
+    value = env.get(name, "").strip().lower()
+    if not value:
+        return default
+    if value not in choices:
+        INVALID_SETTINGS.append(f"{name}={value!r}")
+        return default
+    return value
+
+
 # config data
 API_KEY = env.get("API_KEY")
 CLIENT_ID = env.get("CLIENT_ID")
@@ -36,6 +106,19 @@ CLIENT_SECRET = env.get("CLIENT_SECRET")
 API_URL = env.get("API_URL")
 API_VERSION = env.get("API_VERSION")
 VERIFY_CA = env.get("VERIFY_CA", "true").lower() != "false"
+API_PROBE_TIMEOUT_SECONDS = number_setting(
+    "API_PROBE_TIMEOUT_SECONDS", transport.DEFAULT_PROBE_TIMEOUT_SECONDS
+)
+RATE_LIMIT_RPS = number_setting("RATE_LIMIT_RPS", 0.0)
+RATE_LIMIT_BURST = number_setting("RATE_LIMIT_BURST", 0.0)
+STARTUP_JITTER_SECONDS = number_setting("STARTUP_JITTER_SECONDS", 0.0)
+# Prometheus textfile metrics, written when METRICS_DIR is set
+METRICS_DIR = env.get("METRICS_DIR", "").strip()
+RUNNER_NAME = env.get("RUNNER_NAME", "").strip()
+METRICS = metrics.Metrics({"action": "create_secret", "runner": RUNNER_NAME})
+# anonymized traces of the HTTP calls, appended to TRACE_FILE when set
+TRACE_FILE = env.get("TRACE_FILE", "").strip()
+TRACE = tracing.TraceRecorder("create_secret") if TRACE_FILE else None
 TIMEOUT_CONNECTION_SECONDS = 30
 TIMEOUT_REQUEST_SECONDS = 30
 CERTIFICATE = env.get("CERTIFICATE", "").replace(r"\n", "\n")
@@ -50,12 +133,22 @@ PASSWORD = env.get("INPUT_PASSWORD", "").strip()
 TEXT = env.get("INPUT_TEXT", "").strip()
 FILE_CONTENT = env.get("INPUT_FILE_CONTENT", "").strip()
 FILE_NAME = env.get("INPUT_FILE_NAME", "").strip()
+FILE_PATH = env.get("INPUT_FILE_PATH", "").strip()
+WORKSPACE = env.get("GITHUB_WORKSPACE", os.getcwd())
 OWNER_ID = env.get("INPUT_OWNER_ID", "").strip()
 OWNER_TYPE = env.get("INPUT_OWNER_TYPE", "").strip()
 PASSWORD_RULE_ID = env.get("INPUT_PASSWORD_RULE_ID", "").strip()
 NOTES = env.get("INPUT_NOTES", "").strip()
 OWNERS = env.get("INPUT_OWNERS", "")
 URLS = env.get("INPUT_URLS", "")
+IF_EXISTS = env.get("INPUT_IF_EXISTS", "").strip().lower() or upsert.IF_EXISTS_FAIL
+OUTPUT_ID = env.get("INPUT_OUTPUT_ID", "").strip()
+ROTATE_SECRETS = env.get("INPUT_ROTATE_SECRETS", "").strip()
+# owners and urls are passed on to the API as they are
+OWNER_ENTRIES = schema.Schema(None, [], "owner")
+URL_ENTRIES = schema.Schema(None, [], "url")
+DRY_RUN = env.get("INPUT_DRY_RUN", "false").strip().lower() == "true"
+PLAN_OUTPUT = "plan"
 
 LOG_LEVEL = env.get("LOG_LEVEL", "INFO").strip().upper()
 
@@ -72,72 +165,312 @@ LOG_LEVELS = {
 
 LOGGER_NAME = "custom_logger"
 
-logging.basicConfig(
-    format="%(asctime)-5s %(name)-15s %(levelname)-8s %(message)s",
-    level=LOG_LEVELS[LOG_LEVEL],
+# "text" or "json", see structured_logging
+LOG_FORMAT = choice_setting(
+    "LOG_FORMAT", structured_logging.LOG_FORMATS, structured_logging.TEXT_FORMAT
+)
+LOG_SAMPLE_RATE = number_setting(
+    "LOG_SAMPLE_RATE", 1.0, valid=lambda rate: 0 <= rate <= 1
+)
+
+logger = structured_logging.configure_logging(
+    LOGGER_NAME,
+    LOG_LEVELS[LOG_LEVEL],
+    log_format=LOG_FORMAT,
+    sample_rate=LOG_SAMPLE_RATE,
+    run_id=env.get("GITHUB_RUN_ID"),
 )
 
-logger = logging.getLogger(LOGGER_NAME)
+COMMAND_MARKER: str = "::"
+
+
+def parse_json_parameters():
+    """
+    Parse and validate the owners and urls JSON parameters, reporting the
+    errors of both together.
+
+    Returns:
+        tuple: A tuple containing (owners_list, urls_list)
+    """
+    inputs = (("owners", OWNERS, OWNER_ENTRIES), ("urls", URLS, URL_ENTRIES))
+    parsed = dict.fromkeys(name for name, _, _ in inputs)
+    errors = []
+    for name, value, entries in inputs:
+        try:
+            parsed[name] = entries.loads(value, name) if value else None
+        except schema.SchemaError as e:
+            errors.extend(e.errors)
+    if errors:
+        common.show_error(str(schema.SchemaError(errors)), logger)
+
+    return parsed["owners"], parsed["urls"]
+
+
+def mask_secret(command: str, secret_to_mask: str) -> None:
+    """
+    Masks a secret by modifying the command to prevent it from being printed
+    in the console.
+
+    Args:
+        command (str): The command associated with the secret.
+        secret_to_mask (str): The secret text to be masked.
+    """
+    for line in secret_to_mask.splitlines():
+        if line.strip():
+            print(f"{COMMAND_MARKER}{command} {COMMAND_MARKER}{line}")
+
 
+def publish_output(output_id: str, value: str) -> None:
+    """
+    Mask a secret value and append it to the GitHub Actions step outputs.
+
+    Args:
+        output_id (str): The name of the output variable.
+        value (str): The secret value.
+    """
+    mask_secret("add-mask", value)
+    append_output(output_id, value)
 
-def get_folder(
-    folders_obj: folders.Folder,
-    folder_name: str,
-) -> Optional[Dict[str, Any]]:
+
+def append_output(output_id: str, value: str) -> None:
     """
-    Retrieve a folder by its name.
+    Append a value to the GitHub Actions step outputs, without masking it.
 
     Args:
-        folders_obj (folders.Folder): Instance of the Folders client used
-            to interact with the Secrets Safe folders API.
-        folder_name (str): Name of the folder to search for.
+        output_id (str): The name of the output variable.
+        value (str): The value.
+    """
+    with open(env["GITHUB_OUTPUT"], "a") as fh:
+        delimiter = uuid.uuid4()
+        fh.write(f"{output_id}<<{delimiter}\n{value}\n{delimiter}\n")
+
+
+def get_secret_type() -> str:
+    """
+    Get the type of the requested secret, using the same precedence as the
+    library when several contents are provided.
 
     Returns:
-        Optional[Dict[str, Any]]: Folder dictionary if found, otherwise None.
+        str: The secret type.
     """
-    folder_list = folders_obj.list_folders(folder_name=folder_name)
-    matched_folders = [x for x in folder_list if x["Name"] == folder_name]
+    return client.SecretSpec(TITLE, PARENT_FOLDER_NAME, USERNAME, text=TEXT).secret_type
 
-    if not matched_folders:
-        return None
 
-    return matched_folders[0]
+def build_secret_spec(file_path: str) -> client.SecretSpec:
+    """
+    Build the requested secret from the step inputs.
 
+    Args:
+        file_path (str): Path of the file for file secrets.
 
-def parse_json_parameters():
+    Returns:
+        client.SecretSpec: The requested secret.
+    """
+    owners_list, urls_list = parse_json_parameters()
+    return client.SecretSpec(
+        title=TITLE,
+        folder=PARENT_FOLDER_NAME,
+        username=USERNAME,
+        password=PASSWORD,
+        text=TEXT,
+        file_path=file_path,
+        description=DESCRIPTION,
+        owner_id=int(OWNER_ID) if OWNER_ID else None,
+        owner_type=OWNER_TYPE,
+        owners=owners_list,
+        password_rule_id=int(PASSWORD_RULE_ID) if PASSWORD_RULE_ID else None,
+        notes=NOTES,
+        urls=urls_list,
+    )
+
+
+def get_secrets_safe_obj(
+    authentication_obj: authentication.Authentication,
+) -> secrets_safe.SecretsSafe:
     """
-    Parse JSON parameters for owners and URLs with error handling.
+    Build the Secrets Safe client, streaming the file of FILE_PATH, if any.
+
+    Args:
+        authentication_obj (authentication.Authentication): Authenticated
+            Secrets Safe client instance.
 
     Returns:
-        tuple: A tuple containing (owners_list, urls_list)
+        secrets_safe.SecretsSafe: The client.
     """
-    try:
-        owners_list = json.loads(OWNERS) if OWNERS else None
-    except json.JSONDecodeError as e:
-        common.show_error(f"Invalid JSON format for owners parameter: {e}", logger)
+    if FILE_PATH:
+        return streaming.StreamingSecretsSafe(
+            authentication=authentication_obj,
+            logger=logger,
+        )
+
+    return secrets_safe.SecretsSafe(
+        authentication=authentication_obj,
+        logger=logger,
+    )
+
+
+def resolve_file_path() -> str:
+    """
+    Resolve FILE_PATH in the workspace, failing the run if it escapes the
+    workspace or does not exist.
 
+    Returns:
+        str: The resolved path.
+    """
     try:
-        urls_list = json.loads(URLS) if URLS else None
-    except json.JSONDecodeError as e:
-        common.show_error(f"Invalid JSON format for urls parameter: {e}", logger)
+        return streaming.resolve_workspace_path(FILE_PATH, WORKSPACE)
+    except (ValueError, FileNotFoundError) as e:
+        common.show_error(f"Invalid or missing file path: {e}", logger)
+
+
+def prepare_file() -> str:
+    """
+    Resolve the file to upload, if any, creating it from file_content.
+
+    Returns:
+        str: The file path.
+    """
+    if FILE_PATH:
+        # streaming an existing workspace file or named pipe, nothing is staged
+        return resolve_file_path()
+
+    # creating file if file content is provided
+    if FILE_CONTENT and FILE_NAME:
+        common.create_file(FILE_NAME, FILE_CONTENT, logger)
+
+    return FILE_NAME
+
+
+def prepare_secret() -> client.SecretSpec:
+    """
+    Validate the inputs of the secret to create, stage its file and build
+    it. Needs no session, see start_run.
+
+    Returns:
+        client.SecretSpec: The requested secret.
+    """
+    validate_inputs()
+    return build_secret_spec(prepare_file())
+
+
+def get_output_value(
+    secrets_safe_obj: secrets_safe.SecretsSafe,
+    spec: client.SecretSpec,
+    action: str,
+    record: Optional[dict],
+    secret_attributes: dict,
+) -> str:
+    """
+    Get the value to publish as OUTPUT_ID. Written values are already known,
+    only a skipped secret is read back.
 
-    return owners_list, urls_list
+    Args:
+        secrets_safe_obj (secrets_safe.SecretsSafe): Secrets Safe client.
+        spec (client.SecretSpec): The requested secret.
+        action (str): The action returned by plan_secret.
+        record (dict, optional): The existing secret record.
+        secret_attributes (dict): Secret attributes that were written.
+
+    Returns:
+        str: The password of a credential secret or the text of a text secret.
+    """
+    secret_type = spec.secret_type
+    if action != upsert.SKIP:
+        if secret_type == upsert.TEXT_TYPE:
+            return secret_attributes["text"]
+        return secret_attributes["password"]
+
+    if secret_type == upsert.TEXT_TYPE:
+        secret = secrets_safe_obj.get_text_secret_by_id(record["Id"])
+        return secret.get("Text") or secret.get("Password") or ""
+    return secrets_safe_obj.get_secret_by_id(record["Id"]).get("Password") or ""
+
+
+def validate_inputs() -> None:
+    """
+    Validate the inputs controlling how the secret is written and published.
+    """
+    if IF_EXISTS not in upsert.IF_EXISTS_MODES:
+        common.show_error(
+            f"Invalid if_exists value {IF_EXISTS!r}, "
+            f"expected one of {', '.join(upsert.IF_EXISTS_MODES)}",
+            logger,
+        )
+
+    if OUTPUT_ID and get_secret_type() == upsert.FILE_TYPE:
+        common.show_error(
+            "output_id is only supported for credential and text secrets", logger
+        )
+
+
+def apply_secret(
+    authentication_obj: authentication.Authentication,
+    secrets_safe_obj: secrets_safe.SecretsSafe,
+    spec: client.SecretSpec,
+    folder_id: str,
+) -> None:
+    """
+    Plan and write the secret, generating its password if needed, and publish
+    its value as OUTPUT_ID.
+
+    Args:
+        authentication_obj (authentication.Authentication): Authenticated
+            Secrets Safe client instance.
+        secrets_safe_obj (secrets_safe.SecretsSafe): Secrets Safe client.
+        spec (client.SecretSpec): The requested secret.
+        folder_id (str): The parent folder GUID.
+    """
+    started = time.perf_counter()
+    action, record = client.plan_secret(secrets_safe_obj, spec, IF_EXISTS, folder_id)
+    secret_attributes = spec.attributes(folder_id)
+    if action != upsert.SKIP and spec.generates_password:
+        generator = rotation.PasswordGenerator(
+            password_rules.PasswordRule(authentication_obj, logger)
+        )
+        try:
+            secret_attributes["password"] = generator.generate(spec.password_rule_id)
+        except ValueError as e:
+            count_error(e)
+            common.show_error(f"Error generating password: {e}", logger)
+    client.write_secret(secrets_safe_obj, action, record, secret_attributes, logger)
+    structured_logging.log_event(
+        logger,
+        logging.INFO,
+        "create_secret",
+        path=f"{PARENT_FOLDER_NAME}/{TITLE}",
+        started=started,
+        status=action,
+    )
+
+    if OUTPUT_ID:
+        publish_output(
+            OUTPUT_ID,
+            get_output_value(secrets_safe_obj, spec, action, record, secret_attributes),
+        )
 
 
 def create_secret(
     authentication_obj: authentication.Authentication,
+    spec: Optional[client.SecretSpec] = None,
 ) -> None:
     """
     Create a secret in Secrets Safe.
 
     This function resolves the parent folder, optionally creates a file,
-    and creates a secret using the Secrets Safe API. It also handles
-    common errors related to secret creation.
+    and creates a secret using the Secrets Safe API. Depending on IF_EXISTS,
+    an existing secret with the same title is updated when its content
+    changed, or skipped. It also handles common errors related to secret
+    creation.
 
     Args:
         authentication_obj (authentication.Authentication): Authenticated
             Secrets Safe client instance.
+        spec (client.SecretSpec, optional): The secret, prepared while
+            signing in, see prepare_secret.
     """
+    if spec is None:
+        spec = prepare_secret()
+
     # instantiate folders obj
     folders_obj = folders.Folder(authentication=authentication_obj, logger=logger)
 
@@ -150,134 +483,423 @@ def create_secret(
 
     logger.info("Parent folder found")
 
-    secrets_safe_obj = secrets_safe.SecretsSafe(
-        authentication=authentication_obj,
-        logger=logger,
-    )
-
-    # creating file if file content is provided
-    if FILE_CONTENT and FILE_NAME:
-        common.create_file(FILE_NAME, FILE_CONTENT, logger)
-
-    owners_list, urls_list = parse_json_parameters()
+    secrets_safe_obj = get_secrets_safe_obj(authentication_obj)
 
     try:
-        # creating secret
-        secrets_safe_obj.create_secret(
-            title=TITLE,
-            folder_id=folder["Id"],
-            description=DESCRIPTION,
-            username=USERNAME,
-            password=PASSWORD,
-            text=TEXT,
-            file_path=FILE_NAME,
-            owner_id=int(OWNER_ID) if OWNER_ID else None,
-            owner_type=OWNER_TYPE,
-            owners=owners_list,
-            password_rule_id=int(PASSWORD_RULE_ID) if PASSWORD_RULE_ID else None,
-            notes=NOTES,
-            urls=urls_list,
-        )
+        apply_secret(authentication_obj, secrets_safe_obj, spec, folder["Id"])
 
-        logger.info("Secret created successfully")
     except exceptions.CreationError as e:
+        count_error(e)
         common.show_error(f"Error creating secret: {e}", logger)
 
-    except (exceptions.OptionsError, exceptions.IncompleteArgumentsError) as e:
+    except exceptions.UpdateError as e:
+        count_error(e)
+        common.show_error(f"Error updating secret: {e}", logger)
+
+    except exceptions.LookupError as e:
+        count_error(e)
+        common.show_error(f"Error checking the existing secret: {e}", logger)
+
+    except (
+        exceptions.OptionsError,
+        exceptions.IncompleteArgumentsError,
+        ValueError,
+    ) as e:
+        count_error(e)
         common.show_error(f"Invalid or missing parameters: {e}", logger)
 
     except FileNotFoundError as e:
+        count_error(e)
         common.show_error(f"Invalid or missing file path: {e}", logger)
 
 
-def set_authentication(
-    session: requests.Session,
-) -> authentication.Authentication:
+def count_error(error: Exception) -> None:
+    """
+    Count an error by type in the run metrics.
+
+    Args:
+        error (Exception): The error.
     """
-    Configure and authenticate against the Secrets Safe API.
+    METRICS.inc(
+        "errors_total", help_text="Errors by exception type.", type=type(error).__name__
+    )
+
 
-    This function applies retry logic, prepares certificates, selects
-    the authentication method (API Key or OAuth client credentials),
-    and validates API access.
+def log_rotation(entry: rotation.RotationEntry, started: float, status: str) -> None:
+    """
+    Log the outcome of a rotation as a DEBUG event with the hashed path.
 
     Args:
-        session (requests.Session): Requests session used for HTTP calls.
+        entry (rotation.RotationEntry): The rotated entry.
+        started (float): time.perf_counter() value when the rotation started.
+        status (str): Outcome of the rotation.
+    """
+    structured_logging.log_event(
+        logger,
+        logging.DEBUG,
+        "rotate_secret",
+        path=f"{PARENT_FOLDER_NAME}/{entry.title}",
+        started=started,
+        output_id=entry.output_id,
+        status=status,
+    )
+
+
+def prepare_rotation() -> List[rotation.RotationEntry]:
+    """
+    Parse the credential secrets to rotate. Needs no session, see start_run.
 
     Returns:
-        authentication.Authentication: Authenticated Secrets Safe client.
+        List[rotation.RotationEntry]: The entries of ROTATE_SECRETS.
+    """
+    try:
+        return rotation.parse_rotation_entries(ROTATE_SECRETS)
+    except ValueError as e:
+        common.show_error(f"Invalid rotate_secrets parameter: {e}", logger)
+
+
+def rotate_secrets(
+    authentication_obj: authentication.Authentication,
+    entries: Optional[List[rotation.RotationEntry]] = None,
+) -> None:
+    """
+    Rotate the credential secrets listed in ROTATE_SECRETS.
+
+    The parent folder is listed once and each password rule is fetched once,
+    then every credential gets a new generated password under the same
+    session, signed in again after a failed entry since the library signs it
+    out. The owners input, when set, replaces the owners of the secrets. New
+    passwords are published as masked outputs when the entry has an
+    output_id. Failures are reported after every entry was attempted.
+
+    Args:
+        authentication_obj (authentication.Authentication): Authenticated
+            Secrets Safe client instance.
+        entries (List[rotation.RotationEntry], optional): The entries,
+            parsed while signing in, see prepare_rotation.
+    """
+    if entries is None:
+        entries = prepare_rotation()
+
+    folders_obj = folders.Folder(authentication=authentication_obj, logger=logger)
+    folder = get_folder(folders_obj, PARENT_FOLDER_NAME)
+    if not folder:
+        common.show_error("Parent Folder name was not found", logger)
+
+    secrets_safe_obj = secrets_safe.SecretsSafe(
+        authentication=authentication_obj,
+        logger=logger,
+    )
+    generator = rotation.PasswordGenerator(
+        password_rules.PasswordRule(authentication_obj, logger)
+    )
+    default_rule_id = int(PASSWORD_RULE_ID) if PASSWORD_RULE_ID else None
+    owners_list, _ = parse_json_parameters()
+    index = upsert.build_title_index(secrets_safe_obj, folder["Id"])
+    session_guard = client.SessionGuard(authentication_obj)
+
+    failed = []
+    for entry in entries:
+        record = index.get(entry.title)
+        started = time.perf_counter()
+        try:
+            if record is None:
+                raise exceptions.LookupError("secret was not found")
+            password = session_guard.call(
+                rotation.rotate_secret,
+                secrets_safe_obj,
+                generator,
+                folder["Id"],
+                record,
+                entry.password_rule_id or default_rule_id,
+                owners=owners_list,
+            )
+        except Exception as e:
+            logger.error(f"Error rotating secret {entry.title!r}: {e}")
+            count_error(e)
+            failed.append(entry.title)
+            log_rotation(entry, started, "failed")
+            continue
+
+        logger.info(f"Secret {entry.title!r} rotated successfully")
+        log_rotation(entry, started, "rotated")
+        if entry.output_id:
+            publish_output(entry.output_id, password)
+
+    if failed:
+        common.show_error(
+            f"Error rotating {len(failed)} of {len(entries)} secrets: "
+            f"{', '.join(failed)}",
+            logger,
+        )
+
+
+def plan_creation(run_plan: plan.Plan) -> None:
+    """
+    Validate the secret inputs and add the calls writing the secret to a
+    plan.
+
+    Args:
+        run_plan (plan.Plan): The plan.
+    """
+    validate_inputs()
+    # file_content is not staged in a dry run, but file_path is checked
+    spec = build_secret_spec(resolve_file_path() if FILE_PATH else FILE_NAME)
+
+    upserting = IF_EXISTS != upsert.IF_EXISTS_FAIL
+    if upserting:
+        run_plan.add(
+            plan.LOOKUPS,
+            "GET",
+            "Secrets-Safe/Folders/{folderId}/secrets",
+            note="an existing secret is also read when it may be updated",
+        )
+    if spec.generates_password:
+        run_plan.add(plan.LOOKUPS, "GET", "PasswordRules/{id}")
+
+    endpoint = {upsert.TEXT_TYPE: "/text", upsert.FILE_TYPE: "/file"}.get(
+        spec.secret_type, ""
+    )
+    run_plan.add(
+        plan.WRITES,
+        "POST",
+        f"Secrets-Safe/Folders/{{folderId}}/secrets{endpoint}",
+        note=(
+            "PUT Secrets-Safe/Secrets/{id} when the secret exists, none when "
+            "it is unchanged"
+            if upserting
+            else ""
+        ),
+    )
+
+
+def plan_rotation(run_plan: plan.Plan) -> None:
     """
+    Validate ROTATE_SECRETS and add the calls rotating the secrets to a plan.
 
-    certificate, certificate_key = utils.prepare_certificate_info(
-        CERTIFICATE, CERTIFICATE_KEY
+    Args:
+        run_plan (plan.Plan): The plan.
+    """
+    try:
+        entries = rotation.parse_rotation_entries(ROTATE_SECRETS)
+    except ValueError as e:
+        common.show_error(f"Invalid rotate_secrets parameter: {e}", logger)
+
+    default_rule_id = int(PASSWORD_RULE_ID) if PASSWORD_RULE_ID else None
+    rule_ids = {entry.password_rule_id or default_rule_id for entry in entries}
+    rule_ids.discard(None)
+    run_plan.add(plan.LOOKUPS, "GET", "Secrets-Safe/Folders/{folderId}/secrets")
+    run_plan.add(plan.LOOKUPS, "GET", "PasswordRules/{id}", len(rule_ids))
+    run_plan.add(
+        plan.WRITES,
+        "PUT",
+        "Secrets-Safe/Secrets/{id}",
+        len(entries),
+        note="secrets listed without their username are read first",
     )
 
-    auth_config = {
-        "req": session,
-        "timeout_connection": TIMEOUT_CONNECTION_SECONDS,
-        "timeout_request": TIMEOUT_REQUEST_SECONDS,
-        "api_url": API_URL,
-        "certificate": certificate,
-        "certificate_key": certificate_key,
-        "verify_ca": VERIFY_CA,
-        "logger": logger,
-    }
-
-    # The recommended version is 3.1. If no version is specified,
-    # the default API version 3.0 will be used
-    if API_VERSION:
-        auth_config.update({"api_version": API_VERSION})
-
-    # If API_KEY is set, we're using API Key authentication
-    # otherwise we're using OAuth/Client Credentials.
-    if API_KEY:
-        auth_config.update({"api_key": API_KEY})
+
+def build_plan() -> plan.Plan:
+    """
+    Validate every input and build the plan of the API calls the run would
+    make, without signing in.
+
+    Returns:
+        plan.Plan: The plan.
+    """
+    run_plan = plan.Plan("create_secret")
+    plan.sign_in_calls(run_plan, bool(API_KEY), transport.parse_api_urls(API_URL))
+    run_plan.add(plan.FOLDERS, "GET", "Secrets-Safe/Folders")
+    if ROTATE_SECRETS:
+        plan_rotation(run_plan)
     else:
-        auth_config.update({"client_id": CLIENT_ID, "client_secret": CLIENT_SECRET})
+        plan_creation(run_plan)
+    run_plan.add(plan.SIGN_OUT, "POST", "Auth/Signout")
+    return run_plan
 
-    authentication_obj = authentication.Authentication(**auth_config)
-    get_api_access_response = authentication_obj.get_api_access()
 
-    utils.print_log(
-        logger,
-        f"{secrets_safe_library.__library_name__} "
-        f"version: {secrets_safe_library.__version__}",
-        logging.DEBUG,
+def report_plan() -> None:
+    """
+    Log the plan of the run and publish it as the plan output. Latencies are
+    estimated from the metrics of the previous run, when available.
+    """
+    run_plan = build_plan()
+    estimates = plan.LatencyEstimates()
+    if METRICS_DIR:
+        estimates = plan.load_estimates(
+            os.path.join(
+                METRICS_DIR, metrics.textfile_name("create_secret", RUNNER_NAME)
+            )
+        )
+    run_plan.log(logger, estimates, RATE_LIMIT_RPS)
+    append_output(PLAN_OUTPUT, run_plan.to_json(estimates, RATE_LIMIT_RPS))
+
+
+def build_client_config() -> client.ClientConfig:
+    """
+    Build the client settings from the action environment variables.
+
+    Returns:
+        client.ClientConfig: The client settings.
+    """
+    return client.ClientConfig(
+        api_url=API_URL,
+        api_key=API_KEY,
+        client_id=CLIENT_ID,
+        client_secret=CLIENT_SECRET,
+        api_version=API_VERSION,
+        verify_ca=VERIFY_CA,
+        certificate=CERTIFICATE,
+        certificate_key=CERTIFICATE_KEY,
+        timeout_connection_seconds=TIMEOUT_CONNECTION_SECONDS,
+        timeout_request_seconds=TIMEOUT_REQUEST_SECONDS,
+        probe_timeout_seconds=API_PROBE_TIMEOUT_SECONDS,
+        rate_limit_rps=RATE_LIMIT_RPS,
+        rate_limit_burst=RATE_LIMIT_BURST,
+        startup_jitter_seconds=STARTUP_JITTER_SECONDS,
     )
-    if get_api_access_response.status_code != 200:
-        error_message = (
-            f"Please check credentials, error {get_api_access_response.text}"
+
+
+def open_client(
+    secrets_client: Optional[client.SecretsSafeClient] = None,
+) -> client.SecretsSafeClient:
+    """
+    Create the Secrets Safe client of the action and sign in, or wait for the
+    sign-in of a client returned by start_run.
+
+    Args:
+        secrets_client (client.SecretsSafeClient, optional): Client signing
+            in.
+
+    Returns:
+        client.SecretsSafeClient: The signed in client.
+    """
+    if secrets_client is None:
+        secrets_client = client.SecretsSafeClient(
+            build_client_config(), logger, METRICS, TRACE
         )
-        common.show_error(error_message, logger)
+    try:
+        secrets_client.wait_signed_in()
+    except exceptions.AuthenticationFailure as e:
+        common.show_error(str(e), logger)
+    return secrets_client
 
-    return authentication_obj
 
+def start_run() -> tuple:
+    """
+    Start signing in to Secrets Safe and prepare the run meanwhile, so that
+    the TLS handshake and the sign-in overlap with parsing the inputs and
+    staging the file to upload. The parent folder is resolved once signed
+    in. Invalid inputs are reported right away, the session is then closed
+    once the sign-in is over.
 
-def main() -> None:
+    Returns:
+        tuple: The client signing in, and the rotation entries or the secret
+        to create.
     """
-    Main entrypoint for the GitHub Action.
+    secrets_client = client.SecretsSafeClient(
+        build_client_config(), logger, METRICS, TRACE
+    )
+    secrets_client.start_sign_in()
+    try:
+        prepared = prepare_rotation() if ROTATE_SECRETS else prepare_secret()
+    except BaseException:
+        secrets_client.close()
+        raise
+    return secrets_client, prepared
 
-    Orchestrates the workflow to authenticate, create a secret,
-    and properly close the API session.
+
+def write_metrics(started: float, succeeded: bool) -> None:
+    """
+    Write the metrics of the run to METRICS_DIR, if set. Failing to write
+    them does not fail the step.
+
+    Args:
+        started (float): time.perf_counter() value when the run started.
+        succeeded (bool): Whether the run succeeded.
     """
+    # a dry run would replace the latencies its estimates are based on
+    if not METRICS_DIR or DRY_RUN:
+        return
+
+    METRICS.set(
+        "run_duration_seconds",
+        time.perf_counter() - started,
+        help_text="Duration of the run.",
+    )
+    METRICS.set("run_success", int(succeeded), help_text="1 if the run succeeded.")
+    METRICS.set("run_timestamp_seconds", time.time(), help_text="End time of the run.")
     try:
-        with requests.Session() as session:
-            retry_strategy = Retry(
-                total=3,
-                backoff_factor=0.2,
-                status_forcelist=[400, 408, 500, 502, 503, 504],
-                allowed_methods=["GET", "POST"],
+        METRICS.write(
+            os.path.join(
+                METRICS_DIR, metrics.textfile_name("create_secret", RUNNER_NAME)
             )
-            adapter = HTTPAdapter(max_retries=retry_strategy)
-            session.mount("https://", adapter)
-            session.mount("http://", adapter)
+        )
+    except OSError as e:
+        logger.warning(f"Metrics could not be written: {e}")
+
+
+def write_trace() -> None:
+    """
+    Append the trace of the HTTP calls of the run to TRACE_FILE, if set.
+    Failing to write it does not fail the step.
+    """
+    if TRACE is None:
+        return
+
+    try:
+        TRACE.write(TRACE_FILE)
+    except OSError as e:
+        logger.warning(f"Trace could not be written: {e}")
+
+
+def check_settings() -> None:
+    """
+    Report the invalid settings, which fell back to their defaults.
+    """
+    if INVALID_SETTINGS:
+        common.show_error(f"Invalid settings: {', '.join(INVALID_SETTINGS)}", logger)
 
-            authentication_obj = set_authentication(session)
-            create_secret(authentication_obj)
-            authentication_obj.sign_app_out()
+
+def run() -> None:
+    """
+    Orchestrates the workflow to authenticate, create a secret,
+    and properly close the API session. A dry run only reports its plan.
+    """
+    try:
+        check_settings()
+
+        if DRY_RUN:
+            report_plan()
+            return
+
+        secrets_client, prepared = start_run()
+        with open_client(secrets_client) as secrets_client:
+            if ROTATE_SECRETS:
+                rotate_secrets(secrets_client.authentication_obj, prepared)
+            else:
+                create_secret(secrets_client.authentication_obj, prepared)
 
     except Exception as e:
+        count_error(e)
         common.show_error(f"An unexpected error occurred: {e}", logger)
 
 
+def main() -> None:
+    """
+    Main entrypoint for the GitHub Action.
+
+    Runs the action and writes the metrics and the trace of the run.
+    """
+    started = time.perf_counter()
+    succeeded = False
+    try:
+        run()
+        succeeded = True
+    finally:
+        write_metrics(started, succeeded)
+        write_trace()
+
+
 if __name__ == "__main__":
     main()
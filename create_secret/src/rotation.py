@@ -0,0 +1,310 @@
+"""
+Password generation and batch rotation of credential secrets.
+
+Passwords are generated locally from the Secrets Safe password rule, so the
+value written is already known and can be published as a masked output
+without reading the secret back. Each password rule is fetched once per run,
+and a batch of credentials is rotated under one session against a single
+folder listing.
+"""
+
+import re
+import secrets
+import string
+from typing import Dict, List, NamedTuple, Optional
+
+from secrets_safe_library import exceptions, password_rules, secrets_safe
+from src import schema, upsert
+
+DEFAULT_PASSWORD_LENGTH = 32
+
+# Character requirements of a password rule
+NOT_PERMITTED = "N"
+REQUIRED = "R"
+
+# First character requirements of a password rule
+FIRST_ALPHA = "A"
+FIRST_ALPHANUMERIC = "N"
+
+OUTPUT_ID_PATTERN = re.compile(r"[a-zA-Z_][a-zA-Z0-9_-]*")
+
+# Owner fields of a secret record, and the library names they are written with
+OWNER_FIELDS = {
+    "OwnerId": "owner_id",
+    "Owner": "owner",
+    "UserId": "user_id",
+    "GroupId": "group_id",
+    "Name": "name",
+    "Email": "email",
+}
+# record fields of a URL, mapped to the fields the library writes
+URL_FIELDS = {"Id": "id", "CredentialId": "credential_id", "Url": "url"}
+# the password rule of a record, as spelled in request and response bodies
+PASSWORD_RULE_FIELDS = ("PasswordRuleID", "PasswordRuleId")
+
+
+class RotationEntry(NamedTuple):
+    title: str
+    output_id: Optional[str] = None
+    password_rule_id: Optional[int] = None
+
+
+def _characters(value, default: str) -> str:
+    if value is None:
+        return default
+    return "".join(value)
+
+
+def generate_password(rule: dict) -> str:
+    """
+    Generate a random password satisfying a password rule.
+
+    Args:
+        rule (dict): Password rule as returned by the API. Missing fields
+            fall back to permitting every character class.
+
+    Returns:
+        str: The generated password.
+
+    Raises:
+        ValueError: If the rule cannot be satisfied.
+    """
+    minimum = rule.get("MinimumLength") or 1
+    maximum = rule.get("MaximumLength") or max(minimum, DEFAULT_PASSWORD_LENGTH)
+    length = min(maximum, max(minimum, DEFAULT_PASSWORD_LENGTH))
+
+    classes = {
+        "LowercaseRequirement": _characters(
+            rule.get("ValidLowercaseCharacters"), string.ascii_lowercase
+        ),
+        "UppercaseRequirement": _characters(
+            rule.get("ValidUppercaseCharacters"), string.ascii_uppercase
+        ),
+        "NumericRequirement": string.digits,
+        "SymbolRequirement": _characters(rule.get("ValidSymbols"), ""),
+    }
+    permitted = {
+        name: characters
+        for name, characters in classes.items()
+        if characters and str(rule.get(name) or "").upper()[:1] != NOT_PERMITTED
+    }
+    required = [
+        characters
+        for name, characters in permitted.items()
+        if str(rule.get(name) or "").upper()[:1] == REQUIRED
+    ]
+
+    first_requirement = str(rule.get("FirstCharacterRequirement") or "").upper()[:1]
+    first_classes = ["LowercaseRequirement", "UppercaseRequirement"]
+    if first_requirement == FIRST_ALPHANUMERIC:
+        first_classes.append("NumericRequirement")
+    first = "".join(permitted.get(name, "") for name in first_classes)
+    if first_requirement not in (FIRST_ALPHA, FIRST_ALPHANUMERIC):
+        first = "".join(permitted.values())
+
+    pool = "".join(permitted.values())
+    if not pool or not first or len(required) >= length:
+        raise ValueError("Password rule cannot be satisfied")
+
+    rest = [secrets.choice(characters) for characters in required]
+    rest += [secrets.choice(pool) for _ in range(length - 1 - len(rest))]
+    secrets.SystemRandom().shuffle(rest)
+    return secrets.choice(first) + "".join(rest)
+
+
+class PasswordGenerator:
+    """
+    Generates passwords, fetching each password rule once.
+    """
+
+    def __init__(self, password_rule_obj: password_rules.PasswordRule):
+        """
+        Args:
+            password_rule_obj (password_rules.PasswordRule): Password rules
+                client.
+        """
+        self._password_rule_obj = password_rule_obj
+        self._rules: Dict[int, dict] = {}
+
+    def generate(self, password_rule_id: Optional[int]) -> str:
+        """
+        Generate a password for a password rule.
+
+        Args:
+            password_rule_id (int, optional): The password rule ID, None for
+                the default rule of DEFAULT_PASSWORD_LENGTH characters.
+
+        Returns:
+            str: The generated password.
+        """
+        if password_rule_id is None:
+            return generate_password({})
+
+        if password_rule_id not in self._rules:
+            self._rules[password_rule_id] = self._password_rule_obj.get_by_id(
+                password_rule_id
+            )
+        return generate_password(self._rules[password_rule_id])
+
+
+ROTATION_ENTRIES = schema.Schema(
+    RotationEntry,
+    [
+        schema.Field("title", (str,), required=True, hint="must be a string"),
+        schema.Field(
+            "output_id",
+            (str,),
+            nullable=True,
+            pattern=OUTPUT_ID_PATTERN,
+            hint="must be a string starting with a letter or underscore and "
+            "contain only alphanumeric characters, underscores, or hyphens",
+        ),
+        schema.Field(
+            "password_rule_id", (int,), nullable=True, hint="must be an integer"
+        ),
+    ],
+    "rotation entry",
+)
+
+
+def parse_rotation_entries(value: str) -> List[RotationEntry]:
+    """
+    Parse the JSON list of credential secrets to rotate.
+
+    Args:
+        value (str): JSON list of objects with "title" and optional
+            "output_id" and "password_rule_id".
+
+    Returns:
+        List[RotationEntry]: The entries to rotate.
+
+    Raises:
+        schema.SchemaError: If the value is not a valid list of entries, with
+            the location of every invalid field.
+    """
+    return ROTATION_ENTRIES.loads(value, "rotate_secrets")
+
+
+def existing_owners(record: dict) -> List[dict]:
+    """
+    Get the owners of a secret record in the form the library writes them.
+
+    Args:
+        record (dict): The secret record.
+
+    Returns:
+        List[dict]: The owners, with the fields of the record API version.
+    """
+    return [
+        {
+            OWNER_FIELDS[name]: value
+            for name, value in owner.items()
+            if name in OWNER_FIELDS and value is not None
+        }
+        for owner in record.get("Owners") or []
+    ]
+
+
+def existing_urls(record: dict) -> List[dict]:
+    """
+    Get the URLs of a secret record in the form the library writes them.
+
+    Args:
+        record (dict): The secret record.
+
+    Returns:
+        List[dict]: The URLs, with the fields of the library.
+    """
+    return [
+        {
+            URL_FIELDS[name]: value
+            for name, value in url.items()
+            if name in URL_FIELDS and value is not None
+        }
+        for url in record.get("Urls") or []
+    ]
+
+
+def existing_password_rule_id(record: dict) -> Optional[int]:
+    """
+    Get the password rule of a secret record.
+
+    Args:
+        record (dict): The secret record.
+
+    Returns:
+        int, optional: The password rule ID, None when the secret has none.
+    """
+    for name in PASSWORD_RULE_FIELDS:
+        if record.get(name) is not None:
+            return record[name]
+    return None
+
+
+def rotate_secret(
+    secrets_safe_obj: secrets_safe.SecretsSafe,
+    generator: PasswordGenerator,
+    folder_id: str,
+    record: dict,
+    password_rule_id: Optional[int],
+    owners: Optional[list] = None,
+) -> str:
+    """
+    Set a new generated password on an existing credential secret.
+
+    The update replaces the whole secret, so its description, notes, URLs
+    and password rule are written back, and its owners unless others are
+    given. The secret is read first when the record from the folder listing
+    lacks any of them.
+
+    Args:
+        secrets_safe_obj (secrets_safe.SecretsSafe): Secrets Safe client.
+        generator (PasswordGenerator): Password generator.
+        folder_id (str): The folder GUID.
+        record (dict): The secret record from the folder title index.
+        password_rule_id (int, optional): The password rule ID, the one of
+            the secret when not given.
+        owners (list, optional): The owners to set, those of the secret when
+            not given.
+
+    Returns:
+        str: The new password.
+
+    Raises:
+        exceptions.UpdateError: If the secret is not a credential secret.
+    """
+    secret_type = record.get("SecretType") or upsert.CREDENTIAL_TYPE
+    if secret_type != upsert.CREDENTIAL_TYPE:
+        raise exceptions.UpdateError(
+            f"Only credential secrets can be rotated, found a {secret_type} secret"
+        )
+
+    incomplete = not record.get("Username") or "Urls" not in record
+    incomplete = incomplete or (owners is None and "Owners" not in record)
+    incomplete = incomplete or (
+        password_rule_id is None
+        and not any(name in record for name in PASSWORD_RULE_FIELDS)
+    )
+    if incomplete:
+        record = {**record, **secrets_safe_obj.get_secret_by_id(record["Id"])}
+    if owners is None:
+        owners = existing_owners(record)
+    if password_rule_id is None:
+        password_rule_id = existing_password_rule_id(record)
+
+    password = generator.generate(password_rule_id)
+    secrets_safe_obj.update_secret(
+        record["Id"],
+        folder_id=folder_id,
+        title=record["Title"],
+        description=record.get("Description"),
+        username=record.get("Username"),
+        password=password,
+        owner_id=record.get("OwnerId"),
+        owner_type=record.get("OwnerType"),
+        owners=owners,
+        password_rule_id=password_rule_id,
+        notes=record.get("Notes"),
+        urls=existing_urls(record),
+    )
+    return password
@@ -0,0 +1,323 @@
+"""
+Streaming upload support for FILE secrets.
+
+The library uploads file secrets through ``requests`` ``files=``, which builds
+the whole multipart body in memory. This module sends the same multipart body
+straight from an existing file or named pipe in fixed-size chunks, so large
+artifacts are uploaded with flat memory use and without staging a copy.
+
+StreamingSecretsSafe overrides the private file request methods of the
+library and relies on its private ``_create_url``, ``_get_headers`` and
+``_authentication`` attributes. The library version is pinned in
+requirements.txt, and test_library_compatibility fails when these change.
+"""
+
+import json
+import logging
+import os
+import pathlib
+import stat
+import uuid
+from typing import BinaryIO, Iterator, List, Optional
+
+import requests
+from secrets_safe_library import exceptions, secrets_safe, utils
+from urllib3.fields import format_multipart_header_param
+
+CHUNK_SIZE_BYTES = 64 * 1024
+
+
+def resolve_workspace_path(file_path: str, workspace: str) -> str:
+    """
+    Resolve a path relative to the workspace and reject paths escaping it.
+
+    Args:
+        file_path (str): Path to resolve, relative to the workspace.
+        workspace (str): Workspace directory.
+
+    Returns:
+        str: The resolved absolute path.
+
+    Raises:
+        ValueError: If the path escapes the workspace.
+        FileNotFoundError: If the path does not exist.
+    """
+    base = pathlib.Path(workspace).resolve()
+    resolved = (base / file_path).resolve()
+    try:
+        resolved.relative_to(base)
+    except ValueError:
+        raise ValueError(f"Path {file_path!r} escapes the workspace directory")
+
+    if not resolved.exists():
+        raise FileNotFoundError(f"File {file_path!r} was not found in the workspace")
+
+    return str(resolved)
+
+
+def download_file_secret(
+    secrets_safe_obj: secrets_safe.SecretsSafe, secret_id: str
+) -> bytes:
+    """
+    Download the raw content of a file secret. The library's
+    get_file_secret_data decodes it as text, which alters binary files.
+
+    Args:
+        secrets_safe_obj (secrets_safe.SecretsSafe): Secrets Safe client.
+        secret_id (str): The secret GUID.
+
+    Returns:
+        bytes: The file content.
+    """
+    return secrets_safe_obj._get_file_by_id_req(secret_id).content
+
+
+class MultipartBody:
+    """
+    File-like multipart/form-data body read lazily from an open file.
+
+    When the source is a regular file the total length is known in advance,
+    exposed as ``len`` so ``requests`` sends a Content-Length header, and the
+    body can be rewound for retries. Pipes have no known length and are sent
+    with chunked transfer encoding.
+    """
+
+    def __init__(
+        self,
+        source: BinaryIO,
+        file_name: str,
+        payload: dict,
+        content_type: str = "application/octet-stream",
+    ):
+        """
+        Args:
+            source (BinaryIO): Open binary file or pipe to upload.
+            file_name (str): File name sent with the file part.
+            payload (dict): Secret metadata sent as the "secretmetadata" part.
+            content_type (str): MIME type of the file part.
+        """
+        self.boundary = uuid.uuid4().hex
+        self._source = source
+        self._head = (
+            f"--{self.boundary}\r\n"
+            'Content-Disposition: form-data; name="secretmetadata"\r\n'
+            "Content-Type: application/json\r\n\r\n"
+            f"{json.dumps(payload)}\r\n"
+            f"--{self.boundary}\r\n"
+            "Content-Disposition: form-data; "
+            f'name="files"; {format_multipart_header_param("filename", file_name)}'
+            "\r\n"
+            f"Content-Type: {content_type}\r\n\r\n"
+        ).encode("utf-8")
+        self._tail = f"\r\n--{self.boundary}--\r\n".encode("utf-8")
+
+        mode = os.fstat(source.fileno()).st_mode
+        if stat.S_ISREG(mode):
+            self._source_start = source.tell()
+            self.len = (
+                len(self._head)
+                + os.fstat(source.fileno()).st_size
+                - self._source_start
+                + len(self._tail)
+            )
+        else:
+            self._source_start = None
+
+        self._parts = self._iter_parts()
+        self._pending = b""
+
+    @property
+    def content_type(self) -> str:
+        return f"multipart/form-data; boundary={self.boundary}"
+
+    def _iter_parts(self) -> Iterator[bytes]:
+        yield self._head
+        while True:
+            chunk = self._source.read(CHUNK_SIZE_BYTES)
+            if not chunk:
+                break
+            yield chunk
+        yield self._tail
+
+    def __iter__(self) -> Iterator[bytes]:
+        while True:
+            chunk = self.read(CHUNK_SIZE_BYTES)
+            if not chunk:
+                return
+            yield chunk
+
+    def read(self, size: int = -1) -> bytes:
+        """
+        Read up to ``size`` bytes of the body, or the rest if ``size`` is -1.
+        """
+        chunks: List[bytes] = [self._pending]
+        buffered = len(self._pending)
+        while size < 0 or buffered < size:
+            part = next(self._parts, None)
+            if part is None:
+                break
+            chunks.append(part)
+            buffered += len(part)
+
+        data = b"".join(chunks)
+        if size < 0:
+            self._pending = b""
+            return data
+        self._pending = data[size:]
+        return data[:size]
+
+    def tell(self) -> int:
+        """
+        Report the start position so retries can rewind the body. Pipes
+        cannot be rewound.
+        """
+        if self._source_start is None:
+            raise OSError("Streamed pipe bodies cannot be rewound")
+        return 0
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        """
+        Rewind the body to its start. Only rewinding to the start is supported.
+        """
+        if self._source_start is None or offset != 0 or whence != os.SEEK_SET:
+            raise OSError("Streamed bodies can only be rewound to their start")
+        self._source.seek(self._source_start)
+        self._parts = self._iter_parts()
+        self._pending = b""
+        return 0
+
+
+class StreamingSecretsSafe(secrets_safe.SecretsSafe):
+    """
+    SecretsSafe client that uploads file secrets as a streamed multipart body
+    instead of building it in memory.
+    """
+
+    def _stream_file(
+        self,
+        method: str,
+        endpoint: str,
+        file_path: str,
+        payload: Optional[dict],
+        include_api_version: bool,
+        expected_status_code: int | List[int],
+        content_type: str,
+        error_class: type,
+    ) -> requests.Response:
+        """
+        Stream the file at ``file_path`` to the endpoint as the "files" part of
+        a multipart body, along with the secret metadata payload.
+
+        Args:
+            method (str): HTTP verb, "post" or "put".
+            endpoint (str): The endpoint to call.
+            file_path (str): The path of the file or named pipe to upload.
+            payload (dict, optional): Secret metadata.
+            include_api_version (bool): Whether to include API version in URL.
+            expected_status_code (int | List[int]): Expected status code to
+                consider the request was successful.
+            content_type (str): The MIME type of the file.
+            error_class (type): Exception raised on an unexpected status code.
+
+        Returns:
+            requests.Response: Response object.
+        """
+        url = self._create_url(endpoint, include_api_version)
+        file_name = os.path.basename(file_path)
+        payload = dict(payload or {}, FileName=file_name)
+
+        utils.print_log(self._logger, "Streaming file to URL", logging.DEBUG)
+
+        with open(file_path, "rb") as source:
+            body = MultipartBody(source, file_name, payload, content_type)
+            headers = dict(self._get_headers(), **{"Content-Type": body.content_type})
+            response = getattr(self._authentication._req, method)(
+                url=url,
+                data=body,
+                headers=headers,
+                timeout=(
+                    self._authentication._timeout_connection_seconds,
+                    self._authentication._timeout_request_seconds,
+                ),
+            )
+
+        expected = (
+            [expected_status_code]
+            if isinstance(expected_status_code, int)
+            else expected_status_code
+        )
+        if response.status_code not in expected:
+            if not self._authentication.sign_app_out():
+                utils.print_log(
+                    self._logger, "Error in streamed file request", logging.ERROR
+                )
+            raise error_class(
+                f"Error running {method} file request, message: {response.text}"
+                f", statuscode: {response.status_code}"
+            )
+
+        return response
+
+    def _run_post_file_request(
+        self,
+        endpoint: str,
+        file_path: str,
+        payload: Optional[dict] = None,
+        include_api_version: bool = True,
+        expected_status_code: int | List[int] = 201,
+        file_field_name: str = "file",
+        content_type: str = "application/octet-stream",
+    ) -> requests.Response:
+        """
+        Stream a new file secret. See _stream_file.
+
+        Args:
+            file_field_name (str): Unused, the metadata upload always uses the
+                "files" field name.
+
+        Raises:
+            exceptions.CreationError: If the response status code is not the
+                expected one.
+        """
+        return self._stream_file(
+            "post",
+            endpoint,
+            file_path,
+            payload,
+            include_api_version,
+            expected_status_code,
+            content_type,
+            exceptions.CreationError,
+        )
+
+    def _run_put_file_request(
+        self,
+        endpoint: str,
+        file_path: str,
+        payload: Optional[dict] = None,
+        include_api_version: bool = True,
+        expected_status_code: int | List[int] = 204,
+        file_field_name: str = "file",
+        content_type: str = "application/octet-stream",
+    ) -> requests.Response:
+        """
+        Stream the new content of an existing file secret. See _stream_file.
+
+        Args:
+            file_field_name (str): Unused, the metadata upload always uses the
+                "files" field name.
+
+        Raises:
+            exceptions.UpdateError: If the response status code is not the
+                expected one.
+        """
+        return self._stream_file(
+            "put",
+            endpoint,
+            file_path,
+            payload,
+            include_api_version,
+            expected_status_code,
+            content_type,
+            exceptions.UpdateError,
+        )
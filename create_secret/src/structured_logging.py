@@ -0,0 +1,185 @@
+"""
+Logging setup of the action, with an optional structured JSON format.
+
+With LOG_FORMAT=json every record is written as one JSON object per line,
+carrying the run id and, for events logged with log_event, the operation,
+path hash, latency and status fields. Only the fields listed in EVENT_FIELDS
+are ever written, and paths are written as hashes, so values such as
+passwords cannot reach the logs through an event.
+
+DEBUG records can be sampled with LOG_SAMPLE_RATE. Sampling happens in a
+logger filter, before the message is formatted, so dropped and disabled
+records cost no formatting.
+"""
+
+import hashlib
+import json
+import logging
+import random
+import time
+from typing import Callable, Dict, Optional
+
+TEXT_FORMAT = "text"
+JSON_FORMAT = "json"
+LOG_FORMATS = (TEXT_FORMAT, JSON_FORMAT)
+
+TEXT_LOG_FORMAT = "%(asctime)-5s %(name)-15s %(levelname)-8s %(message)s"
+
+EVENT_ATTRIBUTE = "event"
+EVENT_FIELDS = (
+    "operation",
+    "path_hash",
+    "output_id",
+    "latency_ms",
+    "status",
+    "count",
+)
+PATH_HASH_LENGTH = 16
+
+
+def path_hash(path: str) -> str:
+    """
+    Hash a secret path so lookups can be correlated without exposing it.
+
+    Args:
+        path (str): The secret path.
+
+    Returns:
+        str: Truncated hex SHA-256 digest of the path.
+    """
+    return hashlib.sha256(path.encode("utf-8")).hexdigest()[:PATH_HASH_LENGTH]
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formats records as single-line JSON objects.
+    """
+
+    def __init__(self, run_id: Optional[str] = None):
+        """
+        Args:
+            run_id (str, optional): Id of the workflow run, added to every
+                record.
+        """
+        super().__init__()
+        self.run_id = run_id
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if self.run_id:
+            entry["run_id"] = self.run_id
+        entry.update(getattr(record, EVENT_ATTRIBUTE, None) or {})
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keeps a fraction of the DEBUG records and every record above DEBUG.
+    """
+
+    def __init__(self, rate: float, random_fn: Callable[[], float] = random.random):
+        """
+        Args:
+            rate (float): Fraction of DEBUG records kept, between 0 and 1.
+            random_fn (Callable[[], float]): Source of random numbers in
+                [0, 1).
+        """
+        super().__init__()
+        self.rate = rate
+        self._random = random_fn
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno > logging.DEBUG or self._random() < self.rate
+
+
+def log_event(
+    logger: logging.Logger,
+    level: int,
+    operation: str,
+    path: Optional[str] = None,
+    started: Optional[float] = None,
+    **fields,
+) -> None:
+    """
+    Log an operation with structured fields. Nothing is built when the level
+    is disabled, and fields missing from EVENT_FIELDS are dropped.
+
+    Args:
+        logger (logging.Logger): Logger.
+        level (int): Log level.
+        operation (str): Name of the operation.
+        path (str, optional): Secret path, logged as its hash.
+        started (float, optional): time.perf_counter() value when the
+            operation started, logged as the latency.
+        fields: Further fields, e.g. output_id or status.
+    """
+    if not logger.isEnabledFor(level):
+        return
+
+    event: Dict[str, object] = {"operation": operation}
+    if path is not None:
+        event["path_hash"] = path_hash(path)
+    if started is not None:
+        event["latency_ms"] = round((time.perf_counter() - started) * 1000, 3)
+    event.update(
+        (name, value)
+        for name, value in fields.items()
+        if name in EVENT_FIELDS and value is not None
+    )
+
+    details = " ".join(f"{name}=%s" for name in event if name != "operation")
+    logger.log(
+        level,
+        "%s " + details if details else "%s",
+        operation,
+        *(value for name, value in event.items() if name != "operation"),
+        extra={EVENT_ATTRIBUTE: event},
+    )
+
+
+def configure_logging(
+    logger_name: str,
+    level: int,
+    log_format: str = TEXT_FORMAT,
+    sample_rate: float = 1.0,
+    run_id: Optional[str] = None,
+) -> logging.Logger:
+    """
+    Configure the root handler and the logger of the action.
+
+    Args:
+        logger_name (str): Name of the logger of the action.
+        level (int): Log level.
+        log_format (str): One of LOG_FORMATS.
+        sample_rate (float): Fraction of DEBUG records kept.
+        run_id (str, optional): Id of the workflow run, added to JSON records.
+
+    Returns:
+        logging.Logger: The logger of the action.
+
+    Raises:
+        ValueError: If the log format or sample rate is invalid.
+    """
+    if log_format not in LOG_FORMATS:
+        raise ValueError(f"Invalid log format {log_format!r}")
+    if not 0 <= sample_rate <= 1:
+        raise ValueError(f"Invalid log sample rate {sample_rate!r}")
+
+    if log_format == JSON_FORMAT:
+        handler = logging.StreamHandler()
+        handler.setFormatter(JsonFormatter(run_id))
+        logging.basicConfig(level=level, handlers=[handler])
+    else:
+        logging.basicConfig(format=TEXT_LOG_FORMAT, level=level)
+
+    logger = logging.getLogger(logger_name)
+    if sample_rate < 1:
+        logger.addFilter(SamplingFilter(sample_rate))
+    return logger
@@ -0,0 +1,180 @@
+"""
+Anonymized traces of the HTTP calls of an action run.
+
+With TRACE_FILE set, every HTTP call of the run is recorded with a response
+hook on the requests session, like the metrics, and the records are
+appended to the file at the end of the run, one JSON object per line. A
+record holds the operation, i.e. the method and the endpoint with its ids
+replaced by "{id}", the time it started at relative to the start of the run,
+its latency, status, retries and the sizes of the request and response
+bodies. The endpoint and query string, which hold secret paths and names,
+are only kept as a truncated SHA-256 hash, so repeated calls on the same
+secret can be told apart without revealing it.
+
+Traces are replayed against a local stand-in of Secrets Safe to size the
+appliance, see tests/replay.
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from typing import List, Optional
+from urllib.parse import urlsplit
+
+import requests
+
+FILE_MODE = 0o600
+KEY_LENGTH = 16
+
+_ID_SEGMENT = re.compile(
+    r"^(\d+|[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-"
+    r"[0-9a-fA-F]{12})$"
+)
+
+
+def operation(method: str, url: str, base_path: str = "") -> str:
+    """
+    Describe an HTTP call without its ids and query string, e.g.
+    "GET secrets-safe/secrets/{id}/text".
+
+    Args:
+        method (str): HTTP method.
+        url (str): URL, or path, of the call.
+        base_path (str): Path of the API URL, removed from the endpoint.
+
+    Returns:
+        str: The operation.
+    """
+    path = urlsplit(url).path
+    prefix = base_path.rstrip("/").lower()
+    if prefix and path.lower().startswith(prefix + "/"):
+        path = path.split("/", prefix.count("/") + 1)[-1]
+    segments = [
+        "{id}" if _ID_SEGMENT.match(segment) else segment.lower()
+        for segment in path.split("/")
+        if segment
+    ]
+    return f"{method.upper()} {'/'.join(segments)}"
+
+
+def path_key(url: str) -> str:
+    """
+    Hash the endpoint and query string of a call.
+
+    Args:
+        url (str): URL of the call.
+
+    Returns:
+        str: The truncated SHA-256 hash.
+    """
+    parts = urlsplit(url)
+    target = f"{parts.path.lower()}?{parts.query}".encode("utf-8")
+    return hashlib.sha256(target).hexdigest()[:KEY_LENGTH]
+
+
+def _sent_bytes(request: requests.PreparedRequest) -> int:
+    body = request.body
+    if isinstance(body, (bytes, str)):
+        return len(body)
+    # streamed bodies, e.g. file uploads, are only known by their length
+    length = request.headers.get("Content-Length")
+    return int(length) if length else 0
+
+
+def _received_bytes(response: requests.Response) -> int:
+    length = response.headers.get("Content-Length")
+    if length:
+        return int(length)
+    return len(response.content)
+
+
+class TraceRecorder:
+    """
+    Thread-safe recorder of the HTTP calls of a run.
+    """
+
+    def __init__(self, action: str, clock=time.perf_counter):
+        """
+        Args:
+            action (str): Name of the action.
+            clock (Callable[[], float]): Monotonic clock in seconds.
+        """
+        self.action = action
+        self.run_id = uuid.uuid4().hex[:12]
+        self.records: List[dict] = []
+        self._clock = clock
+        self._started = clock()
+        self._lock = threading.Lock()
+
+    def instrument_session(
+        self, session: requests.Session, api_url: Optional[str] = None
+    ) -> None:
+        """
+        Record the calls of a session.
+
+        Args:
+            session (requests.Session): Requests session used for HTTP calls.
+            api_url (str, optional): API URL, whose path is removed from the
+                recorded operations.
+        """
+        base_path = urlsplit(api_url).path if api_url else ""
+
+        def record(response: requests.Response, *args, **kwargs):
+            seconds = response.elapsed.total_seconds()
+            retries = getattr(response.raw, "retries", None)
+            request = response.request
+            entry = {
+                "action": self.action,
+                "run": self.run_id,
+                "op": operation(request.method, request.url, base_path),
+                "key": path_key(request.url),
+                "start": round(self._clock() - self._started - seconds, 6),
+                "seconds": round(seconds, 6),
+                "status": response.status_code,
+                "retries": len(retries.history) if retries is not None else 0,
+                "sent": _sent_bytes(request),
+                "received": _received_bytes(response),
+            }
+            with self._lock:
+                self.records.append(entry)
+
+        session.hooks["response"].append(record)
+
+    def write(self, path: str) -> None:
+        """
+        Append the records to a trace file, created readable only by its
+        owner. Runs appending to the same file do not interleave their
+        records, as each run appends them with a single write.
+
+        Args:
+            path (str): Path of the trace file.
+        """
+        with self._lock:
+            content = "".join(json.dumps(entry) + "\n" for entry in self.records)
+        if not content:
+            return
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, FILE_MODE)
+        with os.fdopen(fd, "w", encoding="utf-8") as fh:
+            fh.write(content)
+
+
+def load(path: str, action: Optional[str] = None) -> List[dict]:
+    """
+    Load the records of a trace file.
+
+    Args:
+        path (str): Path of the trace file.
+        action (str, optional): Only keep the records of this action.
+
+    Returns:
+        List[dict]: The records, in file order.
+    """
+    with open(path, encoding="utf-8") as fh:
+        records = [json.loads(line) for line in fh if line.strip()]
+    if action is None:
+        return records
+    return [entry for entry in records if entry.get("action") == action]
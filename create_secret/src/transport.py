@@ -0,0 +1,473 @@
+"""
+HTTP transport for the Secrets Safe API.
+
+API_URL may list several Secrets Safe nodes separated by commas. The nodes are
+probed concurrently at startup and requests are sent to the fastest healthy
+one, a node answering the probe with a server error counting as unhealthy.
+When a connection to the active node cannot be established, the request is
+sent to the next node straight away, instead of going through the full retry
+and timeout cycle, and that node stays active for the rest of the run. Once
+signed in, the session only exists on the node it was opened on, so a request
+failed over mid-run first signs in again on the new node, through the session
+guard given to guard_session, and is then replayed there.
+
+Requests can be throttled client-side with a token bucket, and the first
+request delayed by a random startup jitter, so many jobs starting at once do
+not overload Secrets Safe with sign-ins and lookups. Every attempt takes a
+token, retries included, so a struggling node is not hit harder by retries.
+
+requests already asks for compressed responses with every encoding urllib3
+can decode, gzip and deflate, and brotli since the Brotli package is a
+dependency. urllib3 decompresses the body while it is read, chunk by chunk.
+"""
+
+import concurrent.futures
+import logging
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.cookies import get_cookie_header
+from urllib3.exceptions import MaxRetryError, NewConnectionError
+from urllib3.util.retry import Retry
+
+RETRY_TOTAL = 3
+RETRY_BACKOFF_FACTOR = 0.2
+RETRY_STATUS_FORCELIST = [400, 408, 500, 502, 503, 504]
+RETRY_ALLOWED_METHODS = ["GET", "POST"]
+RETRY_BACKOFF_JITTER = 0.2
+
+DEFAULT_PROBE_TIMEOUT_SECONDS = 2.0
+
+
+def parse_api_urls(value: Optional[str]) -> List[str]:
+    """
+    Split a comma-separated list of API URLs.
+
+    Args:
+        value (str, optional): One or more API URLs separated by commas.
+
+    Returns:
+        List[str]: The API URLs, in the given order.
+    """
+    return [url.strip() for url in (value or "").split(",") if url.strip()]
+
+
+def build_retry(
+    connect: Optional[int] = None, rate_limiter: Optional["TokenBucket"] = None
+) -> Retry:
+    """
+    Build the retry policy of the action.
+
+    Args:
+        connect (int, optional): Retries on connection errors, None to only
+            use the total limit.
+        rate_limiter (TokenBucket, optional): Rate limiter each retry takes a
+            token from, None to retry without throttling.
+
+    Returns:
+        Retry: The retry policy.
+    """
+    return ThrottledRetry(
+        total=RETRY_TOTAL,
+        connect=connect,
+        backoff_factor=RETRY_BACKOFF_FACTOR,
+        backoff_jitter=RETRY_BACKOFF_JITTER,
+        status_forcelist=RETRY_STATUS_FORCELIST,
+        allowed_methods=RETRY_ALLOWED_METHODS,
+        rate_limiter=rate_limiter,
+    )
+
+
+def _never_sent(error: requests.exceptions.ConnectionError) -> bool:
+    # Only connection failures are failed over, so a request that may have
+    # reached a node, e.g. a secret creation, is never sent twice.
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    reason = error.args[0] if error.args else None
+    if isinstance(reason, MaxRetryError):
+        reason = reason.reason
+    return isinstance(reason, NewConnectionError)
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket limiting the request rate.
+
+    Each request takes a token. Tokens are refilled at ``rate`` per second up
+    to ``burst``. A request finding the bucket empty reserves the next token
+    and waits for it, so waiting requests are served in arrival order.
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        burst: float,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        """
+        Args:
+            rate (float): Requests per second.
+            burst (float): Requests allowed at once, at least 1.
+            clock (Callable[[], float]): Monotonic clock in seconds.
+            sleep (Callable[[float], None]): Sleep function.
+        """
+        self.rate = rate
+        self.capacity = max(1.0, burst)
+        self._clock = clock
+        self._sleep = sleep
+        self._tokens = self.capacity
+        self._updated = clock()
+        self._lock = threading.Lock()
+        self.throttled_requests = 0
+        self.throttled_seconds = 0.0
+
+    def acquire(self) -> float:
+        """
+        Take a token, waiting until one is available.
+
+        Returns:
+            float: Time waited in seconds.
+        """
+        with self._lock:
+            now = self._clock()
+            self._tokens = min(
+                self.capacity, self._tokens + (now - self._updated) * self.rate
+            )
+            self._updated = now
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+            if wait:
+                self.throttled_requests += 1
+                self.throttled_seconds += wait
+
+        if wait:
+            self._sleep(wait)
+        return wait
+
+
+class ThrottledRetry(Retry):
+    """
+    Retry policy taking a token from a TokenBucket before each retry. urllib3
+    resends requests within a single adapter send, so without it retries
+    would bypass the rate limit.
+    """
+
+    def __init__(self, *args, rate_limiter: Optional[TokenBucket] = None, **kwargs):
+        """
+        Args:
+            rate_limiter (TokenBucket, optional): Rate limiter, None to retry
+                without throttling.
+            args, kwargs: Passed to Retry.
+        """
+        super().__init__(*args, **kwargs)
+        self.rate_limiter = rate_limiter
+
+    def new(self, **kw) -> "ThrottledRetry":
+        kw.setdefault("rate_limiter", self.rate_limiter)
+        return super().new(**kw)
+
+    def sleep(self, response=None) -> None:
+        super().sleep(response)
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire()
+
+
+class ThrottledAdapter(HTTPAdapter):
+    """
+    HTTP adapter taking a token from a TokenBucket before each request. Give
+    it a retry policy from build_retry with the same rate limiter for the
+    retries to take tokens too.
+    """
+
+    def __init__(
+        self,
+        rate_limiter: Optional[TokenBucket] = None,
+        logger: Optional[logging.Logger] = None,
+        **kwargs,
+    ):
+        """
+        Args:
+            rate_limiter (TokenBucket, optional): Rate limiter, None to send
+                requests without throttling.
+            logger (logging.Logger, optional): Logger.
+            kwargs: Passed to HTTPAdapter.
+        """
+        super().__init__(**kwargs)
+        self.rate_limiter = rate_limiter
+        self._logger = logger or logging.getLogger(__name__)
+
+    def send(self, request: requests.PreparedRequest, **kwargs) -> requests.Response:
+        if self.rate_limiter is not None:
+            waited = self.rate_limiter.acquire()
+            if waited:
+                self._logger.debug("Request throttled for %.3f s", waited)
+        return super().send(request, **kwargs)
+
+
+class FailoverAdapter(ThrottledAdapter):
+    """
+    HTTP adapter routing requests to the active node of a list of API URLs.
+
+    Requests are built by the library against one of the API URLs, the
+    adapter rewrites that prefix to the active node. Cookies the session holds
+    for the active node replace the ones of the original URL. Once a session
+    guard is set, failing over signs in again on the new node.
+    """
+
+    def __init__(
+        self,
+        api_urls: List[str],
+        cookies: Optional[requests.cookies.RequestsCookieJar] = None,
+        logger: Optional[logging.Logger] = None,
+        **kwargs,
+    ):
+        """
+        Args:
+            api_urls (List[str]): API URLs of the Secrets Safe nodes.
+            cookies (RequestsCookieJar, optional): Cookie jar of the session.
+            logger (logging.Logger, optional): Logger for failover events.
+            kwargs: Passed to ThrottledAdapter.
+        """
+        super().__init__(logger=logger, **kwargs)
+        self.api_urls = list(api_urls)
+        self._cookies = cookies
+        self._active = 0
+        self._lock = threading.Lock()
+        # object with ensure() and invalidate(), see guard_session
+        self.session_guard: Optional[Any] = None
+        self._signing_in = threading.local()
+
+    @property
+    def active_url(self) -> str:
+        return self.api_urls[self._active]
+
+    def probe(
+        self, timeout: float = DEFAULT_PROBE_TIMEOUT_SECONDS, verify=True
+    ) -> Dict[str, Optional[float]]:
+        """
+        Measure the latency of every node concurrently and make the fastest
+        healthy one active. A node answering with a server error (5xx) counts
+        as unhealthy. The probe connections stay in the pool for the requests
+        that follow.
+
+        Args:
+            timeout (float): Probe timeout in seconds.
+            verify (bool | str): TLS verification, as in requests.
+
+        Returns:
+            Dict[str, Optional[float]]: Latency in seconds of each API URL,
+            None for unhealthy nodes.
+        """
+
+        def measure(url: str) -> Optional[float]:
+            request = requests.Request("HEAD", url).prepare()
+            start = time.perf_counter()
+            try:
+                response = ThrottledAdapter.send(
+                    self, request, timeout=timeout, verify=verify
+                )
+            except requests.exceptions.RequestException:
+                return None
+            response.close()
+            if response.status_code >= 500:
+                return None
+            return time.perf_counter() - start
+
+        with concurrent.futures.ThreadPoolExecutor(len(self.api_urls)) as executor:
+            latencies = dict(zip(self.api_urls, executor.map(measure, self.api_urls)))
+
+        healthy = sorted(
+            (url for url in self.api_urls if latencies[url] is not None),
+            key=latencies.__getitem__,
+        )
+        unhealthy = [url for url in self.api_urls if latencies[url] is None]
+        with self._lock:
+            self.api_urls = healthy + unhealthy
+            self._active = 0
+        return latencies
+
+    def _base_url(self, url: str) -> Optional[str]:
+        for api_url in self.api_urls:
+            if url.startswith(api_url):
+                return api_url
+        return None
+
+    def _rewrite(
+        self, request: requests.PreparedRequest, base_url: str, api_url: str
+    ) -> requests.PreparedRequest:
+        rewritten = request.copy()
+        rewritten.url = request.url.replace(base_url, api_url, 1)
+        if self._cookies is not None:
+            # the jar adds no cookie to a request already carrying some
+            rewritten.headers.pop("Cookie", None)
+            cookie_header = get_cookie_header(self._cookies, rewritten)
+            if cookie_header:
+                rewritten.headers["Cookie"] = cookie_header
+        return rewritten
+
+    def _switch(self, index: int) -> None:
+        with self._lock:
+            switched = index != self._active
+            self._active = index
+            if switched and self.session_guard is not None:
+                self.session_guard.invalidate()
+        if switched:
+            self._logger.warning(
+                f"Switched to Secrets Safe node {self.api_urls[index]}"
+            )
+
+        # the sign-in itself goes through send(), and is failed over without
+        # signing in again
+        if self.session_guard is None or getattr(self._signing_in, "active", False):
+            return
+        self._signing_in.active = True
+        try:
+            self.session_guard.ensure()
+        finally:
+            self._signing_in.active = False
+
+    def send(self, request: requests.PreparedRequest, **kwargs) -> requests.Response:
+        base_url = self._base_url(request.url)
+        if base_url is None:
+            return super().send(request, **kwargs)
+
+        start = self._active
+        error = None
+        for offset in range(len(self.api_urls)):
+            index = (start + offset) % len(self.api_urls)
+            api_url = self.api_urls[index]
+            if offset:
+                self._switch(index)
+            try:
+                response = super().send(
+                    self._rewrite(request, base_url, api_url), **kwargs
+                )
+            except requests.exceptions.ConnectionError as e:
+                if not _never_sent(e):
+                    raise
+                self._logger.warning(
+                    f"Secrets Safe node {api_url} is unreachable, failing over"
+                )
+                error = e
+                continue
+
+            return response
+
+        raise error
+
+
+def mount_adapter(
+    session: requests.Session,
+    api_urls: List[str],
+    logger: logging.Logger,
+    probe_timeout: float = DEFAULT_PROBE_TIMEOUT_SECONDS,
+    verify=True,
+    rate_limiter: Optional[TokenBucket] = None,
+    startup_jitter_seconds: float = 0,
+) -> str:
+    """
+    Mount the HTTP adapter of the action on the session.
+
+    A single API URL gets the retry policy. Several API URLs get a
+    FailoverAdapter, which probes the nodes, and connection errors are not
+    retried on the same node. Before the first request, a random delay of up
+    to ``startup_jitter_seconds`` spreads the sign-ins of jobs started at once.
+    Responses are requested with every compression urllib3 can decode.
+
+    Args:
+        session (requests.Session): Requests session used for HTTP calls.
+        api_urls (List[str]): API URLs of the Secrets Safe nodes.
+        logger (logging.Logger): Logger.
+        probe_timeout (float): Probe timeout in seconds.
+        verify (bool | str): TLS verification, as in requests.
+        rate_limiter (TokenBucket, optional): Rate limiter for every request.
+        startup_jitter_seconds (float): Maximum startup delay in seconds.
+
+    Returns:
+        str: The API URL to authenticate against.
+    """
+    if startup_jitter_seconds > 0:
+        delay = random.uniform(0, startup_jitter_seconds)
+        logger.debug(f"Delaying sign-in by {delay:.3f} s")
+        time.sleep(delay)
+
+    if len(api_urls) <= 1:
+        adapter = ThrottledAdapter(
+            rate_limiter=rate_limiter,
+            logger=logger,
+            max_retries=build_retry(rate_limiter=rate_limiter),
+        )
+        api_url = api_urls[0] if api_urls else None
+    else:
+        adapter = FailoverAdapter(
+            api_urls,
+            cookies=session.cookies,
+            logger=logger,
+            rate_limiter=rate_limiter,
+            max_retries=build_retry(connect=0, rate_limiter=rate_limiter),
+        )
+        latencies = adapter.probe(probe_timeout, verify)
+        for url, latency in latencies.items():
+            status = "unhealthy" if latency is None else f"{latency * 1000:.0f} ms"
+            logger.debug(f"Secrets Safe node {url}: {status}")
+        api_url = adapter.active_url
+        logger.info(f"Using Secrets Safe node {api_url}")
+
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return api_url
+
+
+def guard_session(session: requests.Session, session_guard: Any) -> None:
+    """
+    Sign a session in again on the node its requests fail over to, once it
+    is signed in.
+
+    Args:
+        session (requests.Session): Session the adapter is mounted on.
+        session_guard: Guard of the session, with ensure() and invalidate().
+    """
+    adapter = session.get_adapter("https://")
+    if isinstance(adapter, FailoverAdapter):
+        adapter.session_guard = session_guard
+
+
+def build_rate_limiter(rate: float, burst: float) -> Optional[TokenBucket]:
+    """
+    Build the rate limiter of the action.
+
+    Args:
+        rate (float): Requests per second, 0 to disable rate limiting.
+        burst (float): Requests allowed at once, 0 to allow one second's
+            worth of requests.
+
+    Returns:
+        TokenBucket, optional: The rate limiter, None when disabled.
+    """
+    if rate <= 0:
+        return None
+    return TokenBucket(rate, burst or rate)
+
+
+def log_throttling(session: requests.Session, logger: logging.Logger):
+    """
+    Log how long requests of the session were throttled.
+
+    Args:
+        session (requests.Session): Session the adapter is mounted on.
+        logger (logging.Logger): Logger.
+    """
+    adapter = session.get_adapter("https://")
+    if not isinstance(adapter, ThrottledAdapter):
+        return
+    rate_limiter = adapter.rate_limiter
+    if rate_limiter is not None and rate_limiter.throttled_requests:
+        logger.info(
+            f"{rate_limiter.throttled_requests} requests were throttled for "
+            f"{rate_limiter.throttled_seconds:.3f} s in total"
+        )
@@ -0,0 +1,171 @@
+"""
+Idempotent create support for existing secrets.
+
+Instead of failing on a duplicate title, or querying for each secret before
+creating it, the titles of the target folder are indexed with a single listing
+call. The create, update or skip decision is then made locally, and an
+existing secret is only written when the SHA-256 digest of its content differs
+from the requested content.
+"""
+
+import hashlib
+import os
+from typing import Callable, Dict, Optional
+
+from secrets_safe_library import exceptions, secrets_safe
+from src import streaming
+
+IF_EXISTS_FAIL = "fail"
+IF_EXISTS_UPDATE = "update"
+IF_EXISTS_SKIP = "skip"
+IF_EXISTS_MODES = (IF_EXISTS_FAIL, IF_EXISTS_UPDATE, IF_EXISTS_SKIP)
+
+CREATE = "create"
+UPDATE = "update"
+SKIP = "skip"
+
+CREDENTIAL_TYPE = "Credential"
+TEXT_TYPE = "Text"
+FILE_TYPE = "File"
+
+
+def build_title_index(
+    secrets_safe_obj: secrets_safe.SecretsSafe, folder_id: str
+) -> Dict[str, dict]:
+    """
+    Index the secrets of a folder by title with a single listing call.
+
+    Args:
+        secrets_safe_obj (secrets_safe.SecretsSafe): Secrets Safe client.
+        folder_id (str): The folder GUID.
+
+    Returns:
+        Dict[str, dict]: Secret records keyed by title.
+    """
+    index = {}
+    for record in secrets_safe_obj.list_secrets_by_folder_id(folder_id):
+        index.setdefault(record.get("Title"), record)
+    return index
+
+
+def content_digest(*parts: str | bytes) -> str:
+    """
+    Hash secret content. Each part is length-prefixed, so the boundary
+    between e.g. a username and a password is part of the digest.
+
+    Args:
+        parts (str | bytes): Content parts, str parts are UTF-8 encoded.
+
+    Returns:
+        str: Hex SHA-256 digest.
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, str):
+            part = part.encode("utf-8")
+        digest.update(len(part).to_bytes(8, "big"))
+        digest.update(part)
+    return digest.hexdigest()
+
+
+def file_digest(file_path: str) -> Optional[str]:
+    """
+    Hash a file the same way as content_digest, reading it in chunks.
+
+    Args:
+        file_path (str): Path of the file to hash.
+
+    Returns:
+        str, optional: Hex SHA-256 digest, or None for named pipes, which
+        can only be read once and are therefore always uploaded.
+    """
+    if not os.path.isfile(file_path):
+        return None
+
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as fh:
+        size = fh.seek(0, 2)
+        fh.seek(0)
+        digest.update(size.to_bytes(8, "big"))
+        while chunk := fh.read(streaming.CHUNK_SIZE_BYTES):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def existing_digest(
+    secrets_safe_obj: secrets_safe.SecretsSafe,
+    record: dict,
+    include_password: bool = True,
+) -> str:
+    """
+    Read the current content of an existing secret once and hash it.
+
+    Args:
+        secrets_safe_obj (secrets_safe.SecretsSafe): Secrets Safe client.
+        record (dict): The secret record from the title index.
+        include_password (bool): Whether the password of a credential secret
+            is part of the digest, False when the password is generated.
+
+    Returns:
+        str: Hex SHA-256 digest of the current content.
+    """
+    secret_type = record.get("SecretType")
+    if secret_type == FILE_TYPE:
+        return content_digest(
+            streaming.download_file_secret(secrets_safe_obj, record["Id"])
+        )
+
+    if secret_type == TEXT_TYPE:
+        secret = secrets_safe_obj.get_text_secret_by_id(record["Id"])
+        return content_digest(secret.get("Text") or secret.get("Password") or "")
+
+    secret = secrets_safe_obj.get_secret_by_id(record["Id"])
+    if not include_password:
+        return content_digest(secret.get("Username") or "")
+    return content_digest(secret.get("Username") or "", secret.get("Password") or "")
+
+
+def decide(
+    record: Optional[dict],
+    if_exists: str,
+    secret_type: str,
+    desired_digest: Callable[[], Optional[str]],
+    current_digest: Callable[[], str],
+) -> str:
+    """
+    Decide whether to create, update or skip a secret.
+
+    Digests are only computed when an existing secret may be updated, so
+    creates and skips do not read any content.
+
+    Args:
+        record (dict, optional): The existing secret record, if any.
+        if_exists (str): One of IF_EXISTS_MODES.
+        secret_type (str): Type of the requested secret.
+        desired_digest (Callable[[], Optional[str]]): Digest of the
+            requested content, None when it cannot be hashed.
+        current_digest (Callable[[], str]): Digest of the existing content.
+
+    Returns:
+        str: CREATE, UPDATE or SKIP.
+
+    Raises:
+        exceptions.UpdateError: If the existing secret has another type.
+    """
+    if record is None or if_exists == IF_EXISTS_FAIL:
+        return CREATE
+
+    if if_exists == IF_EXISTS_SKIP:
+        return SKIP
+
+    existing_type = record.get("SecretType") or CREDENTIAL_TYPE
+    if existing_type != secret_type:
+        raise exceptions.UpdateError(
+            f"Existing secret is a {existing_type} secret, "
+            f"it cannot be updated as a {secret_type} secret"
+        )
+
+    desired = desired_digest()
+    if desired is None:
+        return UPDATE
+    return SKIP if desired == current_digest() else UPDATE
@@ -0,0 +1,253 @@
+"""
+Harness of the performance regression benchmarks.
+
+Each benchmark calls a function repeatedly and measures its throughput, in
+calls per second, and the peak memory of one call, with tracemalloc.
+Throughput is divided by the throughput of a fixed pure-Python calibration
+workload run just before it, so baselines recorded on one machine can be
+compared on another, and changes of the CPU speed during a run, e.g. from
+other processes, affect both alike. Time a function spends waiting, e.g. in
+sleeps standing in for network latency, does not depend on the CPU speed,
+so it is left out of the timings before they are calibrated.
+
+Results are compared with the baselines stored in baselines.json next to the
+benchmarks. A benchmark fails when its calibrated throughput drops, or its
+peak memory grows, by more than BENCHMARK_TOLERANCE (0.5, i.e. 50%, by
+default). Run the benchmarks with BENCHMARK_UPDATE=true to record new
+baselines after an intended change.
+"""
+
+import gc
+import json
+import os
+import time
+import tracemalloc
+import unittest
+from typing import Callable, Dict, NamedTuple, Optional
+
+BASELINES_FILE = os.path.join(os.path.dirname(__file__), "baselines.json")
+DEFAULT_TOLERANCE = 0.5
+DEFAULT_REPEAT = 5
+
+# memory differences below this are noise from the interpreter, not regressions
+MEMORY_NOISE_BYTES = 64 * 1024
+
+CALIBRATION_ITERATIONS = 100_000
+
+
+class BenchmarkResult(NamedTuple):
+    """
+    Measurements of one benchmark.
+    """
+
+    calls_per_second: float
+    relative_throughput: float
+    peak_bytes: int
+
+
+def tolerance() -> float:
+    """
+    Get the allowed regression, from the BENCHMARK_TOLERANCE variable.
+
+    Returns:
+        float: Allowed fraction of throughput loss or memory growth.
+    """
+    return float(os.environ.get("BENCHMARK_TOLERANCE", DEFAULT_TOLERANCE))
+
+
+def updating() -> bool:
+    """
+    Check if baselines are being recorded, with BENCHMARK_UPDATE=true.
+
+    Returns:
+        bool: True when recording baselines.
+    """
+    return os.environ.get("BENCHMARK_UPDATE", "").strip().lower() == "true"
+
+
+def calibration_rate() -> float:
+    """
+    Measure the throughput of the calibration workload.
+
+    Returns:
+        float: Calibration workloads per second.
+    """
+    best = float("inf")
+    for _ in range(DEFAULT_REPEAT):
+        started = time.perf_counter()
+        total = 0
+        for i in range(CALIBRATION_ITERATIONS):
+            total += i * i % 7
+        best = min(best, time.perf_counter() - started)
+    return 1 / best
+
+
+def measure(
+    function: Callable[[], object],
+    number: int,
+    repeat: int = DEFAULT_REPEAT,
+    idle: Optional[Callable[[], float]] = None,
+) -> BenchmarkResult:
+    """
+    Measure the throughput and peak memory of a function.
+
+    Args:
+        function (Callable[[], object]): Function to measure.
+        number (int): Calls per timing.
+        repeat (int): Timings, the fastest one is kept.
+        idle (Callable[[], float], optional): Seconds the function has spent
+            waiting so far, subtracted from the timings.
+
+    Returns:
+        BenchmarkResult: The measurements.
+    """
+    function()  # warm-up, e.g. lazy imports and caches
+
+    # like timeit, collections triggered by the rest of the process, e.g.
+    # the other tests, are kept out of the timings
+    gc.collect()
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        calibration = calibration_rate()
+        best = float("inf")
+        for _ in range(repeat):
+            idle_before = idle() if idle is not None else 0.0
+            started = time.perf_counter()
+            for _ in range(number):
+                function()
+            elapsed = time.perf_counter() - started
+            if idle is not None:
+                elapsed -= idle() - idle_before
+            best = min(best, elapsed)
+    finally:
+        if gc_enabled:
+            gc.enable()
+    calls_per_second = number / best
+
+    # tracemalloc slows allocations down, so memory is measured separately
+    tracemalloc.start()
+    try:
+        function()
+        _, peak_bytes = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return BenchmarkResult(calls_per_second, calls_per_second / calibration, peak_bytes)
+
+
+def load_baselines(path: str = BASELINES_FILE) -> Dict[str, dict]:
+    """
+    Load the stored baselines.
+
+    Args:
+        path (str): Path of the baselines file.
+
+    Returns:
+        Dict[str, dict]: The baselines keyed by benchmark name, empty when the
+        file does not exist.
+    """
+    try:
+        with open(path, encoding="utf-8") as fh:
+            return json.load(fh)
+    except FileNotFoundError:
+        return {}
+
+
+def save_baseline(name: str, result: BenchmarkResult, path: str = BASELINES_FILE):
+    """
+    Store the baseline of one benchmark, keeping the other ones.
+
+    Args:
+        name (str): Benchmark name.
+        result (BenchmarkResult): The measurements.
+        path (str): Path of the baselines file.
+    """
+    baselines = load_baselines(path)
+    baselines[name] = {
+        "relative_throughput": round(result.relative_throughput, 9),
+        "peak_bytes": result.peak_bytes,
+    }
+    with open(path, "w", encoding="utf-8") as fh:
+        json.dump(baselines, fh, indent=2, sort_keys=True)
+        fh.write("\n")
+
+
+def regressions(result: BenchmarkResult, baseline: dict, allowed: float) -> list:
+    """
+    Compare measurements with a baseline.
+
+    Args:
+        result (BenchmarkResult): The measurements.
+        baseline (dict): The stored baseline.
+        allowed (float): Allowed fraction of throughput loss or memory growth.
+
+    Returns:
+        list: Descriptions of the regressions, empty when there are none.
+    """
+    found = []
+    minimum_throughput = baseline["relative_throughput"] * (1 - allowed)
+    if result.relative_throughput < minimum_throughput:
+        found.append(
+            f"throughput {result.relative_throughput:.6g} is below "
+            f"{minimum_throughput:.6g} (baseline "
+            f"{baseline['relative_throughput']:.6g})"
+        )
+
+    maximum_bytes = max(
+        baseline["peak_bytes"] * (1 + allowed),
+        baseline["peak_bytes"] + MEMORY_NOISE_BYTES,
+    )
+    if result.peak_bytes > maximum_bytes:
+        found.append(
+            f"peak memory {result.peak_bytes} B is above {maximum_bytes:.0f} B "
+            f"(baseline {baseline['peak_bytes']} B)"
+        )
+    return found
+
+
+class BenchmarkTestCase(unittest.TestCase):
+    """
+    Test case checking benchmarks against their baselines.
+    """
+
+    baselines_file = BASELINES_FILE
+
+    def assertNoRegression(
+        self,
+        name: str,
+        function: Callable[[], object],
+        number: int,
+        repeat: int = DEFAULT_REPEAT,
+        idle: Optional[Callable[[], float]] = None,
+    ) -> BenchmarkResult:
+        """
+        Measure a function and fail if it regressed from its baseline.
+
+        Args:
+            name (str): Benchmark name, the key of its baseline.
+            function (Callable[[], object]): Function to measure.
+            number (int): Calls per timing.
+            repeat (int): Timings, the fastest one is kept.
+            idle (Callable[[], float], optional): Seconds the function has
+                spent waiting so far, subtracted from the timings.
+
+        Returns:
+            BenchmarkResult: The measurements.
+        """
+        result = measure(function, number, repeat, idle)
+        if updating():
+            save_baseline(name, result, self.baselines_file)
+            return result
+
+        baseline = load_baselines(self.baselines_file).get(name)
+        if baseline is None:
+            self.fail(
+                f"No baseline for benchmark {name}, "
+                "record it with BENCHMARK_UPDATE=true"
+            )
+
+        found = regressions(result, baseline, tolerance())
+        if found:
+            self.fail(f"Benchmark {name} regressed: " + "; ".join(found))
+        return result
@@ -0,0 +1,56 @@
+"""Performance regression benchmarks for client module"""
+
+from unittest.mock import patch
+
+from src import client
+from tests.benchmark import harness
+
+CONFIG = client.ClientConfig(api_url="https://example.com/BeyondTrust/api/public/v3")
+LISTED_FOLDERS = 5_000
+BATCH_FOLDERS = 50
+BATCH_SIZE = 500
+
+
+class StubFolders:
+    """
+    Folders client listing, like the API, every folder whose name contains the
+    searched name.
+    """
+
+    folders = [
+        {"Id": f"id-{index}", "Name": f"team/folder_{index}"}
+        for index in range(LISTED_FOLDERS)
+    ]
+
+    def __init__(self, authentication=None, logger=None):
+        pass
+
+    def list_folders(self, folder_name=None):
+        return [folder for folder in self.folders if folder_name in folder["Name"]]
+
+
+class TestBenchmarkClient(harness.BenchmarkTestCase):
+    """
+    Benchmarks for client module
+    """
+
+    def test_get_folder_large_listing(self):
+        folders_obj = StubFolders()
+        folders_obj.list_folders = lambda folder_name=None: folders_obj.folders
+        self.assertNoRegression(
+            "get_folder_large_listing",
+            lambda: client.get_folder(folders_obj, "team/folder_4999"),
+            50,
+        )
+
+    @patch("src.client.folders.Folder", StubFolders)
+    def test_folder_id_batch_resolution(self):
+        names = [f"team/folder_{index % BATCH_FOLDERS}" for index in range(BATCH_SIZE)]
+
+        def resolve():
+            secrets_client = client.SecretsSafeClient(CONFIG)
+            secrets_client._authentication_obj = object()
+            for name in names:
+                secrets_client.folder_id(name)
+
+        self.assertNoRegression("folder_id_batch_resolution", resolve, 2)
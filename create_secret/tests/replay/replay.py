@@ -0,0 +1,423 @@
+"""
+Replay of recorded action runs against the local Secrets Safe stand-in.
+
+Every run of the action in the trace, see src/tracing, is turned back into
+action inputs and replayed by running src/main.py, the same entrypoint as the
+workflow step, against the stand-in, at increasing concurrency levels. At
+level N, N workers replay every run at once. Secret paths and names are only
+known by their hash, so the replayed inputs are synthetic, with as many
+lookups of the same kind as the recorded run. create_secret runs, upserts
+and rotations included, are replayed as the creation of a text secret of the
+recorded size.
+
+The report gives, for each level, the throughput in runs per second, the
+tail latencies of the runs and of the stand-in calls, the retry
+amplification, i.e. the calls received by the stand-in per call made by an
+unloaded run, the failed runs and the calls refused over capacity, and the
+level past which the throughput stops growing.
+
+Usage, from the directory of the action:
+
+    python -m tests.replay.replay trace.jsonl --concurrency 1 10 100 \
+        --capacity 50 --report replay.json
+"""
+
+import argparse
+import concurrent.futures
+import json
+import math
+import os
+import subprocess
+import sys
+import time
+from typing import Dict, List, NamedTuple, Optional
+
+from src import tracing
+from tests.replay import standin
+
+ACTION_DIR = os.path.dirname(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+)
+ACTION = os.path.basename(ACTION_DIR)
+MAIN_SCRIPT = os.path.join(ACTION_DIR, "src", "main.py")
+
+DEFAULT_LEVELS = [1, 10, 100]
+# a level saturates when its throughput grows by less than this factor
+SATURATION_GROWTH = 1.1
+RUN_TIMEOUT_SECONDS = 300
+MAX_SECRETS = 20
+# the library only checks the length of API keys
+REPLAY_API_KEY = "0" * 128 + ";runas=replay;"
+REPLAY_API_VERSION = "3.1"
+
+LOOKUP_OP = "GET secrets-safe/secrets"
+CREDENTIAL_OP = "GET credentials/{id}"
+CREATE_OP = "POST secrets-safe/folders/{id}/secrets"
+UPDATE_OP = "PUT secrets-safe/secrets/{id}"
+# variables of the environment not passed on to the replayed runs
+DROPPED_VARIABLES = ("TRACE_FILE", "METRICS_DIR", "AGENT_MODE", "AGENT_SOCKET")
+
+
+class RunSpec(NamedTuple):
+    """
+    Inputs of a replayed run.
+    """
+
+    run: str
+    inputs: Dict[str, str]
+    recorded_calls: int
+
+
+def _is_write(op: str) -> bool:
+    return op.startswith(CREATE_OP) or op.startswith(UPDATE_OP)
+
+
+def get_secret_inputs(records: List[dict]) -> Dict[str, str]:
+    """
+    Build the get_secret inputs of a recorded run.
+
+    Args:
+        records (List[dict]): Records of the run.
+
+    Returns:
+        Dict[str, str]: The inputs, empty when the run read no secret.
+    """
+    keys = dict.fromkeys(e["key"] for e in records if e["op"] == LOOKUP_OP)
+    credentials = sum(1 for e in records if e["op"] == CREDENTIAL_OP)
+    inputs = {}
+    if keys:
+        inputs["INPUT_SECRET_PATH"] = json.dumps(
+            [
+                {"path": f"replay/{key}", "output_id": f"secret_{index}"}
+                for index, key in enumerate(list(keys)[:MAX_SECRETS])
+            ]
+        )
+    if credentials:
+        count = min(credentials, MAX_SECRETS, standin.LISTED_ACCOUNTS)
+        inputs["INPUT_MANAGED_ACCOUNT_PATH"] = json.dumps(
+            [
+                {
+                    "path": f"replay_system/account_{index}",
+                    "output_id": f"account_{index}",
+                }
+                for index in range(count)
+            ]
+        )
+    return inputs
+
+
+def create_secret_inputs(records: List[dict]) -> Dict[str, str]:
+    """
+    Build the create_secret inputs of a recorded run, a text secret creation
+    of the size of the first secret written.
+
+    Args:
+        records (List[dict]): Records of the run.
+
+    Returns:
+        Dict[str, str]: The inputs, empty when the run wrote no secret.
+    """
+    writes = [e for e in records if _is_write(e["op"])]
+    if not writes:
+        return {}
+    return {
+        "INPUT_PARENT_FOLDER_NAME": "replay",
+        "INPUT_SECRET_TITLE": f"replay_{writes[0]['key']}",
+        "INPUT_TEXT": "x" * max(1, writes[0]["sent"]),
+        "INPUT_OWNERS": json.dumps([{"user_id": 1}]),
+    }
+
+
+INPUT_BUILDERS = {
+    "get_secret": get_secret_inputs,
+    "create_secret": create_secret_inputs,
+}
+
+
+def build_runs(records: List[dict], action: str = ACTION) -> List[RunSpec]:
+    """
+    Group the records of a trace by run and build the inputs of each run.
+
+    Args:
+        records (List[dict]): Records of the action.
+        action (str): Name of the action.
+
+    Returns:
+        List[RunSpec]: The runs to replay, in trace order, runs without
+        lookups or writes left out.
+    """
+    grouped: Dict[str, List[dict]] = {}
+    for entry in records:
+        grouped.setdefault(entry["run"], []).append(entry)
+    runs = []
+    for run, run_records in grouped.items():
+        inputs = INPUT_BUILDERS[action](run_records)
+        if inputs:
+            runs.append(RunSpec(run, inputs, len(run_records)))
+    return runs
+
+
+def run_environment(spec: RunSpec, api_url: str) -> Dict[str, str]:
+    """
+    Build the environment of a replayed run.
+
+    Args:
+        spec (RunSpec): The run.
+        api_url (str): API URL of the stand-in.
+
+    Returns:
+        Dict[str, str]: The environment variables.
+    """
+    environment = {
+        name: value
+        for name, value in os.environ.items()
+        if not name.startswith("INPUT_") and name not in DROPPED_VARIABLES
+    }
+    environment.update(
+        PYTHONPATH=ACTION_DIR,
+        API_URL=api_url,
+        API_KEY=REPLAY_API_KEY,
+        API_VERSION=REPLAY_API_VERSION,
+        VERIFY_CA="false",
+        GITHUB_OUTPUT=os.devnull,
+        LOG_LEVEL="CRITICAL",
+    )
+    environment.update(spec.inputs)
+    return environment
+
+
+def replay_run(spec: RunSpec, api_url: str) -> Optional[float]:
+    """
+    Run the action with the inputs of a recorded run.
+
+    Args:
+        spec (RunSpec): The run.
+        api_url (str): API URL of the stand-in.
+
+    Returns:
+        float, optional: Duration of the run in seconds, None when it failed.
+    """
+    started = time.perf_counter()
+    try:
+        completed = subprocess.run(
+            [sys.executable, MAIN_SCRIPT],
+            env=run_environment(spec, api_url),
+            cwd=ACTION_DIR,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            timeout=RUN_TIMEOUT_SECONDS,
+        )
+    except subprocess.TimeoutExpired:
+        return None
+    if completed.returncode != 0:
+        return None
+    return time.perf_counter() - started
+
+
+def percentile(values: List[float], rank: float) -> float:
+    """
+    Nearest-rank percentile.
+
+    Args:
+        values (List[float]): The values.
+        rank (float): The percentile, between 0 and 100.
+
+    Returns:
+        float: The percentile, 0 when there are no values.
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(rank / 100 * len(ordered)) - 1)]
+
+
+def replay_level(
+    runs: List[RunSpec],
+    profiles: standin.Profiles,
+    level: int,
+    capacity: int = 0,
+    latency_scale: float = 1.0,
+) -> dict:
+    """
+    Replay every run with the given number of concurrent workers, against a
+    fresh stand-in.
+
+    Args:
+        runs (List[RunSpec]): The runs.
+        profiles (standin.Profiles): Recorded latencies and sizes.
+        level (int): Concurrent workers, each replaying every run.
+        capacity (int): Calls served at once by the stand-in, 0 for no limit.
+        latency_scale (float): Factor applied to the recorded latencies.
+
+    Returns:
+        dict: Results of the level.
+    """
+    specs = [spec for _ in range(level) for spec in runs]
+    with standin.StandIn(profiles, latency_scale, capacity) as server:
+        started = time.perf_counter()
+        with concurrent.futures.ThreadPoolExecutor(level) as executor:
+            durations = list(
+                executor.map(lambda spec: replay_run(spec, server.api_url), specs)
+            )
+        elapsed = time.perf_counter() - started
+        stats = server.stats
+
+    succeeded = [seconds for seconds in durations if seconds is not None]
+    return {
+        "concurrency": level,
+        "runs": len(specs),
+        "failed_runs": len(specs) - len(succeeded),
+        "runs_per_second": round(len(succeeded) / elapsed, 3) if elapsed else 0.0,
+        "run_seconds": {
+            f"p{rank}": round(percentile(succeeded, rank), 4) for rank in (50, 95, 99)
+        },
+        "call_seconds": {
+            f"p{rank}": round(percentile(stats.latencies, rank), 4)
+            for rank in (50, 95, 99)
+        },
+        "calls": stats.total,
+        "rejected_calls": stats.rejected,
+    }
+
+
+def saturation_point(levels: List[dict]) -> Optional[int]:
+    """
+    Find the concurrency level past which the throughput stops growing.
+
+    Args:
+        levels (List[dict]): Results of the levels, by increasing
+            concurrency.
+
+    Returns:
+        int, optional: The level, None when the throughput grew up to the
+        last level.
+    """
+    for previous, current in zip(levels, levels[1:]):
+        if current["runs_per_second"] < previous["runs_per_second"] * SATURATION_GROWTH:
+            return previous["concurrency"]
+    return None
+
+
+def replay(
+    records: List[dict],
+    levels: List[int],
+    capacity: int = 0,
+    latency_scale: float = 1.0,
+    action: str = ACTION,
+) -> dict:
+    """
+    Replay a trace at every concurrency level.
+
+    Args:
+        records (List[dict]): Records of the action.
+        levels (List[int]): Concurrency levels.
+        capacity (int): Calls served at once by the stand-in, 0 for no limit.
+        latency_scale (float): Factor applied to the recorded latencies.
+        action (str): Name of the action.
+
+    Returns:
+        dict: The report.
+    """
+    runs = build_runs(records, action)
+    profiles = standin.Profiles(records)
+    # calls of the runs without contention, the base of the retry amplification
+    unloaded = replay_level(runs, profiles, 1, 0, latency_scale)
+    calls_per_round = max(1, unloaded["calls"])
+
+    results = []
+    for level in sorted(set(levels)):
+        result = replay_level(runs, profiles, level, capacity, latency_scale)
+        result["retry_amplification"] = round(
+            result["calls"] / (calls_per_round * level), 3
+        )
+        results.append(result)
+
+    recorded_retries = sum(entry.get("retries", 0) for entry in records)
+    return {
+        "action": action,
+        "recorded_runs": len({entry["run"] for entry in records}),
+        "replayed_runs": len(runs),
+        "recorded_calls": len(records),
+        "recorded_retry_amplification": round(
+            (len(records) + recorded_retries) / max(1, len(records)), 3
+        ),
+        "recorded_call_seconds_p95": round(
+            percentile([entry["seconds"] for entry in records], 95), 4
+        ),
+        "capacity": capacity,
+        "latency_scale": latency_scale,
+        "levels": results,
+        "saturation_concurrency": saturation_point(results),
+    }
+
+
+def print_report(report: dict) -> None:
+    """
+    Print a report as a table.
+
+    Args:
+        report (dict): The report.
+    """
+    print(
+        f"{report['action']}: {report['replayed_runs']} of "
+        f"{report['recorded_runs']} recorded runs replayed, recorded retry "
+        f"amplification {report['recorded_retry_amplification']}"
+    )
+    print(
+        f"{'conc':>5} {'runs/s':>8} {'run p50':>8} {'run p95':>8} {'run p99':>8} "
+        f"{'call p95':>9} {'call p99':>9} {'retry x':>8} {'failed':>7} {'503':>6}"
+    )
+    for level in report["levels"]:
+        run_seconds, call_seconds = level["run_seconds"], level["call_seconds"]
+        print(
+            f"{level['concurrency']:>5} {level['runs_per_second']:>8.2f} "
+            f"{run_seconds['p50']:>8.3f} {run_seconds['p95']:>8.3f} "
+            f"{run_seconds['p99']:>8.3f} {call_seconds['p95']:>9.4f} "
+            f"{call_seconds['p99']:>9.4f} {level['retry_amplification']:>8.3f} "
+            f"{level['failed_runs']:>7} {level['rejected_calls']:>6}"
+        )
+    saturation = report["saturation_concurrency"]
+    if saturation is None:
+        last = report["levels"][-1]["concurrency"]
+        print(f"Throughput not saturated up to a concurrency of {last}")
+    else:
+        print(f"Throughput saturates at a concurrency of {saturation}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description=f"Replay the {ACTION} runs of a trace against a local stand-in"
+    )
+    parser.add_argument("trace", help="trace file written with TRACE_FILE set")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=DEFAULT_LEVELS)
+    parser.add_argument(
+        "--capacity",
+        type=int,
+        default=0,
+        help="calls served at once by the stand-in, 503 beyond, 0 for no limit",
+    )
+    parser.add_argument("--latency-scale", type=float, default=1.0)
+    parser.add_argument("--report", help="file to write the JSON report to")
+    args = parser.parse_args(argv)
+
+    records = tracing.load(args.trace, ACTION)
+    if not records:
+        print(f"No {ACTION} records in {args.trace}", file=sys.stderr)
+        return 1
+
+    if not build_runs(records):
+        print(
+            f"No {ACTION} run of {args.trace} read or wrote a secret", file=sys.stderr
+        )
+        return 1
+
+    report = replay(records, args.concurrency, args.capacity, args.latency_scale)
+    print_report(report)
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as fh:
+            json.dump(report, fh, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
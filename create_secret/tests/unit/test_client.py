@@ -0,0 +1,234 @@
+import unittest
+from unittest.mock import patch
+
+from secrets_safe_library import exceptions
+from src import client, upsert
+from tests.replay import replay, standin
+
+CONFIG = client.ClientConfig(api_url="https://example.com/BeyondTrust/api/public/v3")
+
+
+class TestClient(unittest.TestCase):
+    """
+    Unit tests for client module:
+    - SecretSpec
+    - SecretsSafeClient.sign_in
+    - SecretsSafeClient.start_sign_in
+    - SecretsSafeClient.create_many
+    - SessionGuard
+    """
+
+    def test_secret_spec(self):
+        """
+        Verify the secret type precedence and the generated password flag.
+        """
+        spec = client.SecretSpec("t", "f", username="u", text="x", password_rule_id=1)
+
+        self.assertEqual(spec.secret_type, upsert.CREDENTIAL_TYPE)
+        self.assertTrue(spec.generates_password)
+        self.assertEqual(spec.desired_digest(), upsert.content_digest("u"))
+        self.assertEqual(client.SecretSpec("t", "f", text="x").secret_type, "Text")
+        self.assertEqual(spec.attributes("id")["folder_id"], "id")
+
+    @patch("src.client.utils.prepare_certificate_info")
+    @patch("src.client.authentication.Authentication")
+    def test_sign_in_with_api_key(self, mock_auth_class, mock_prepare_cert):
+        """
+        Verify that sign_in uses API Key authentication when an API key is
+        configured.
+        """
+        mock_prepare_cert.return_value = ("cert", "key")
+        mock_auth_class.return_value.get_api_access.return_value.status_code = 200
+
+        secrets_client = client.SecretsSafeClient(CONFIG._replace(api_key="my-key"))
+        auth = secrets_client.sign_in()
+
+        self.assertEqual(auth, mock_auth_class.return_value)
+        kwargs = mock_auth_class.call_args.kwargs
+        self.assertEqual(kwargs["api_key"], "my-key")
+        self.assertNotIn("client_id", kwargs)
+        self.assertEqual(kwargs["certificate"], "cert")
+
+    @patch("src.client.utils.prepare_certificate_info")
+    @patch("src.client.authentication.Authentication")
+    def test_sign_in_with_client_credentials(self, mock_auth_class, mock_prepare_cert):
+        """
+        Verify that sign_in falls back to OAuth client credentials, and that
+        a failed sign-in raises AuthenticationFailure.
+        """
+        mock_prepare_cert.return_value = ("cert", "key")
+        response = mock_auth_class.return_value.get_api_access.return_value
+        response.status_code = 401
+        response.text = "denied"
+
+        secrets_client = client.SecretsSafeClient(
+            CONFIG._replace(client_id="client-id", client_secret="client-secret")
+        )
+        with self.assertRaises(exceptions.AuthenticationFailure):
+            secrets_client.sign_in()
+
+        kwargs = mock_auth_class.call_args.kwargs
+        self.assertEqual(kwargs["client_id"], "client-id")
+        self.assertEqual(kwargs["client_secret"], "client-secret")
+        self.assertNotIn("api_key", kwargs)
+
+    @patch("src.client.authentication.Authentication")
+    def test_background_sign_in(self, mock_auth_class):
+        """
+        Verify that a sign-in started in the background is waited for, and
+        that closing the client during a failed one does not raise.
+        """
+        response = mock_auth_class.return_value.get_api_access.return_value
+        response.status_code = 200
+
+        secrets_client = client.SecretsSafeClient(CONFIG._replace(api_key="my-key"))
+        secrets_client.start_sign_in()
+        with secrets_client:
+            self.assertIs(
+                secrets_client.authentication_obj, mock_auth_class.return_value
+            )
+
+        mock_auth_class.return_value.get_api_access.assert_called_once()
+        mock_auth_class.return_value.sign_app_out.assert_called_once()
+
+        response.status_code = 401
+        secrets_client = client.SecretsSafeClient(CONFIG._replace(api_key="my-key"))
+        secrets_client.start_sign_in()
+        with self.assertRaises(exceptions.AuthenticationFailure):
+            secrets_client.wait_signed_in()
+
+        secrets_client.start_sign_in()
+        secrets_client.close()
+        mock_auth_class.return_value.sign_app_out.assert_called_once()
+
+    @patch("src.client.password_rules.PasswordRule")
+    @patch("src.client.streaming.StreamingSecretsSafe")
+    @patch("src.client.get_folder")
+    @patch("src.client.folders.Folder")
+    @patch("src.client.authentication.Authentication")
+    def test_create_many(
+        self,
+        mock_auth_class,
+        mock_folder_class,
+        mock_get_folder,
+        mock_secrets_safe_class,
+        mock_password_rule_class,
+    ):
+        """
+        Verify that a batch looks each folder up and lists it once, creates
+        missing secrets, skips unchanged ones, generates passwords and keeps
+        going after a failure.
+        """
+        mock_auth_class.return_value.get_api_access.return_value.status_code = 200
+        mock_get_folder.side_effect = lambda _, name: (
+            {"Id": f"id-{name}", "Name": name} if name == "apps" else None
+        )
+        secrets_safe_obj = mock_secrets_safe_class.return_value
+        secrets_safe_obj.list_secrets_by_folder_id.return_value = [
+            {"Id": "abc", "Title": "existing", "SecretType": "Text"}
+        ]
+        secrets_safe_obj.get_text_secret_by_id.return_value = {"Text": "same"}
+        mock_password_rule_class.return_value.get_by_id.return_value = {}
+
+        with client.SecretsSafeClient(CONFIG) as secrets_client:
+            results = secrets_client.create_many(
+                [
+                    client.SecretSpec("existing", "apps", text="same"),
+                    client.SecretSpec(
+                        "db", "apps", username="admin", password_rule_id=7
+                    ),
+                    client.SecretSpec("other", "missing", text="x"),
+                ],
+                if_exists=upsert.IF_EXISTS_UPDATE,
+            )
+
+        self.assertEqual(
+            [(r.title, r.action) for r in results],
+            [("existing", upsert.SKIP), ("db", upsert.CREATE), ("other", None)],
+        )
+        self.assertTrue(results[1].password)
+        self.assertIn("missing", results[2].error)
+        self.assertEqual(mock_get_folder.call_count, 2)
+        secrets_safe_obj.list_secrets_by_folder_id.assert_called_once_with("id-apps")
+        kwargs = secrets_safe_obj.create_secret.call_args.kwargs
+        self.assertEqual(kwargs["password"], results[1].password)
+        mock_auth_class.return_value.sign_app_out.assert_called_once()
+
+    @patch("src.client.password_rules.PasswordRule")
+    @patch("src.client.streaming.StreamingSecretsSafe")
+    @patch("src.client.get_folder")
+    @patch("src.client.folders.Folder")
+    @patch("src.client.authentication.Authentication")
+    def test_create_many_duplicate_titles(
+        self,
+        mock_auth_class,
+        mock_folder_class,
+        mock_get_folder,
+        mock_secrets_safe_class,
+        mock_password_rule_class,
+    ):
+        """
+        Verify that a title created earlier in the batch is skipped or updated
+        by a later spec with the same title, instead of created twice.
+        """
+        mock_auth_class.return_value.get_api_access.return_value.status_code = 200
+        mock_get_folder.return_value = {"Id": "id-apps", "Name": "apps"}
+        secrets_safe_obj = mock_secrets_safe_class.return_value
+        secrets_safe_obj.list_secrets_by_folder_id.return_value = []
+        secrets_safe_obj.create_secret.return_value = {"Id": "new", "Title": "dup"}
+        secrets_safe_obj.get_text_secret_by_id.return_value = {"Text": "first"}
+        specs = [
+            client.SecretSpec("dup", "apps", text="first"),
+            client.SecretSpec("dup", "apps", text="second"),
+        ]
+
+        for if_exists, second in (
+            (upsert.IF_EXISTS_SKIP, upsert.SKIP),
+            (upsert.IF_EXISTS_UPDATE, upsert.UPDATE),
+        ):
+            with self.subTest(if_exists=if_exists):
+                secrets_safe_obj.create_secret.reset_mock()
+                secrets_safe_obj.update_secret.reset_mock()
+                with client.SecretsSafeClient(CONFIG) as secrets_client:
+                    results = secrets_client.create_many(specs, if_exists=if_exists)
+
+                self.assertEqual([r.action for r in results], [upsert.CREATE, second])
+                secrets_safe_obj.create_secret.assert_called_once()
+                if second == upsert.UPDATE:
+                    self.assertEqual(
+                        secrets_safe_obj.update_secret.call_args.args[0], "new"
+                    )
+
+    def test_create_many_signs_in_after_failure(self):
+        """
+        Verify that after a failed secret, which signs the session out, the
+        next one is written under a new sign-in against the stand-in, which
+        refuses calls without the cookie of an open session.
+        """
+        specs = [
+            client.SecretSpec(title, "apps", text="x", owners=[{"user_id": 1}])
+            for title in ("first", "middle", "last")
+        ]
+        failures = [("POST secrets-safe/folders/{id}/secrets/text", 2)]
+
+        with standin.StandIn(
+            standin.Profiles([]), check_sessions=True, failures=failures
+        ) as server:
+            config = client.ClientConfig(
+                api_url=server.api_url,
+                api_key=replay.REPLAY_API_KEY,
+                api_version=replay.REPLAY_API_VERSION,
+            )
+            with client.SecretsSafeClient(config) as secrets_client:
+                results = secrets_client.create_many(specs)
+
+        self.assertEqual(
+            [r.action for r in results], [upsert.CREATE, None, upsert.CREATE]
+        )
+        self.assertIn("403", results[1].error)
+        self.assertEqual(server.stats.calls["POST auth/signappin"], 2)
+        self.assertEqual(server.sessions, set())
+
+
+if __name__ == "__main__":
+    unittest.main()
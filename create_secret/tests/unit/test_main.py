@@ -1,15 +1,27 @@
+import os
+import tempfile
 import unittest
 from unittest.mock import MagicMock, patch
 
 from secrets_safe_library.exceptions import CreationError, OptionsError
-from src.main import create_secret, get_folder, main, set_authentication
+from src import upsert
+from src.main import (
+    build_plan,
+    choice_setting,
+    create_secret,
+    get_folder,
+    main,
+    number_setting,
+    parse_json_parameters,
+    rotate_secrets,
+    run,
+)
 
 
 class TestMain(unittest.TestCase):
     """
     Unit tests for main module functions:
     - get_folder
-    - set_authentication
     - main
     """
 
@@ -42,92 +54,99 @@ class TestMain(unittest.TestCase):
         self.assertEqual(result, {"Name": "MyFolder", "Id": 1})
         folders_obj.list_folders.assert_called_once_with(folder_name="MyFolder")
 
-    @patch("src.main.utils.prepare_certificate_info")
-    @patch("src.main.authentication.Authentication")
-    def test_set_authentication_with_api_key(
-        self,
-        mock_auth_class,
-        mock_prepare_cert,
-    ):
-        """
-        Verify that set_authentication uses API Key authentication
-        when the API_KEY environment variable is present.
-        """
-        session = MagicMock()
-
-        mock_prepare_cert.return_value = ("cert", "key")
-
-        mock_auth_instance = MagicMock()
-        mock_auth_instance.get_api_access.return_value.status_code = 200
-        mock_auth_class.return_value = mock_auth_instance
-
-        with patch("src.main.API_KEY", "my-api-key"), patch(
-            "src.main.API_VERSION", None
-        ):
-
-            auth = set_authentication(session)
-
-        mock_prepare_cert.assert_called_once()
-        mock_auth_class.assert_called_once()
-        self.assertEqual(auth, mock_auth_instance)
-
-    @patch("src.main.Retry")
-    @patch("src.main.utils.prepare_certificate_info")
-    @patch("src.main.authentication.Authentication")
-    def test_set_authentication_with_client_credentials(
-        self,
-        mock_auth_class,
-        mock_prepare_cert,
-        mock_retry,
-    ):
-        """
-        Verify that set_authentication falls back to OAuth client
-        credentials authentication when API_KEY is not provided.
-        """
-        session = MagicMock()
-
-        mock_retry.return_value = "req"
-        mock_prepare_cert.return_value = ("cert", "key")
-
-        mock_auth_instance = MagicMock()
-        mock_auth_instance.get_api_access.return_value.status_code = 200
-        mock_auth_class.return_value = mock_auth_instance
-
-        with patch("src.main.API_KEY", None), patch(
-            "src.main.CLIENT_ID", "client-id"
-        ), patch("src.main.CLIENT_SECRET", "client-secret"):
-
-            auth = set_authentication(session)
-
-        self.assertEqual(auth, mock_auth_instance)
-
-    @patch("src.main.requests.Session")
+    @patch("src.main.prepare_secret")
     @patch("src.main.create_secret")
-    @patch("src.main.set_authentication")
+    @patch("src.main.client.SecretsSafeClient")
     def test_main_success(
         self,
-        mock_set_authentication,
+        mock_client_class,
         mock_create_secret,
-        mock_session_class,
+        mock_prepare_secret,
     ):
         """
         Verify that main executes the full happy path:
-        - Creates a requests session
-        - Authenticates successfully
+        - Signs in with the client built from the action settings, while the
+          secret is prepared
         - Creates a secret
         - Signs out from the authentication session
         """
-        mock_session = MagicMock()
-        mock_session_class.return_value.__enter__.return_value = mock_session
+        mock_client = mock_client_class.return_value
+        mock_client.__enter__.return_value = mock_client
+
+        with patch("src.main.API_URL", "https://example.com/api"):
+            main()
+
+        config = mock_client_class.call_args.args[0]
+        self.assertEqual(config.api_url, "https://example.com/api")
+        mock_client.start_sign_in.assert_called_once()
+        mock_client.wait_signed_in.assert_called_once()
+        mock_create_secret.assert_called_once_with(
+            mock_client.authentication_obj, mock_prepare_secret.return_value
+        )
+        mock_client.__exit__.assert_called_once()
 
-        mock_auth = MagicMock()
-        mock_set_authentication.return_value = mock_auth
+    @patch("src.main.client.SecretsSafeClient")
+    @patch("src.main.common.show_error")
+    def test_invalid_numeric_settings(self, mock_show_error, mock_client_class):
+        """
+        Verify that an invalid numeric, out of range or unknown setting falls
+        back to its default when the module is imported, and fails the run
+        before signing in.
+        """
+        mock_show_error.side_effect = SystemExit(1)
+        invalid = []
+
+        with patch("src.main.INVALID_SETTINGS", invalid), patch.dict(
+            os.environ,
+            {
+                "STARTUP_JITTER_SECONDS": "1s",
+                "RATE_LIMIT_RPS": "2.5",
+                "LOG_SAMPLE_RATE": "2",
+                "LOG_FORMAT": "xml",
+            },
+        ):
+            self.assertEqual(number_setting("STARTUP_JITTER_SECONDS", 0.0), 0.0)
+            self.assertEqual(number_setting("RATE_LIMIT_RPS", 0.0), 2.5)
+            self.assertEqual(
+                number_setting("LOG_SAMPLE_RATE", 1.0, valid=lambda r: r <= 1), 1.0
+            )
+            self.assertEqual(choice_setting("LOG_FORMAT", ("text",), "text"), "text")
+            self.assertEqual(
+                invalid,
+                [
+                    "STARTUP_JITTER_SECONDS='1s'",
+                    "LOG_SAMPLE_RATE='2'",
+                    "LOG_FORMAT='xml'",
+                ],
+            )
+
+            with self.assertRaises(SystemExit):
+                run()
+
+        self.assertIn("STARTUP_JITTER_SECONDS", mock_show_error.call_args.args[0])
+        mock_client_class.assert_not_called()
+
+    @patch("src.main.write_metrics")
+    @patch("src.main.client.SecretsSafeClient")
+    @patch("src.main.common.show_error")
+    def test_run_invalid_inputs_while_signing_in(
+        self, mock_show_error, mock_client_class, mock_write_metrics
+    ):
+        """
+        Verify that invalid inputs are reported while signing in, and that the
+        client is closed without creating anything.
+        """
+        mock_show_error.side_effect = SystemExit(1)
+        mock_client = mock_client_class.return_value
 
-        main()
+        with patch("src.main.ROTATE_SECRETS", '[{"output_id": "new"}]'):
+            with self.assertRaises(SystemExit):
+                run()
 
-        mock_set_authentication.assert_called_once_with(mock_session)
-        mock_create_secret.assert_called_once_with(mock_auth)
-        mock_auth.sign_app_out.assert_called_once()
+        self.assertIn("Invalid rotate_secrets", mock_show_error.call_args.args[0])
+        mock_client.start_sign_in.assert_called_once()
+        mock_client.close.assert_called_once()
+        mock_client.wait_signed_in.assert_not_called()
 
     @patch("src.main.common.show_error")
     @patch("src.main.secrets_safe.SecretsSafe")
@@ -246,6 +265,408 @@ class TestMain(unittest.TestCase):
 
         mock_show_error.assert_called_once()
 
+    @patch("src.main.common.show_error")
+    @patch("src.main.rotation.PasswordGenerator")
+    @patch("src.main.client.plan_secret")
+    @patch("src.main.secrets_safe.SecretsSafe")
+    @patch("src.main.get_folder")
+    @patch("src.main.folders.Folder")
+    def test_create_secret_value_errors(
+        self,
+        mock_folder_class,
+        mock_get_folder,
+        mock_secrets_safe_class,
+        mock_plan_secret,
+        mock_generator_class,
+        mock_show_error,
+    ):
+        """
+        Verify that only a failed password generation is reported as such,
+        and other invalid values as invalid parameters.
+        """
+        mock_show_error.side_effect = SystemExit(1)
+        mock_get_folder.return_value = {"Id": 123, "Name": "TestFolder"}
+        mock_plan_secret.side_effect = ValueError("Secret is too large")
+
+        with patch("src.main.TITLE", "TestSecret"), self.assertRaises(SystemExit):
+            create_secret(MagicMock())
+
+        self.assertIn(
+            "Invalid or missing parameters", mock_show_error.call_args.args[0]
+        )
+
+        mock_plan_secret.side_effect = None
+        mock_plan_secret.return_value = (upsert.CREATE, None)
+        mock_generator_class.return_value.generate.side_effect = ValueError(
+            "Password rule cannot be satisfied"
+        )
+        with patch("src.main.TITLE", "TestSecret"), patch(
+            "src.main.USERNAME", "svc"
+        ), patch("src.main.PASSWORD_RULE_ID", "5"), self.assertRaises(SystemExit):
+            create_secret(MagicMock())
+
+        self.assertIn("Error generating password", mock_show_error.call_args.args[0])
+
+    @patch("src.main.common.create_file")
+    @patch("src.main.streaming.StreamingSecretsSafe")
+    @patch("src.main.streaming.resolve_workspace_path")
+    @patch("src.main.get_folder")
+    @patch("src.main.folders.Folder")
+    def test_create_secret_streams_workspace_file(
+        self,
+        mock_folder_class,
+        mock_get_folder,
+        mock_resolve,
+        mock_streaming_class,
+        mock_create_file,
+    ):
+        """
+        Verify that create_secret streams FILE_PATH from the workspace
+        without staging the file content.
+        """
+        mock_get_folder.return_value = {"Id": 123, "Name": "TestFolder"}
+        mock_resolve.return_value = "/github/workspace/dist/keystore.p12"
+        mock_streaming_obj = MagicMock()
+        mock_streaming_class.return_value = mock_streaming_obj
+
+        with patch("src.main.TITLE", "TestSecret"), patch(
+            "src.main.FILE_PATH", "dist/keystore.p12"
+        ), patch("src.main.FILE_CONTENT", "ignored"), patch(
+            "src.main.FILE_NAME", "ignored.txt"
+        ):
+            create_secret(MagicMock())
+
+        mock_create_file.assert_not_called()
+        _, kwargs = mock_streaming_obj.create_secret.call_args
+        self.assertEqual(kwargs["file_path"], "/github/workspace/dist/keystore.p12")
+
+    @patch("src.main.common.show_error")
+    @patch("src.main.secrets_safe.SecretsSafe")
+    @patch("src.main.get_folder")
+    @patch("src.main.folders.Folder")
+    def test_create_secret_if_exists_update(
+        self,
+        mock_folder_class,
+        mock_get_folder,
+        mock_secrets_safe_class,
+        mock_show_error,
+    ):
+        """
+        Verify that with if_exists "update" an existing secret is updated
+        only when its content changed, and never created again.
+        """
+        mock_get_folder.return_value = {"Id": 123, "Name": "TestFolder"}
+        mock_secrets_safe_obj = MagicMock()
+        mock_secrets_safe_class.return_value = mock_secrets_safe_obj
+        mock_secrets_safe_obj.list_secrets_by_folder_id.return_value = [
+            {"Id": "abc", "Title": "TestSecret", "SecretType": "Text"}
+        ]
+
+        with patch("src.main.TITLE", "TestSecret"), patch(
+            "src.main.TEXT", "new text"
+        ), patch("src.main.IF_EXISTS", "update"):
+            mock_secrets_safe_obj.get_text_secret_by_id.return_value = {
+                "Text": "new text"
+            }
+            create_secret(MagicMock())
+            mock_secrets_safe_obj.update_secret.assert_not_called()
+
+            mock_secrets_safe_obj.get_text_secret_by_id.return_value = {
+                "Text": "old text"
+            }
+            create_secret(MagicMock())
+
+        mock_secrets_safe_obj.create_secret.assert_not_called()
+        args, kwargs = mock_secrets_safe_obj.update_secret.call_args
+        self.assertEqual(args, ("abc",))
+        self.assertEqual(kwargs["text"], "new text")
+        self.assertEqual(kwargs["folder_id"], 123)
+        mock_show_error.assert_not_called()
+
+    @patch("src.main.common.show_error")
+    @patch("src.main.secrets_safe.SecretsSafe")
+    @patch("src.main.get_folder")
+    @patch("src.main.folders.Folder")
+    def test_create_secret_if_exists_skip(
+        self,
+        mock_folder_class,
+        mock_get_folder,
+        mock_secrets_safe_class,
+        mock_show_error,
+    ):
+        """
+        Verify that with if_exists "skip" an existing secret is neither read
+        nor written, while a missing one is created.
+        """
+        mock_get_folder.return_value = {"Id": 123, "Name": "TestFolder"}
+        mock_secrets_safe_obj = MagicMock()
+        mock_secrets_safe_class.return_value = mock_secrets_safe_obj
+        mock_secrets_safe_obj.list_secrets_by_folder_id.return_value = [
+            {"Id": "abc", "Title": "Existing", "SecretType": "Credential"}
+        ]
+
+        with patch("src.main.USERNAME", "user"), patch("src.main.IF_EXISTS", "skip"):
+            with patch("src.main.TITLE", "Existing"):
+                create_secret(MagicMock())
+            mock_secrets_safe_obj.create_secret.assert_not_called()
+
+            with patch("src.main.TITLE", "New"):
+                create_secret(MagicMock())
+
+        mock_secrets_safe_obj.get_secret_by_id.assert_not_called()
+        mock_secrets_safe_obj.update_secret.assert_not_called()
+        mock_secrets_safe_obj.create_secret.assert_called_once()
+        mock_show_error.assert_not_called()
+
+    @patch("src.main.password_rules.PasswordRule")
+    @patch("src.main.secrets_safe.SecretsSafe")
+    @patch("src.main.get_folder")
+    @patch("src.main.folders.Folder")
+    def test_create_secret_publishes_generated_password(
+        self,
+        mock_folder_class,
+        mock_get_folder,
+        mock_secrets_safe_class,
+        mock_password_rule_class,
+    ):
+        """
+        Verify that a password generated from the password rule is written
+        and published as a masked output without reading the secret back.
+        """
+        mock_get_folder.return_value = {"Id": 123, "Name": "TestFolder"}
+        mock_secrets_safe_obj = MagicMock()
+        mock_secrets_safe_class.return_value = mock_secrets_safe_obj
+        mock_password_rule_class.return_value.get_by_id.return_value = {
+            "MaximumLength": 24
+        }
+
+        with tempfile.NamedTemporaryFile(mode="r", delete=False) as output:
+            self.addCleanup(os.unlink, output.name)
+            with patch.dict(os.environ, {"GITHUB_OUTPUT": output.name}), patch(
+                "src.main.TITLE", "TestSecret"
+            ), patch("src.main.USERNAME", "svc"), patch(
+                "src.main.PASSWORD_RULE_ID", "5"
+            ), patch(
+                "src.main.OUTPUT_ID", "db_password"
+            ), patch(
+                "builtins.print"
+            ) as mock_print:
+                create_secret(MagicMock())
+
+            content = output.read()
+
+        _, kwargs = mock_secrets_safe_obj.create_secret.call_args
+        password = kwargs["password"]
+        self.assertEqual(len(password), 24)
+        self.assertEqual(kwargs["password_rule_id"], 5)
+        self.assertIn(f"\n{password}\n", content)
+        self.assertTrue(content.startswith("db_password<<"))
+        mock_print.assert_called_once_with(f"::add-mask ::{password}")
+        mock_secrets_safe_obj.get_secret_by_id.assert_not_called()
+
+    @patch("src.main.common.show_error")
+    @patch("src.main.publish_output")
+    @patch("src.main.password_rules.PasswordRule")
+    @patch("src.main.secrets_safe.SecretsSafe")
+    @patch("src.main.get_folder")
+    @patch("src.main.folders.Folder")
+    def test_rotate_secrets(
+        self,
+        mock_folder_class,
+        mock_get_folder,
+        mock_secrets_safe_class,
+        mock_password_rule_class,
+        mock_publish_output,
+        mock_show_error,
+    ):
+        """
+        Verify that rotation lists the folder once, rotates every found
+        credential, publishes the new passwords and reports missing secrets
+        at the end.
+        """
+        mock_get_folder.return_value = {"Id": 123, "Name": "TestFolder"}
+        mock_secrets_safe_obj = MagicMock()
+        mock_secrets_safe_class.return_value = mock_secrets_safe_obj
+        mock_secrets_safe_obj.list_secrets_by_folder_id.return_value = [
+            {"Id": "1", "Title": "db", "Username": "db_user"},
+            {"Id": "2", "Title": "api", "Username": "api_user"},
+        ]
+        mock_password_rule_class.return_value.get_by_id.return_value = {}
+
+        with patch(
+            "src.main.ROTATE_SECRETS",
+            '[{"title": "db", "output_id": "db_password"},'
+            ' {"title": "missing"}, {"title": "api"}]',
+        ), patch("src.main.PASSWORD_RULE_ID", "5"):
+            rotate_secrets(MagicMock())
+
+        mock_secrets_safe_obj.list_secrets_by_folder_id.assert_called_once_with(123)
+        mock_password_rule_class.return_value.get_by_id.assert_called_once_with(5)
+        self.assertEqual(mock_secrets_safe_obj.update_secret.call_count, 2)
+        _, kwargs = mock_secrets_safe_obj.update_secret.call_args_list[0]
+        mock_publish_output.assert_called_once_with("db_password", kwargs["password"])
+        mock_show_error.assert_called_once()
+        self.assertIn("missing", mock_show_error.call_args[0][0])
+
+    @patch("src.main.common.show_error")
+    @patch("src.main.publish_output")
+    @patch("src.main.password_rules.PasswordRule")
+    @patch("src.main.secrets_safe.SecretsSafe")
+    @patch("src.main.get_folder")
+    @patch("src.main.folders.Folder")
+    def test_rotate_secrets_signs_in_after_failure(
+        self,
+        mock_folder_class,
+        mock_get_folder,
+        mock_secrets_safe_class,
+        mock_password_rule_class,
+        mock_publish_output,
+        mock_show_error,
+    ):
+        """
+        Verify that after a failed rotation, which signs the session out, the
+        next entry is rotated under a new sign-in with the owners input.
+        """
+        authentication_obj = MagicMock()
+        authentication_obj.get_api_access.return_value.status_code = 200
+        mock_get_folder.return_value = {"Id": 123, "Name": "TestFolder"}
+        mock_secrets_safe_obj = mock_secrets_safe_class.return_value
+        mock_secrets_safe_obj.list_secrets_by_folder_id.return_value = [
+            {"Id": "1", "Title": "db", "Username": "db_user", "Owners": []},
+            {"Id": "2", "Title": "api", "Username": "api_user", "Owners": []},
+        ]
+        mock_password_rule_class.return_value.get_by_id.return_value = {}
+
+        def update_secret(secret_id, **kwargs):
+            if secret_id == "1":
+                authentication_obj.sign_app_out()
+                raise OptionsError("denied")
+            authentication_obj.get_api_access.assert_called_once()
+
+        mock_secrets_safe_obj.update_secret.side_effect = update_secret
+
+        with patch(
+            "src.main.ROTATE_SECRETS", '[{"title": "db"}, {"title": "api"}]'
+        ), patch("src.main.OWNERS", '[{"user_id": 1}]'):
+            rotate_secrets(authentication_obj)
+
+        self.assertEqual(mock_secrets_safe_obj.update_secret.call_count, 2)
+        _, kwargs = mock_secrets_safe_obj.update_secret.call_args
+        self.assertEqual(kwargs["owners"], [{"user_id": 1}])
+        authentication_obj.get_api_access.assert_called_once()
+        mock_show_error.assert_called_once()
+        self.assertIn("db", mock_show_error.call_args[0][0])
+
+    @patch("src.main.API_URL", "https://example.com/BeyondTrust/api/public/v3")
+    @patch("src.main.API_KEY", "api-key")
+    def test_build_plan(self):
+        """
+        Verify that a dry run of an upsert plans the existing secret lookup,
+        the password rule and the write, without signing in.
+        """
+        with patch("src.main.TITLE", "db"), patch(
+            "src.main.PARENT_FOLDER_NAME", "folder"
+        ), patch("src.main.USERNAME", "db_user"), patch(
+            "src.main.PASSWORD_RULE_ID", "5"
+        ), patch(
+            "src.main.IF_EXISTS", "update"
+        ):
+            run_plan = build_plan()
+
+        self.assertEqual(
+            [(call.stage, call.method) for call in run_plan.calls],
+            [
+                ("auth", "POST"),
+                ("folders", "GET"),
+                ("lookups", "GET"),
+                ("lookups", "GET"),
+                ("writes", "POST"),
+                ("sign_out", "POST"),
+            ],
+        )
+        self.assertEqual(
+            run_plan.calls[-2].endpoint, "Secrets-Safe/Folders/{folderId}/secrets"
+        )
+
+    @patch("src.main.API_URL", "https://example.com/BeyondTrust/api/public/v3")
+    @patch("src.main.API_KEY", "api-key")
+    @patch("src.main.common.show_error")
+    def test_build_plan_file_path(self, mock_show_error):
+        """
+        Verify that a dry run checks file_path like a real run, rejecting
+        paths outside of the workspace and missing files.
+        """
+        mock_show_error.side_effect = SystemExit(1)
+
+        with tempfile.TemporaryDirectory() as workspace:
+            with open(os.path.join(workspace, "cert.p12"), "wb") as file:
+                file.write(b"cert")
+
+            for file_path in ("../cert.p12", "missing.p12"):
+                with self.subTest(file_path=file_path), patch(
+                    "src.main.WORKSPACE", workspace
+                ), patch("src.main.TITLE", "cert"), patch(
+                    "src.main.FILE_PATH", file_path
+                ), self.assertRaises(
+                    SystemExit
+                ):
+                    build_plan()
+                self.assertIn(
+                    "Invalid or missing file path", mock_show_error.call_args.args[0]
+                )
+
+            with patch("src.main.WORKSPACE", workspace), patch(
+                "src.main.TITLE", "cert"
+            ), patch("src.main.FILE_PATH", "cert.p12"):
+                run_plan = build_plan()
+
+        self.assertEqual(
+            run_plan.calls[-2].endpoint, "Secrets-Safe/Folders/{folderId}/secrets/file"
+        )
+
+    @patch("src.main.API_URL", "https://example.com/BeyondTrust/api/public/v3")
+    @patch("src.main.API_KEY", "api-key")
+    def test_build_plan_rotation(self):
+        """
+        Verify that a dry run of a rotation plans one update per secret and
+        one lookup per password rule.
+        """
+        with patch(
+            "src.main.ROTATE_SECRETS",
+            '[{"title": "db", "password_rule_id": 3}, {"title": "api"},'
+            ' {"title": "cache"}]',
+        ), patch("src.main.PASSWORD_RULE_ID", "5"):
+            run_plan = build_plan()
+
+        calls = {(call.stage, call.endpoint): call for call in run_plan.calls}
+        self.assertEqual(calls[("lookups", "PasswordRules/{id}")].count, 2)
+        self.assertEqual(calls[("writes", "Secrets-Safe/Secrets/{id}")].count, 3)
+        self.assertEqual(run_plan.request_count, 9)
+
+    @patch("src.main.common.show_error")
+    def test_parse_json_parameters(self, mock_show_error):
+        """
+        Verify that owners and urls are decoded once, and that the errors of
+        both are reported together with their location.
+        """
+        with patch("src.main.OWNERS", '[{"owner_id": 1}]'), patch(
+            "src.main.URLS", '{"url": "https://example.com"}'
+        ):
+            self.assertEqual(
+                parse_json_parameters(),
+                ([{"owner_id": 1}], [{"url": "https://example.com"}]),
+            )
+        mock_show_error.assert_not_called()
+
+        with patch("src.main.OWNERS", "[1]"), patch("src.main.URLS", "not json"):
+            parse_json_parameters()
+
+        message = mock_show_error.call_args[0][0]
+        self.assertIn(
+            "owners[0]: Invalid JSON, each owner must be a JSON object", message
+        )
+        self.assertIn("urls: Invalid JSON input", message)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,254 @@
+import string
+import unittest
+from unittest.mock import MagicMock
+
+from secrets_safe_library import secrets_safe
+from secrets_safe_library.exceptions import UpdateError
+from src import rotation
+
+SECRET_ID = "4b2e8c1a-9f3d-4a6b-8c7e-1d2f3a4b5c6d"
+FOLDER_ID = "7f1a6b0e-5c1d-4c7e-9d0a-2b3c4d5e6f70"
+
+
+class TestRotation(unittest.TestCase):
+    """
+    Unit tests for rotation module:
+    - generate_password
+    - PasswordGenerator
+    - parse_rotation_entries
+    - existing_owners
+    - existing_urls
+    - rotate_secret
+    """
+
+    def test_generate_password_follows_rule(self):
+        """
+        Verify that generated passwords respect the length, the permitted and
+        required character classes and the first character requirement.
+        """
+        rule = {
+            "MinimumLength": 12,
+            "MaximumLength": 16,
+            "FirstCharacterRequirement": "A",
+            "LowercaseRequirement": "R",
+            "UppercaseRequirement": "N",
+            "NumericRequirement": "R",
+            "SymbolRequirement": "R",
+            "ValidLowercaseCharacters": list("abc"),
+            "ValidSymbols": ["#", "!"],
+        }
+
+        for _ in range(50):
+            password = rotation.generate_password(rule)
+            self.assertEqual(len(password), 16)
+            self.assertIn(password[0], "abc")
+            self.assertTrue(set(password) <= set("abc" + string.digits + "#!"))
+            self.assertTrue(set(password) & set(string.digits))
+            self.assertTrue(set(password) & set("#!"))
+
+    def test_generate_password_rejects_impossible_rule(self):
+        """
+        Verify that a rule permitting no characters raises ValueError.
+        """
+        rule = {
+            "LowercaseRequirement": "N",
+            "UppercaseRequirement": "N",
+            "NumericRequirement": "N",
+        }
+        with self.assertRaises(ValueError):
+            rotation.generate_password(rule)
+
+    def test_password_generator_fetches_each_rule_once(self):
+        """
+        Verify that each password rule is fetched once per run.
+        """
+        password_rule_obj = MagicMock()
+        password_rule_obj.get_by_id.return_value = {"MaximumLength": 20}
+        generator = rotation.PasswordGenerator(password_rule_obj)
+
+        passwords = {generator.generate(7) for _ in range(3)}
+
+        password_rule_obj.get_by_id.assert_called_once_with(7)
+        self.assertEqual(len(passwords), 3)
+        self.assertEqual(len(generator.generate(None)), 32)
+
+    def test_parse_rotation_entries(self):
+        """
+        Verify that entries are parsed and invalid ones rejected.
+        """
+        entries = rotation.parse_rotation_entries(
+            '[{"title": "db", "output_id": "db_password", "password_rule_id": 3},'
+            ' {"title": "api"}]'
+        )
+        self.assertEqual(
+            entries,
+            [
+                rotation.RotationEntry("db", "db_password", 3),
+                rotation.RotationEntry("api"),
+            ],
+        )
+
+        for value in (
+            "not json",
+            '[{"output_id": "x"}]',
+            '{"title": "a", "output_id": "a b"}',
+        ):
+            with self.assertRaises(ValueError):
+                rotation.parse_rotation_entries(value)
+
+    def test_rotate_secret(self):
+        """
+        Verify that the credential is updated with a generated password that
+        is returned for publishing, and that other secret types are refused.
+        """
+        secrets_safe_obj = MagicMock()
+        secrets_safe_obj.get_secret_by_id.return_value = {"Username": "svc"}
+        generator = MagicMock()
+        generator.generate.return_value = "n3w-p4ss"
+        record = {"Id": "abc", "Title": "db", "Description": "database"}
+
+        password = rotation.rotate_secret(
+            secrets_safe_obj, generator, "folder", record, 3
+        )
+
+        self.assertEqual(password, "n3w-p4ss")
+        generator.generate.assert_called_once_with(3)
+        args, kwargs = secrets_safe_obj.update_secret.call_args
+        self.assertEqual(args, ("abc",))
+        self.assertEqual(kwargs["username"], "svc")
+        self.assertEqual(kwargs["password"], "n3w-p4ss")
+        self.assertEqual(kwargs["description"], "database")
+        self.assertEqual(kwargs["owners"], [])
+
+        with self.assertRaises(UpdateError):
+            rotation.rotate_secret(
+                secrets_safe_obj, generator, "folder", {"SecretType": "Text"}, 3
+            )
+
+    def test_existing_owners(self):
+        """
+        Verify that the owners of a record are converted to the library
+        fields, without empty values.
+        """
+        record = {
+            "Owners": [
+                {"UserId": 1, "GroupId": None, "Name": "admin", "Email": None},
+                {"OwnerId": 2, "Owner": "ops", "Email": "ops@example.com"},
+            ]
+        }
+
+        self.assertEqual(
+            rotation.existing_owners(record),
+            [
+                {"user_id": 1, "name": "admin"},
+                {"owner_id": 2, "owner": "ops", "email": "ops@example.com"},
+            ],
+        )
+        self.assertEqual(rotation.existing_owners({}), [])
+
+    def test_rotate_secret_passes_library_validation(self):
+        """
+        Verify that the update request of a rotation passes the validation
+        of the library for each API version, keeping the owners of the
+        secret or setting the given ones.
+        """
+        owners = {
+            "3.0": [{"OwnerId": 2, "Owner": "ops", "Email": None}],
+            "3.1": [{"UserId": 1, "GroupId": None, "Name": "admin", "Email": None}],
+        }
+        generator = MagicMock()
+        generator.generate.return_value = "n3w-p4ss"
+
+        for api_version, record_owners in owners.items():
+            with self.subTest(api_version=api_version):
+                authentication_obj = MagicMock(_api_version=api_version)
+                authentication_obj._req.put.return_value = MagicMock(
+                    status_code=200, json=lambda: {"Id": SECRET_ID}
+                )
+                secrets_safe_obj = secrets_safe.SecretsSafe(authentication_obj)
+                record = {
+                    "Id": SECRET_ID,
+                    "Title": "db",
+                    "Username": "svc",
+                    "OwnerId": 2,
+                    "OwnerType": "User",
+                    "Owners": record_owners,
+                    "Urls": [],
+                    "PasswordRuleID": None,
+                }
+
+                rotation.rotate_secret(
+                    secrets_safe_obj, generator, FOLDER_ID, record, None
+                )
+
+                body = authentication_obj._req.put.call_args.kwargs["json"]
+                self.assertEqual(body["Password"], "n3w-p4ss")
+                self.assertEqual(len(body["Owners"]), 1)
+
+        rotation.rotate_secret(
+            secrets_safe_obj,
+            generator,
+            FOLDER_ID,
+            {
+                "Id": SECRET_ID,
+                "Title": "db",
+                "Username": "svc",
+                "Owners": [],
+                "Urls": [],
+                "PasswordRuleID": None,
+            },
+            None,
+            owners=[{"user_id": 5}],
+        )
+        body = authentication_obj._req.put.call_args.kwargs["json"]
+        self.assertEqual(body["Owners"], [{"UserId": 5}])
+
+    def test_rotate_secret_preserves_fields(self):
+        """
+        Verify that a rotation writes back the description, notes, URLs and
+        password rule of the secret, read when the listing lacks them, and
+        generates the password from that rule when none is given.
+        """
+        authentication_obj = MagicMock(_api_version="3.1")
+        authentication_obj._req.put.return_value = MagicMock(
+            status_code=200, json=lambda: {"Id": SECRET_ID}
+        )
+        secrets_safe_obj = secrets_safe.SecretsSafe(authentication_obj)
+        secrets_safe_obj.get_secret_by_id = MagicMock(
+            return_value={
+                "Urls": [{"Id": "u1", "CredentialId": SECRET_ID, "Url": "https://db"}],
+                "PasswordRuleID": 7,
+            }
+        )
+        generator = MagicMock()
+        generator.generate.return_value = "n3w-p4ss"
+        record = {
+            "Id": SECRET_ID,
+            "Title": "db",
+            "Description": "database",
+            "Notes": "rotated weekly",
+            "Username": "svc",
+            "Owners": [{"UserId": 1}],
+        }
+
+        rotation.rotate_secret(secrets_safe_obj, generator, FOLDER_ID, record, None)
+
+        generator.generate.assert_called_once_with(7)
+        body = authentication_obj._req.put.call_args.kwargs["json"]
+        self.assertEqual(
+            body["Urls"], [{"Id": "u1", "CredentialId": SECRET_ID, "Url": "https://db"}]
+        )
+        self.assertEqual(body["PasswordRuleID"], 7)
+        self.assertEqual(body["Description"], "database")
+        self.assertEqual(body["Notes"], "rotated weekly")
+
+        rotation.rotate_secret(
+            secrets_safe_obj, generator, FOLDER_ID, {**record, "Urls": []}, 3
+        )
+        self.assertEqual(
+            authentication_obj._req.put.call_args.kwargs["json"]["PasswordRuleID"], 3
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,122 @@
+"""Unit tests for Schema module"""
+
+import re
+import unittest
+from typing import NamedTuple, Optional
+
+from src import schema
+
+
+class Entry(NamedTuple):
+    name: str
+    kind: str = "a"
+    size: int = 0
+    tag: Optional[str] = None
+
+
+ENTRIES = schema.Schema(
+    Entry,
+    [
+        schema.Field(
+            "name",
+            (str,),
+            required=True,
+            pattern=re.compile(r"[a-z]+"),
+            reserved=("error",),
+            hint="must be lowercase letters",
+        ),
+        schema.Field("kind", (str,), default="a", choices=("a", "b")),
+        schema.Field("size", (int,), default=0, hint="must be an integer"),
+        schema.Field("tag", (str,), nullable=True, hint="must be a string"),
+    ],
+    "test entry",
+)
+
+
+class TestSchema(unittest.TestCase):
+    """
+    Unit tests for schema module:
+    - Schema.parse
+    - Schema.loads
+    - SchemaError
+    """
+
+    def test_parse(self):
+        """
+        Verify that records are built with the defaults of missing fields and
+        that a single object is wrapped in a list.
+        """
+        self.assertEqual(
+            ENTRIES.parse([{"name": "x", "size": 2, "tag": None}, {"name": "y"}], "in"),
+            [Entry("x", "a", 2), Entry("y")],
+        )
+        self.assertEqual(ENTRIES.parse({"name": "x"}, "in"), [Entry("x")])
+
+    def test_parse_reports_every_error(self):
+        """
+        Verify that every invalid field of every entry is reported with its
+        location, and that booleans are not accepted as integers.
+        """
+        with self.assertRaises(schema.SchemaError) as context:
+            ENTRIES.parse(
+                [
+                    {"name": "x"},
+                    {"name": "X1", "size": True},
+                    "x",
+                    {"kind": "c"},
+                    {"name": "error"},
+                ],
+                "in",
+            )
+
+        self.assertEqual(
+            [location for location, _ in context.exception.errors],
+            ["in[1].name", "in[1].size", "in[2]", "in[3]", "in[3].kind", "in[4].name"],
+        )
+        message = str(context.exception)
+        self.assertIn(
+            "in[1].name: Invalid name 'X1': must be lowercase letters", message
+        )
+        self.assertIn(
+            "in[2]: Invalid JSON, each test entry must be a JSON object", message
+        )
+        self.assertIn("in[3]: Invalid JSON, validate name attribute name", message)
+        self.assertIn("in[3].kind: Invalid kind 'c', supported values: a, b", message)
+        self.assertIn(
+            "in[4].name: Invalid name 'error': reserved for the action", message
+        )
+
+    def test_error_message_is_bounded(self):
+        """
+        Verify that errors beyond MAX_REPORTED_ERRORS are only counted.
+        """
+        with self.assertRaises(schema.SchemaError) as context:
+            ENTRIES.parse([{}] * (schema.MAX_REPORTED_ERRORS + 5), "in")
+
+        self.assertEqual(len(context.exception.errors), schema.MAX_REPORTED_ERRORS + 5)
+        self.assertTrue(str(context.exception).endswith("and 5 more errors"))
+
+    def test_loads(self):
+        """
+        Verify that JSON is decoded once and decoding errors are located.
+        """
+        self.assertEqual(ENTRIES.loads('[{"name": "x"}]', "in"), [Entry("x")])
+
+        with self.assertRaises(schema.SchemaError) as context:
+            ENTRIES.loads("not json", "in")
+        self.assertIn("in: Invalid JSON input: Expecting value", str(context.exception))
+
+    def test_objects_kept(self):
+        """
+        Verify that a schema without record type keeps the validated objects.
+        """
+        objects = schema.Schema(None, [], "url")
+        self.assertEqual(
+            objects.loads('[{"url": "https://a"}]', "urls"), [{"url": "https://a"}]
+        )
+        with self.assertRaises(schema.SchemaError):
+            objects.loads('["https://a"]', "urls")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,213 @@
+import inspect
+import json
+import os
+import tempfile
+import threading
+import unittest
+from unittest.mock import MagicMock, patch
+
+from secrets_safe_library import authentication, secrets_safe
+from secrets_safe_library.exceptions import CreationError, UpdateError
+from src import streaming
+
+SECRET_ID = "4b2e8c1a-9f3d-4a6b-8c7e-1d2f3a4b5c6d"
+FOLDER_ID = "7f1a6b0e-5c1d-4c7e-9d0a-2b3c4d5e6f70"
+
+
+class TestStreaming(unittest.TestCase):
+    """
+    Unit tests for streaming module:
+    - resolve_workspace_path
+    - MultipartBody
+    - StreamingSecretsSafe
+    """
+
+    def setUp(self):
+        self.workspace = tempfile.mkdtemp()
+        self.file_path = os.path.join(self.workspace, "keystore.p12")
+        with open(self.file_path, "wb") as fh:
+            fh.write(b"0123456789" * 20000)
+
+    def tearDown(self):
+        os.unlink(self.file_path)
+        os.rmdir(self.workspace)
+
+    def test_resolve_workspace_path(self):
+        """
+        Verify that relative paths resolve inside the workspace and that
+        traversal outside of it or missing files are rejected.
+        """
+        self.assertEqual(
+            streaming.resolve_workspace_path("keystore.p12", self.workspace),
+            os.path.realpath(self.file_path),
+        )
+
+        with self.assertRaises(ValueError):
+            streaming.resolve_workspace_path("../etc/passwd", self.workspace)
+
+        with self.assertRaises(FileNotFoundError):
+            streaming.resolve_workspace_path("missing.p12", self.workspace)
+
+    def test_multipart_body_regular_file(self):
+        """
+        Verify that a regular file body has a known length, contains the
+        metadata and file parts, and can be rewound for retries.
+        """
+        with open(self.file_path, "rb") as source:
+            body = streaming.MultipartBody(source, "keystore.p12", {"Title": "t"})
+
+            content = body.read(100) + body.read()
+            self.assertEqual(len(content), body.len)
+            self.assertIn(b'{"Title": "t"}', content)
+            self.assertIn(b'filename="keystore.p12"', content)
+
+            quoted = streaming.MultipartBody(source, 'a"b\r\n.p12', {})
+            self.assertIn(b'filename="a%22b%0D%0A.p12"\r\n', quoted.read())
+            self.assertIn(b"0123456789" * 20000, content)
+            self.assertTrue(content.endswith(f"--{body.boundary}--\r\n".encode()))
+
+            self.assertEqual(body.tell(), 0)
+            body.seek(0)
+            self.assertEqual(b"".join(body), content)
+
+    def test_multipart_body_pipe(self):
+        """
+        Verify that a pipe body has no known length and cannot be rewound.
+        """
+        read_fd, write_fd = os.pipe()
+
+        def writer():
+            with os.fdopen(write_fd, "wb") as fh:
+                fh.write(b"piped content")
+
+        thread = threading.Thread(target=writer)
+        thread.start()
+
+        with os.fdopen(read_fd, "rb") as source:
+            body = streaming.MultipartBody(source, "dump.sql", {})
+            self.assertFalse(hasattr(body, "len"))
+            with self.assertRaises(OSError):
+                body.tell()
+            self.assertIn(b"piped content", b"".join(body))
+
+        thread.join()
+
+    def _build_client(self, status_code):
+        authentication = MagicMock()
+        authentication._timeout_connection_seconds = 30
+        authentication._timeout_request_seconds = 30
+        sent = {}
+
+        def post(url, data, headers, timeout):
+            sent["body"] = data.read()
+            sent["headers"] = headers
+            response = MagicMock()
+            response.status_code = status_code
+            return response
+
+        authentication._req.post.side_effect = post
+        authentication._req.put.side_effect = post
+        client = streaming.StreamingSecretsSafe(authentication=authentication)
+        return client, sent
+
+    @patch.object(streaming.StreamingSecretsSafe, "_get_headers")
+    @patch.object(streaming.StreamingSecretsSafe, "_create_url")
+    def test_run_post_file_request_streams_file(self, mock_create_url, mock_headers):
+        """
+        Verify that the file is posted as a streamed multipart body with the
+        file name added to the metadata.
+        """
+        mock_create_url.return_value = "https://example.com/secrets/file"
+        mock_headers.return_value = {"Authorization": "PS-Auth key=x"}
+        client, sent = self._build_client(201)
+
+        client._run_post_file_request(
+            "/secrets-safe/folders/1/secrets/file",
+            file_path=self.file_path,
+            payload={"Title": "t"},
+        )
+
+        self.assertTrue(
+            sent["headers"]["Content-Type"].startswith("multipart/form-data")
+        )
+        self.assertEqual(sent["headers"]["Authorization"], "PS-Auth key=x")
+        metadata = json.dumps({"Title": "t", "FileName": "keystore.p12"}).encode()
+        self.assertIn(metadata, sent["body"])
+
+    @patch.object(streaming.StreamingSecretsSafe, "_get_headers")
+    @patch.object(streaming.StreamingSecretsSafe, "_create_url")
+    def test_run_post_file_request_error(self, mock_create_url, mock_headers):
+        """
+        Verify that an unexpected status code raises CreationError.
+        """
+        mock_headers.return_value = {}
+        client, _ = self._build_client(400)
+
+        with self.assertRaises(CreationError):
+            client._run_post_file_request("/endpoint", file_path=self.file_path)
+
+    @patch.object(streaming.StreamingSecretsSafe, "_get_headers")
+    @patch.object(streaming.StreamingSecretsSafe, "_create_url")
+    def test_run_put_file_request_streams_file(self, mock_create_url, mock_headers):
+        """
+        Verify that file secret updates are streamed as well, and that an
+        unexpected status code raises UpdateError.
+        """
+        mock_headers.return_value = {}
+        client, sent = self._build_client(204)
+
+        client._run_put_file_request("/endpoint", file_path=self.file_path)
+        self.assertIn(b"0123456789" * 20000, sent["body"])
+
+        client, _ = self._build_client(400)
+        with self.assertRaises(UpdateError):
+            client._run_put_file_request("/endpoint", file_path=self.file_path)
+
+    def test_library_compatibility(self):
+        """
+        Verify that the library still sends file secrets through the
+        overridden private methods, with the same parameters, and that the
+        private attributes they use exist, so a library upgrade changing
+        them fails here.
+        """
+        for name in ("_run_post_file_request", "_run_put_file_request"):
+            self.assertEqual(
+                list(
+                    inspect.signature(
+                        getattr(secrets_safe.SecretsSafe, name)
+                    ).parameters
+                ),
+                list(
+                    inspect.signature(
+                        getattr(streaming.StreamingSecretsSafe, name)
+                    ).parameters
+                ),
+            )
+        self.assertTrue(callable(secrets_safe.SecretsSafe._get_file_by_id_req))
+
+        session = MagicMock()
+        session.put.return_value.status_code = 204
+        authentication_obj = authentication.Authentication(
+            req=session,
+            api_url="https://example.com/BeyondTrust/api/public/v3",
+            api_key="0" * 128 + ";runas=user;",
+            api_version="3.1",
+        )
+        client = streaming.StreamingSecretsSafe(authentication=authentication_obj)
+
+        client.update_secret(
+            SECRET_ID,
+            folder_id=FOLDER_ID,
+            title="t",
+            file_path=self.file_path,
+            owners=[{"user_id": 1}],
+        )
+
+        kwargs = session.put.call_args.kwargs
+        self.assertIn(f"/secrets/{SECRET_ID}/file", kwargs["url"])
+        self.assertIsInstance(kwargs["data"], streaming.MultipartBody)
+        self.assertIn("Authorization", kwargs["headers"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,304 @@
+import http.server
+import logging
+import socket
+import threading
+import unittest
+
+import requests
+from src import transport
+from tests.replay import standin
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    # GET requests answered with a 503 before the next ones succeed
+    unavailable = 0
+    head_status = 404
+
+    def do_HEAD(self):
+        self.send_response(_Handler.head_status)
+        self.end_headers()
+
+    def do_GET(self):
+        if _Handler.unavailable:
+            _Handler.unavailable -= 1
+            self.send_response(503)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        body = self.path.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def _unused_url() -> str:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    return f"http://127.0.0.1:{port}/api"
+
+
+class _SessionGuard:
+    # signs in with the sign-in call of the library, like the SessionGuard
+    # of the clients
+
+    def __init__(self, session: requests.Session, api_url: str):
+        self._session = session
+        self._api_url = api_url
+        self._valid = True
+        self.sign_ins = 0
+
+    def ensure(self):
+        if not self._valid:
+            self._session.post(f"{self._api_url}/Auth/SignAppin")
+            self.sign_ins += 1
+            self._valid = True
+
+    def invalidate(self):
+        self._valid = False
+
+
+class TestTransport(unittest.TestCase):
+    """
+    Unit tests for transport module:
+    - parse_api_urls
+    - TokenBucket
+    - FailoverAdapter
+    - mount_adapter
+    """
+
+    def setUp(self):
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.live_url = f"http://127.0.0.1:{self.server.server_port}/api"
+        self.dead_url = _unused_url()
+        self.logger = logging.getLogger("test_transport")
+        _Handler.unavailable = 0
+        _Handler.head_status = 404
+
+    def test_parse_api_urls(self):
+        """
+        Verify that API URLs are split on commas and blanks are dropped.
+        """
+        self.assertEqual(
+            transport.parse_api_urls(" https://a/api , https://b/api,"),
+            ["https://a/api", "https://b/api"],
+        )
+        self.assertEqual(transport.parse_api_urls(None), [])
+
+    def test_probe_selects_healthy_node(self):
+        """
+        Verify that the probe makes the healthy node active and marks the
+        unreachable one as unhealthy.
+        """
+        adapter = transport.FailoverAdapter([self.dead_url, self.live_url])
+
+        latencies = adapter.probe(timeout=1)
+
+        self.assertIsNone(latencies[self.dead_url])
+        self.assertIsNotNone(latencies[self.live_url])
+        self.assertEqual(adapter.api_urls, [self.live_url, self.dead_url])
+        self.assertEqual(adapter.active_url, self.live_url)
+
+    def test_probe_skips_server_errors(self):
+        """
+        Verify that a node answering the probe with a server error is not
+        made active.
+        """
+        _Handler.head_status = 503
+        with standin.StandIn(standin.Profiles([])) as server:
+            adapter = transport.FailoverAdapter([self.live_url, server.api_url])
+
+            latencies = adapter.probe(timeout=1)
+
+        self.assertIsNone(latencies[self.live_url])
+        self.assertEqual(adapter.active_url, server.api_url)
+
+    def test_fails_over_and_stays_on_healthy_node(self):
+        """
+        Verify that a request built against an unreachable node is sent to
+        the next node, which stays active for later requests.
+        """
+        with requests.Session() as session:
+            adapter = transport.FailoverAdapter(
+                [self.dead_url, self.live_url],
+                cookies=session.cookies,
+                logger=self.logger,
+                max_retries=transport.build_retry(connect=0),
+            )
+            session.mount("http://", adapter)
+
+            with self.assertLogs(self.logger, "WARNING"):
+                response = session.get(f"{self.dead_url}/Secrets-Safe/Secrets")
+
+            self.assertEqual(response.text, "/api/Secrets-Safe/Secrets")
+            self.assertEqual(adapter.active_url, self.live_url)
+
+            with self.assertNoLogs(self.logger, "WARNING"):
+                session.get(f"{self.dead_url}/Auth/Signout")
+
+    def test_all_nodes_unreachable(self):
+        """
+        Verify that the last connection error is raised when no node can be
+        reached.
+        """
+        adapter = transport.FailoverAdapter(
+            [self.dead_url, _unused_url()],
+            logger=self.logger,
+            max_retries=transport.build_retry(connect=0),
+        )
+        with requests.Session() as session:
+            session.mount("http://", adapter)
+            with self.assertLogs(self.logger, "WARNING"), self.assertRaises(
+                requests.exceptions.ConnectionError
+            ):
+                session.get(f"{self.dead_url}/Auth/SignAppIn")
+
+    def test_fails_over_and_signs_in_again(self):
+        """
+        Verify that a sign-in failed over to the next node uses the session
+        cookie of that node afterwards, and that a request failed over once
+        signed in first signs in again on the new node, through the session
+        guard, against stand-ins refusing calls out of a session.
+        """
+        with standin.StandIn(
+            standin.Profiles([]), check_sessions=True
+        ) as first, standin.StandIn(
+            standin.Profiles([]), check_sessions=True
+        ) as second, requests.Session() as session:
+            adapter = transport.FailoverAdapter(
+                [first.api_url, second.api_url],
+                cookies=session.cookies,
+                logger=self.logger,
+                max_retries=transport.build_retry(connect=0),
+            )
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            first.shutdown()
+            first.server_close()
+
+            with self.assertLogs(self.logger, "WARNING"):
+                session.post(f"{first.api_url}/Auth/SignAppin")
+            response = session.get(f"{first.api_url}/secrets-safe/secrets?title=a")
+
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(second.sessions), 1)
+
+        with standin.StandIn(
+            standin.Profiles([]), check_sessions=True
+        ) as first, standin.StandIn(
+            standin.Profiles([]), check_sessions=True
+        ) as second, requests.Session() as session:
+            adapter = transport.FailoverAdapter(
+                [first.api_url, second.api_url],
+                cookies=session.cookies,
+                logger=self.logger,
+                max_retries=transport.build_retry(connect=0),
+            )
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            session.post(f"{first.api_url}/Auth/SignAppin")
+            session_guard = _SessionGuard(session, first.api_url)
+            transport.guard_session(session, session_guard)
+            first.shutdown()
+            first.server_close()
+            # drop the pooled connection to the stopped node
+            session.close()
+
+            with self.assertLogs(self.logger, "WARNING"):
+                response = session.get(f"{first.api_url}/secrets-safe/secrets?title=a")
+
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(session_guard.sign_ins, 1)
+            self.assertEqual(second.stats.calls["POST auth/signappin"], 1)
+            self.assertEqual(len(second.sessions), 1)
+
+    def test_mount_adapter_single_url(self):
+        """
+        Verify that a single API URL is used as is, without probing.
+        """
+        with requests.Session() as session:
+            api_url = transport.mount_adapter(session, [self.dead_url], self.logger)
+
+            self.assertEqual(api_url, self.dead_url)
+            adapter = session.get_adapter(self.dead_url)
+            self.assertNotIsInstance(adapter, transport.FailoverAdapter)
+            self.assertEqual(adapter.max_retries.total, transport.RETRY_TOTAL)
+            # the default header of requests, brotli comes with the Brotli dependency
+            self.assertIn("br", session.headers["Accept-Encoding"].split(", "))
+
+    def test_token_bucket(self):
+        """
+        Verify that the burst is served at once, that further requests wait
+        for the refill in order, and that the waits are accounted.
+        """
+        now = [0.0]
+        sleeps = []
+        bucket = transport.TokenBucket(
+            rate=2, burst=2, clock=lambda: now[0], sleep=sleeps.append
+        )
+
+        waits = [bucket.acquire() for _ in range(4)]
+
+        self.assertEqual(waits, [0.0, 0.0, 0.5, 1.0])
+        self.assertEqual(sleeps, [0.5, 1.0])
+        self.assertEqual(bucket.throttled_requests, 2)
+        self.assertEqual(bucket.throttled_seconds, 1.5)
+
+        now[0] = 10.0
+        self.assertEqual(bucket.acquire(), 0.0)
+
+    def test_mount_adapter_throttles_requests(self):
+        """
+        Verify that requests through the mounted adapter take tokens and that
+        the throttled time is logged.
+        """
+        sleeps = []
+        rate_limiter = transport.TokenBucket(
+            rate=1, burst=1, clock=lambda: 0.0, sleep=sleeps.append
+        )
+        with requests.Session() as session:
+            transport.mount_adapter(
+                session, [self.live_url], self.logger, rate_limiter=rate_limiter
+            )
+            session.get(f"{self.live_url}/one")
+            session.get(f"{self.live_url}/two")
+
+            self.assertEqual(sleeps, [1.0])
+            with self.assertLogs(self.logger, "INFO") as logs:
+                transport.log_throttling(session, self.logger)
+            self.assertIn("1 requests were throttled", logs.output[0])
+
+        self.assertIsNone(transport.build_rate_limiter(0, 10))
+        self.assertEqual(transport.build_rate_limiter(5, 0).capacity, 5)
+
+    def test_retries_take_tokens(self):
+        """
+        Verify that a request retried after a 503 takes a token for the
+        retry too.
+        """
+        _Handler.unavailable = 1
+        sleeps = []
+        rate_limiter = transport.TokenBucket(
+            rate=1, burst=1, clock=lambda: 0.0, sleep=sleeps.append
+        )
+        with requests.Session() as session:
+            transport.mount_adapter(
+                session, [self.live_url], self.logger, rate_limiter=rate_limiter
+            )
+            response = session.get(f"{self.live_url}/one")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(_Handler.unavailable, 0)
+        self.assertEqual(sleeps, [1.0])
+        self.assertEqual(rate_limiter.throttled_requests, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
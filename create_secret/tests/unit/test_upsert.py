@@ -0,0 +1,148 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import MagicMock
+
+import requests
+from secrets_safe_library import secrets_safe
+from secrets_safe_library.exceptions import UpdateError
+from src import upsert
+
+
+class TestUpsert(unittest.TestCase):
+    """
+    Unit tests for upsert module:
+    - build_title_index
+    - content_digest / file_digest
+    - existing_digest
+    - decide
+    """
+
+    def test_build_title_index_uses_one_listing_call(self):
+        """
+        Verify that the folder secrets are listed once and indexed by title.
+        """
+        secrets_safe_obj = MagicMock()
+        secrets_safe_obj.list_secrets_by_folder_id.return_value = [
+            {"Id": "1", "Title": "db"},
+            {"Id": "2", "Title": "api"},
+        ]
+
+        index = upsert.build_title_index(secrets_safe_obj, "folder")
+
+        secrets_safe_obj.list_secrets_by_folder_id.assert_called_once_with("folder")
+        self.assertEqual(index["api"]["Id"], "2")
+        self.assertNotIn("missing", index)
+
+    def test_file_digest_matches_content_digest(self):
+        """
+        Verify that hashing a file matches hashing the same content, so a file
+        can be compared with the downloaded content of a file secret.
+        """
+        with tempfile.NamedTemporaryFile(delete=False) as fh:
+            fh.write(b"x" * 200000)
+        self.addCleanup(os.unlink, fh.name)
+
+        self.assertEqual(
+            upsert.file_digest(fh.name), upsert.content_digest("x" * 200000)
+        )
+        self.assertNotEqual(
+            upsert.content_digest("ab", "c"), upsert.content_digest("a", "bc")
+        )
+
+    def test_existing_digest_reads_by_type(self):
+        """
+        Verify that the current content is read with the endpoint matching
+        the secret type.
+        """
+        secrets_safe_obj = MagicMock()
+        secrets_safe_obj.get_secret_by_id.return_value = {
+            "Username": "user",
+            "Password": "pass",
+        }
+        secrets_safe_obj.get_text_secret_by_id.return_value = {"Text": "text"}
+        secrets_safe_obj._get_file_by_id_req.return_value.content = b"file"
+
+        self.assertEqual(
+            upsert.existing_digest(secrets_safe_obj, {"Id": "1"}),
+            upsert.content_digest("user", "pass"),
+        )
+        self.assertEqual(
+            upsert.existing_digest(secrets_safe_obj, {"Id": "2", "SecretType": "Text"}),
+            upsert.content_digest("text"),
+        )
+        self.assertEqual(
+            upsert.existing_digest(secrets_safe_obj, {"Id": "3", "SecretType": "File"}),
+            upsert.content_digest("file"),
+        )
+
+    def test_existing_digest_of_binary_file(self):
+        """
+        Verify that the downloaded content of a binary file secret has the
+        digest of the same file, without being decoded as text.
+        """
+        content = bytes(range(256)) * 4
+        with tempfile.NamedTemporaryFile(delete=False) as fh:
+            fh.write(content)
+        self.addCleanup(os.unlink, fh.name)
+
+        response = requests.Response()
+        response.status_code = 200
+        response._content = content
+        authentication_obj = MagicMock(_api_version="3.1")
+        authentication_obj._req.get.return_value = response
+        secrets_safe_obj = secrets_safe.SecretsSafe(authentication_obj)
+
+        self.assertEqual(
+            upsert.existing_digest(secrets_safe_obj, {"Id": "1", "SecretType": "File"}),
+            upsert.file_digest(fh.name),
+        )
+
+    def test_decide(self):
+        """
+        Verify each decision and that content is only hashed when an
+        existing secret may be updated.
+        """
+        record = {"Id": "1", "SecretType": "Text"}
+        same = MagicMock(return_value="a")
+        other = MagicMock(return_value="b")
+
+        self.assertEqual(
+            upsert.decide(None, upsert.IF_EXISTS_UPDATE, "Text", same, same),
+            upsert.CREATE,
+        )
+        self.assertEqual(
+            upsert.decide(record, upsert.IF_EXISTS_SKIP, "Text", same, same),
+            upsert.SKIP,
+        )
+        same.assert_not_called()
+
+        self.assertEqual(
+            upsert.decide(record, upsert.IF_EXISTS_UPDATE, "Text", same, same),
+            upsert.SKIP,
+        )
+        self.assertEqual(
+            upsert.decide(record, upsert.IF_EXISTS_UPDATE, "Text", same, other),
+            upsert.UPDATE,
+        )
+        self.assertEqual(
+            upsert.decide(record, upsert.IF_EXISTS_UPDATE, "Text", lambda: None, other),
+            upsert.UPDATE,
+        )
+
+    def test_decide_rejects_type_change(self):
+        """
+        Verify that an existing secret of another type is not updated.
+        """
+        with self.assertRaises(UpdateError):
+            upsert.decide(
+                {"Id": "1", "SecretType": "File"},
+                upsert.IF_EXISTS_UPDATE,
+                "Text",
+                MagicMock(),
+                MagicMock(),
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()
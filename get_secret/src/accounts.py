@@ -0,0 +1,529 @@
+"""
+Batched retrieval of managed accounts.
+
+The library turns every ``system/account`` path into a search for the
+managed account, a credential request, a credential retrieval and a check-in,
+one account after the other. ManagedAccountBatch instead lists the accounts
+of every requested system once, keeps the resulting account id index for the
+rest of the run, sends the credential requests concurrently and checks all
+the requests in together once every credential has been retrieved.
+
+With RequestLeases, credential requests instead stay open for a configured
+duration and are stored in a file of the job, so later reads of the same
+account, in the same step or a later one, reuse the request and only
+retrieve the credential. The post step of the action checks every stored
+request in when the job ends, whether it succeeded or not.
+
+The concurrent requests share the authenticated session of the run, and the
+library signs that session out when a request fails, which fails the
+requests still in flight too. When more than one request of a batch failed,
+the failed ones are retried one at a time after a single new sign-in, so the
+requests that only failed because of the sign-out do not each go through the
+per-path flow.
+
+Paths the index cannot resolve, and accounts whose credential request still
+failed, go through the per-path flow of the library, so they fail with the
+same errors as before.
+"""
+
+import concurrent.futures
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from secrets_safe_library import exceptions
+from src import batch, structured_logging
+
+DEFAULT_MAX_WORKERS = 4
+LIST_PAGE_SIZE = 1000
+
+REQUEST_REASON = "Secrets Safe Integration"
+# leases about to expire are not reused, the credential could expire in use
+LEASE_MARGIN_SECONDS = 30
+
+AccountIds = Tuple[int, int]
+
+
+class AccountIndex:
+    """
+    Index of the managed system and account ids of managed account paths,
+    built with one listing per managed system.
+    """
+
+    def __init__(self, managed_account_obj: Any, separator: str = "/"):
+        """
+        Args:
+            managed_account_obj (ManagedAccount): Library object listing the
+                managed accounts.
+            separator (str): Separator of the system and account names.
+        """
+        self._managed_account_obj = managed_account_obj
+        self._separator = separator
+        self._ids: Dict[Tuple[str, str], AccountIds] = {}
+        self._listed_systems = set()
+
+    def split(self, path: str) -> Optional[Tuple[str, str]]:
+        """
+        Split a managed account path into its system and account names.
+
+        Args:
+            path (str): Managed account path.
+
+        Returns:
+            Tuple[str, str], optional: The system and account names, None
+            when the path is invalid.
+        """
+        names = path.split(self._separator)
+        return (names[0], names[1]) if len(names) == 2 else None
+
+    def _list_system(self, system_name: str) -> None:
+        offset = 0
+        while True:
+            page = self._managed_account_obj.get_managed_accounts(
+                system_name=system_name, limit=LIST_PAGE_SIZE, offset=offset
+            )
+            # a single account is returned as an object instead of a list
+            accounts = [page] if isinstance(page, dict) else page or []
+            for account in accounts:
+                key = (account.get("SystemName"), account.get("AccountName"))
+                self._ids[key] = (account["SystemId"], account["AccountId"])
+            if len(accounts) < LIST_PAGE_SIZE:
+                return
+            offset += LIST_PAGE_SIZE
+
+    def resolve(self, paths: List[str], session_guard: batch.SessionGuard) -> int:
+        """
+        List the accounts of the systems of the given paths that were not
+        listed yet.
+
+        Args:
+            paths (List[str]): Managed account paths.
+            session_guard (batch.SessionGuard): Guard of the session, a failed
+                listing signs the session out.
+
+        Returns:
+            int: Number of systems whose listing failed.
+        """
+        failed = 0
+        for path in paths:
+            names = self.split(path)
+            if names is None or names[0] in self._listed_systems:
+                continue
+            self._listed_systems.add(names[0])
+            try:
+                session_guard.ensure()
+                self._list_system(names[0])
+            except Exception:
+                session_guard.invalidate()
+                failed += 1
+        return failed
+
+    def get(self, path: str) -> Optional[AccountIds]:
+        """
+        Get the ids of a managed account.
+
+        Args:
+            path (str): Managed account path.
+
+        Returns:
+            Tuple[int, int], optional: The managed system and account ids,
+            None when the account is not in the index.
+        """
+        names = self.split(path)
+        return self._ids.get(names) if names else None
+
+
+def _post_credential_request(managed_account_obj: Any, payload: dict) -> int:
+    """
+    Compatibility shim, the only use of library internals in this module.
+
+    The library has no public method to create a credential request with a
+    given duration, so the request is sent like ManagedAccount.create_request
+    sends it: through the private ``_run_post_request``, with the
+    ``RotateOnCheckin`` setting of the object. test_library_compatibility
+    fails when either internal changes.
+
+    Args:
+        managed_account_obj (ManagedAccount): Library object making the
+            request.
+        payload (dict): Request body, without RotateOnCheckin.
+
+    Returns:
+        int: The request id.
+    """
+    rotate_on_checkin = getattr(managed_account_obj, "_rotate_on_checkin", None)
+    if rotate_on_checkin is not None:
+        payload = dict(payload, RotateOnCheckin=rotate_on_checkin)
+    response = managed_account_obj._run_post_request(
+        "/Requests",
+        payload=payload,
+        expected_status_code=[200, 201],
+        include_api_version=False,
+    )
+    return response.json()
+
+
+def create_request(
+    managed_account_obj: Any, ids: AccountIds, duration_minutes: int
+) -> int:
+    """
+    Create a credential request lasting the given duration. The request of
+    ManagedAccount.create_request always lasts 5 minutes.
+
+    Args:
+        managed_account_obj (ManagedAccount): Library object making the
+            request.
+        ids (Tuple[int, int]): Managed system and account ids.
+        duration_minutes (int): Duration of the request.
+
+    Returns:
+        int: The request id.
+    """
+    system_id, account_id = ids
+    return _post_credential_request(
+        managed_account_obj,
+        {
+            "SystemID": system_id,
+            "AccountID": account_id,
+            "DurationMinutes": duration_minutes,
+            "Reason": REQUEST_REASON,
+            "ConflictOption": "reuse",
+        },
+    )
+
+
+class RequestLeases:
+    """
+    Credential requests kept open across the steps of a job, stored in a
+    file readable only by the action.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        duration_minutes: int,
+        clock: Callable[[], float] = time.time,
+    ):
+        """
+        Args:
+            path (str): Path of the lease file.
+            duration_minutes (int): Duration of new credential requests.
+            clock (Callable[[], float]): Wall clock in seconds, shared by the
+                steps of the job.
+        """
+        self.path = path
+        self.duration_minutes = duration_minutes
+        self._clock = clock
+        self._leases: Dict[AccountIds, Tuple[int, float]] = {}
+        self._lock = threading.Lock()
+
+    def load(self) -> "RequestLeases":
+        """
+        Load the leases stored by previous steps, if any.
+
+        Returns:
+            RequestLeases: The leases.
+        """
+        try:
+            with open(self.path, encoding="utf-8") as fh:
+                stored = json.load(fh)
+        except FileNotFoundError:
+            return self
+        with self._lock:
+            for lease in stored:
+                ids = (lease["system_id"], lease["account_id"])
+                self._leases[ids] = (lease["request_id"], lease["expires"])
+        return self
+
+    def save(self) -> None:
+        """
+        Store the leases, replacing the file atomically, or remove the file
+        when there are none left.
+        """
+        with self._lock:
+            stored = [
+                {
+                    "system_id": system_id,
+                    "account_id": account_id,
+                    "request_id": request_id,
+                    "expires": expires,
+                }
+                for (system_id, account_id), (request_id, expires) in (
+                    self._leases.items()
+                )
+            ]
+        if not stored:
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+            return
+
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".requests-")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as fh:
+                json.dump(stored, fh)
+            os.replace(temp_path, self.path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+    def get(self, ids: AccountIds) -> Optional[int]:
+        """
+        Get the open request of a managed account.
+
+        Args:
+            ids (Tuple[int, int]): Managed system and account ids.
+
+        Returns:
+            int, optional: The request id, None when there is no request open
+            long enough to be reused.
+        """
+        with self._lock:
+            request_id, expires = self._leases.get(ids, (None, 0))
+        if expires - LEASE_MARGIN_SECONDS <= self._clock():
+            return None
+        return request_id
+
+    def add(self, ids: AccountIds, request_id: int) -> None:
+        """
+        Store the request just created for a managed account.
+
+        Args:
+            ids (Tuple[int, int]): Managed system and account ids.
+            request_id (int): The request id.
+        """
+        expires = self._clock() + self.duration_minutes * 60
+        with self._lock:
+            self._leases[ids] = (request_id, expires)
+
+    def discard(self, ids: AccountIds) -> None:
+        """
+        Forget the request of a managed account, e.g. after it failed.
+
+        Args:
+            ids (Tuple[int, int]): Managed system and account ids.
+        """
+        with self._lock:
+            self._leases.pop(ids, None)
+
+    def check_in_all(self, managed_account_obj: Any) -> int:
+        """
+        Check in every request that has not expired yet and forget them all.
+
+        Args:
+            managed_account_obj (ManagedAccount): Library object making the
+                requests.
+
+        Returns:
+            int: Number of requests that could not be checked in.
+        """
+        now = self._clock()
+        with self._lock:
+            leases = list(self._leases.values())
+            self._leases.clear()
+
+        failed = 0
+        for request_id, expires in leases:
+            if expires <= now:
+                continue
+            try:
+                managed_account_obj.request_check_in(request_id)
+            except Exception:
+                failed += 1
+        return failed
+
+
+class ManagedAccountBatch:
+    """
+    Lookup of managed accounts retrieving a batch of paths with prefetch(),
+    then serving them with get_secret().
+    """
+
+    def __init__(
+        self,
+        managed_account_obj: Any,
+        session_guard: batch.SessionGuard,
+        index: AccountIndex,
+        max_workers: int = DEFAULT_MAX_WORKERS,
+        logger: Optional[logging.Logger] = None,
+        leases: Optional[RequestLeases] = None,
+    ):
+        """
+        Args:
+            managed_account_obj (ManagedAccount): Library object making the
+                requests.
+            session_guard (batch.SessionGuard): Guard of the shared session.
+            index (AccountIndex): Account id index, shared for the run.
+            max_workers (int): Maximum number of concurrent credential
+                requests.
+            logger (logging.Logger, optional): Logger.
+            leases (RequestLeases, optional): Requests kept open for the job,
+                None to check every request in at the end of the batch.
+        """
+        self._managed_account_obj = managed_account_obj
+        self._session_guard = session_guard
+        self._index = index
+        self._max_workers = max(1, max_workers)
+        self._logger = logger or logging.getLogger(__name__)
+        self._fallback = batch.ResilientLookup(managed_account_obj, session_guard)
+        self._credentials: Dict[str, str] = {}
+        self._leases = leases
+
+    def _request_credential(
+        self, ids: AccountIds, request_ids: Dict[AccountIds, int]
+    ) -> str:
+        if self._leases is not None:
+            request_id = self._leases.get(ids)
+            if request_id is None:
+                request_id = create_request(
+                    self._managed_account_obj, ids, self._leases.duration_minutes
+                )
+                if request_id:
+                    self._leases.add(ids, request_id)
+        else:
+            request_id = request_ids.get(ids) or (
+                self._managed_account_obj.get_request_id(*ids)
+            )
+            if request_id:
+                request_ids[ids] = request_id
+
+        if not request_id:
+            raise exceptions.LookupError("Request Id not found")
+        return self._managed_account_obj.get_credential_by_request_id(request_id)
+
+    def _check_in(self, request_ids: List[int]) -> None:
+        if not request_ids:
+            return
+        try:
+            self._session_guard.ensure()
+        except exceptions.AuthenticationFailure:
+            failed = len(request_ids)
+        else:
+            workers = min(self._max_workers, len(request_ids))
+            with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+                futures = [
+                    executor.submit(
+                        self._managed_account_obj.request_check_in, request_id
+                    )
+                    for request_id in request_ids
+                ]
+            failed = sum(1 for future in futures if future.exception() is not None)
+        if failed:
+            # unreleased requests expire on their own after a few minutes
+            self._session_guard.invalidate()
+            self._logger.warning(f"{failed} managed account requests not checked in")
+
+    def _retry(
+        self,
+        paths: List[str],
+        resolved: Dict[str, AccountIds],
+        request_ids: Dict[AccountIds, int],
+    ) -> None:
+        self._session_guard.invalidate()
+        # a single failure cannot have been caused by another one
+        if len(paths) > 1:
+            self._retry_one_by_one(paths, resolved, request_ids)
+        if self._leases is None:
+            return
+
+        discarded = []
+        for path in paths:
+            # retried, and reported, by the per-path flow in get_secret
+            if path not in self._credentials:
+                request_id = self._leases.get(resolved[path])
+                self._leases.discard(resolved[path])
+                if request_id:
+                    discarded.append(request_id)
+        # released best effort, a request left open blocks the next one
+        self._check_in(list(dict.fromkeys(discarded)))
+
+    def _retry_one_by_one(
+        self,
+        paths: List[str],
+        resolved: Dict[str, AccountIds],
+        request_ids: Dict[AccountIds, int],
+    ) -> None:
+        # one at a time, so that a request failing again only signs out the
+        # session once it is over
+        for path in paths:
+            try:
+                self._session_guard.ensure()
+            except exceptions.AuthenticationFailure:
+                break
+            try:
+                self._credentials[path] = self._request_credential(
+                    resolved[path], request_ids
+                )
+            except Exception:
+                self._session_guard.invalidate()
+
+    def prefetch(self, paths: List[str]) -> None:
+        """
+        Retrieve the credentials of a batch of managed accounts.
+
+        Args:
+            paths (List[str]): Managed account paths.
+        """
+        failed_systems = self._index.resolve(paths, self._session_guard)
+        if failed_systems:
+            self._logger.debug(
+                f"Listing {failed_systems} managed systems failed, "
+                "their accounts are searched one by one"
+            )
+
+        resolved = {}
+        for path in dict.fromkeys(paths):
+            ids = self._index.get(path)
+            if ids is not None and path not in self._credentials:
+                resolved[path] = ids
+        if not resolved:
+            return
+
+        try:
+            self._session_guard.ensure()
+        except exceptions.AuthenticationFailure:
+            # reported for every path by the per-path flow
+            return
+
+        request_ids: Dict[AccountIds, int] = {}
+        workers = min(self._max_workers, len(resolved))
+        with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+            futures = {
+                path: executor.submit(self._request_credential, ids, request_ids)
+                for path, ids in resolved.items()
+            }
+
+        failed = []
+        for path, future in futures.items():
+            if future.exception() is None:
+                self._credentials[path] = future.result()
+            else:
+                failed.append(path)
+        if failed:
+            self._retry(failed, resolved, request_ids)
+        self._check_in(list(request_ids.values()))
+
+        structured_logging.log_event(
+            self._logger,
+            logging.DEBUG,
+            "prefetch_managed_accounts",
+            count=len(self._credentials),
+        )
+
+    def get_secret(self, path: str) -> str:
+        """
+        Get a managed account credential, prefetched or retrieved on its own.
+
+        Args:
+            path (str): Managed account path.
+
+        Returns:
+            str: The credential.
+        """
+        if path in self._credentials:
+            return self._credentials.pop(path)
+        return self._fallback.get_secret(path)
@@ -0,0 +1,283 @@
+"""
+Resident secrets agent for self-hosted runners.
+
+The agent keeps a single authenticated Secrets Safe session open and serves
+secret lookups over a local Unix socket, so that each job only pays for a
+socket round-trip instead of a container cold start and a full sign-in.
+
+This module is responsible for:
+- Scoping lookups per job through an access policy keyed by job token
+- Caching retrieved values in memory for a configurable TTL
+- Re-authenticating transparently when a failed lookup signs the session out
+- Providing a thin client with the same ``get_secret`` interface as the
+  library lookup objects
+"""
+
+import fnmatch
+import hmac
+import json
+import logging
+import os
+import socket
+import socketserver
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from secrets_safe_library import exceptions
+from src import batch
+
+SECRET_KIND = "secret"
+MANAGED_ACCOUNT_KIND = "managed_account"
+LOOKUP_KINDS = (SECRET_KIND, MANAGED_ACCOUNT_KIND)
+
+MAX_MESSAGE_BYTES = 64 * 1024
+SOCKET_TIMEOUT_SECONDS = 30
+
+
+class SecretCache:
+    """
+    Thread-safe in-memory cache of retrieved secret values with a fixed TTL.
+    A TTL of zero or less disables caching.
+    """
+
+    def __init__(self, ttl_seconds: float):
+        self._ttl = ttl_seconds
+        self._entries: Dict[Tuple[str, str], Tuple[float, str]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, kind: str, path: str) -> Optional[str]:
+        """
+        Return the cached value for a lookup, or None if absent or expired.
+        """
+        with self._lock:
+            entry = self._entries.get((kind, path))
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[(kind, path)]
+                return None
+            return value
+
+    def put(self, kind: str, path: str, value: str) -> None:
+        """
+        Store a value for a lookup if caching is enabled.
+        """
+        if self._ttl <= 0:
+            return
+        with self._lock:
+            self._entries[(kind, path)] = (time.monotonic() + self._ttl, value)
+
+    def clear(self) -> None:
+        """
+        Drop every cached value.
+        """
+        with self._lock:
+            self._entries.clear()
+
+
+class AgentPolicy:
+    """
+    Per-job access policy. Each job token maps to the glob patterns of the
+    secret and managed account paths it is allowed to read, for example::
+
+        {"<job token>": {"secret": ["ci/*"], "managed_account": ["db01/*"]}}
+    """
+
+    def __init__(self, grants: Dict[str, Dict[str, List[str]]]):
+        self._grants = grants
+
+    @classmethod
+    def from_file(cls, file_path: str) -> "AgentPolicy":
+        """
+        Load a policy from a JSON file.
+
+        Args:
+            file_path (str): Path to the JSON policy file.
+
+        Returns:
+            AgentPolicy: The loaded policy.
+
+        Raises:
+            ValueError: If the file does not contain a valid policy.
+        """
+        with open(file_path, "r", encoding="utf-8") as fh:
+            grants = json.load(fh)
+
+        if not isinstance(grants, dict) or not all(
+            isinstance(scopes, dict) for scopes in grants.values()
+        ):
+            raise ValueError("Agent policy must map job tokens to scope objects")
+
+        return cls(grants)
+
+    def is_allowed(self, token: str, kind: str, path: str) -> bool:
+        """
+        Check whether a job token may read the given path.
+
+        Tokens are compared in constant time so that response timing does not
+        reveal valid token prefixes.
+        """
+        if not isinstance(token, str) or not token:
+            return False
+
+        for granted_token, scopes in self._grants.items():
+            if hmac.compare_digest(granted_token.encode(), token.encode()):
+                patterns = scopes.get(kind, [])
+                return any(fnmatch.fnmatchcase(path, pattern) for pattern in patterns)
+
+        return False
+
+
+class _AgentRequestHandler(socketserver.StreamRequestHandler):
+    """
+    Handles one newline-delimited JSON request per connection.
+    """
+
+    def handle(self) -> None:
+        line = self.rfile.readline(MAX_MESSAGE_BYTES)
+        try:
+            request = json.loads(line)
+            response = self.server.lookup(
+                request.get("token"), request.get("kind"), request.get("path")
+            )
+        except (json.JSONDecodeError, AttributeError):
+            response = {"ok": False, "error": "Malformed agent request"}
+
+        self.wfile.write(json.dumps(response).encode("utf-8") + b"\n")
+
+
+class SecretsAgent(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    Unix-socket server that answers secret lookups on behalf of runner jobs
+    using one long-lived authenticated session.
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        socket_path: str,
+        lookups: Dict[str, Any],
+        policy: AgentPolicy,
+        authentication_obj: Any,
+        logger: logging.Logger,
+        cache_ttl_seconds: float = 0,
+    ):
+        """
+        Args:
+            socket_path (str): Filesystem path of the Unix socket to listen on.
+            lookups (dict): Lookup objects exposing ``get_secret(path)``, keyed
+                by lookup kind ("secret" or "managed_account").
+            policy (AgentPolicy): Access policy used to scope each job.
+            authentication_obj (Authentication): Authenticated session shared
+                by every lookup object.
+            logger (logging.Logger): Logger object for logging.
+            cache_ttl_seconds (float): Time to keep retrieved values in memory.
+        """
+        session_guard = batch.SessionGuard(authentication_obj)
+        self._lookups = {
+            kind: batch.ResilientLookup(lookup, session_guard)
+            for kind, lookup in lookups.items()
+        }
+        self._policy = policy
+        self._logger = logger
+        self._cache = SecretCache(cache_ttl_seconds)
+
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+
+        # created owner-only, a chmod after bind would leave the socket open
+        # to other users until it runs
+        umask = os.umask(0o177)
+        try:
+            super().__init__(socket_path, _AgentRequestHandler)
+        finally:
+            os.umask(umask)
+
+    def server_close(self) -> None:
+        super().server_close()
+        self._cache.clear()
+        if os.path.exists(self.server_address):
+            os.unlink(self.server_address)
+
+    def lookup(self, token: str, kind: str, path: str) -> Dict[str, Any]:
+        """
+        Resolve a single lookup for a job.
+
+        Args:
+            token (str): Job token identifying the caller's access scope.
+            kind (str): Lookup kind, "secret" or "managed_account".
+            path (str): Secret or managed account path.
+
+        Returns:
+            dict: Response message sent back to the client.
+        """
+        if kind not in self._lookups or not isinstance(path, str):
+            return {"ok": False, "error": "Unsupported agent request"}
+
+        if not self._policy.is_allowed(token, kind, path):
+            self._logger.warning("Agent denied a %s lookup", kind)
+            return {"ok": False, "error": "Access denied by agent policy"}
+
+        value = self._cache.get(kind, path)
+        if value is not None:
+            return {"ok": True, "value": value, "cached": True}
+
+        try:
+            value = self._lookups[kind].get_secret(path)
+        except Exception as e:
+            self._logger.error("Agent %s lookup failed", kind)
+            return {"ok": False, "error": str(e)}
+
+        self._cache.put(kind, path, value)
+        return {"ok": True, "value": value, "cached": False}
+
+
+class AgentClient:
+    """
+    Thin client for a running SecretsAgent, exposing the same ``get_secret``
+    interface as the library lookup objects.
+    """
+
+    def __init__(self, socket_path: str, token: str, kind: str):
+        """
+        Args:
+            socket_path (str): Filesystem path of the agent Unix socket.
+            token (str): Job token sent with every lookup.
+            kind (str): Lookup kind, "secret" or "managed_account".
+        """
+        self._socket_path = socket_path
+        self._token = token
+        self._kind = kind
+        self.cache_hits = 0
+
+    def get_secret(self, path: str) -> str:
+        """
+        Retrieve a secret through the agent.
+
+        Args:
+            path (str): Secret or managed account path.
+
+        Returns:
+            str: The secret value.
+
+        Raises:
+            exceptions.LookupError: If the agent rejects or fails the lookup.
+        """
+        request = {"token": self._token, "kind": self._kind, "path": path}
+
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(SOCKET_TIMEOUT_SECONDS)
+            sock.connect(self._socket_path)
+            sock.sendall(json.dumps(request).encode("utf-8") + b"\n")
+            with sock.makefile("rb") as fh:
+                response = json.loads(fh.readline())
+
+        if not response.get("ok"):
+            raise exceptions.LookupError(f"Agent lookup failed: {response['error']}")
+
+        if response.get("cached"):
+            self.cache_hits += 1
+        return response["value"]
@@ -0,0 +1,187 @@
+"""
+Batch result model for secret retrieval.
+
+Every lookup made during a run is recorded with its outcome and latency so
+that successful outputs can still be published when some lookups fail, and a
+structured error summary can be reported at the end of the run.
+"""
+
+import threading
+from typing import Any, Dict, List, NamedTuple, Optional
+
+from secrets_safe_library import exceptions
+from secrets_safe_library.security import sanitize_sensitive_data
+
+SUCCESS = "success"
+FAILED = "failed"
+SKIPPED = "skipped"
+
+# Error policies deciding whether failed lookups fail the step
+POLICY_REQUIRED = "required"
+POLICY_ANY = "any"
+POLICY_NEVER = "never"
+ERROR_POLICIES = (POLICY_REQUIRED, POLICY_ANY, POLICY_NEVER)
+
+
+class LookupResult(NamedTuple):
+    """
+    Outcome of a single secret or managed account lookup.
+    """
+
+    output_id: str
+    status: str
+    latency_seconds: float
+    error: Optional[str] = None
+    error_type: Optional[str] = None
+
+
+class BatchResult:
+    """
+    Collects the LookupResult of every lookup made during a run.
+    """
+
+    def __init__(self):
+        self.results: List[LookupResult] = []
+
+    def record(
+        self,
+        output_id: str,
+        status: str,
+        latency_seconds: float,
+        error: Optional[Exception] = None,
+    ) -> None:
+        """
+        Record the outcome of a lookup. Error messages are sanitized before
+        being stored because they end up in step outputs and logs.
+        """
+        message = sanitize_sensitive_data(str(error)) if error is not None else None
+        error_type = type(error).__name__ if error is not None else None
+        self.results.append(
+            LookupResult(output_id, status, latency_seconds, message, error_type)
+        )
+
+    @property
+    def failed(self) -> List[LookupResult]:
+        return [result for result in self.results if result.status == FAILED]
+
+    @property
+    def skipped(self) -> List[LookupResult]:
+        return [result for result in self.results if result.status == SKIPPED]
+
+    @property
+    def error_count(self) -> int:
+        return len(self.failed) + len(self.skipped)
+
+    def should_fail(self, policy: str) -> bool:
+        """
+        Decide whether the step must fail under the given error policy.
+
+        Args:
+            policy (str): One of "required" (fail when a required lookup
+                failed), "any" (fail when any lookup failed or was skipped)
+                or "never".
+
+        Returns:
+            bool: True if the step must fail.
+        """
+        if policy == POLICY_NEVER:
+            return False
+        if policy == POLICY_ANY:
+            return self.error_count > 0
+        return bool(self.failed)
+
+    def error_summary(self) -> List[Dict[str, object]]:
+        """
+        Build the structured summary of failed and skipped lookups.
+
+        Returns:
+            list: One dictionary per unsuccessful lookup.
+        """
+        return [
+            {
+                "output_id": result.output_id,
+                "status": result.status,
+                "latency_ms": round(result.latency_seconds * 1000, 1),
+                "error": result.error,
+            }
+            for result in self.results
+            if result.status != SUCCESS
+        ]
+
+
+class SessionGuard:
+    """
+    Tracks whether a shared authenticated session is still signed in. The
+    library signs the session out on every unsuccessful request, so after a
+    failed lookup the guard signs in again before the next one.
+    """
+
+    def __init__(self, authentication_obj: Any):
+        """
+        Args:
+            authentication_obj (Authentication): The shared session.
+        """
+        self._authentication_obj = authentication_obj
+        self._lock = threading.Lock()
+        self._session_valid = True
+
+    def ensure(self) -> None:
+        """
+        Sign in again if the session was invalidated.
+
+        Raises:
+            exceptions.AuthenticationFailure: If signing in fails.
+        """
+        with self._lock:
+            if self._session_valid:
+                return
+            response = self._authentication_obj.get_api_access()
+            if response.status_code != 200:
+                raise exceptions.AuthenticationFailure(
+                    "Could not re-authenticate against Secrets Safe"
+                )
+            self._session_valid = True
+
+    def invalidate(self) -> None:
+        """
+        Mark the session as signed out.
+        """
+        with self._lock:
+            self._session_valid = False
+
+
+class ResilientLookup:
+    """
+    Wraps a lookup object so that one failed lookup does not fail the ones
+    after it because the session was signed out.
+    """
+
+    def __init__(self, lookup: Any, session_guard: SessionGuard):
+        """
+        Args:
+            lookup: Object exposing ``get_secret(path)``.
+            session_guard (SessionGuard): Guard of the session used by the
+                lookup, shared by every lookup on that session.
+        """
+        self._lookup = lookup
+        self._session_guard = session_guard
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._lookup, name)
+
+    def get_secret(self, path: str) -> str:
+        """
+        Retrieve a secret, signing in again first if a previous lookup failed.
+
+        Args:
+            path (str): Secret or managed account path.
+
+        Returns:
+            str: The secret value.
+        """
+        self._session_guard.ensure()
+        try:
+            return self._lookup.get_secret(path)
+        except Exception:
+            self._session_guard.invalidate()
+            raise
@@ -0,0 +1,554 @@
+"""
+Reusable Secrets Safe client for in-process use.
+
+SecretsSafeClient holds the configuration, the HTTP session and the
+authenticated session of the action, independently of its environment
+variables and step outputs. Python tooling and long-running services can
+import it to retrieve batches of secrets under one sign-in, without starting
+the action container for every call. The action entrypoint is a thin wrapper
+around it.
+"""
+
+import concurrent.futures
+import logging
+import re
+import time
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import requests
+import secrets_safe_library
+from secrets_safe_library import (
+    authentication,
+    exceptions,
+    managed_account,
+    secrets_safe,
+    utils,
+)
+from src import (
+    accounts,
+    agent,
+    batch,
+    metrics,
+    postprocess,
+    schema,
+    structured_logging,
+    tracing,
+    transport,
+)
+
+DEFAULT_TIMEOUT_SECONDS = 30
+DEFAULT_POSTPROCESS_INLINE_THRESHOLD_BYTES = 256 * 1024
+
+OUTPUT_ID_PATTERN = re.compile(r"[a-zA-Z_][a-zA-Z0-9_-]*")
+
+
+class ClientConfig(NamedTuple):
+    """
+    Connection settings of a SecretsSafeClient. Either api_key, or client_id
+    and client_secret, are required.
+    """
+
+    api_url: str
+    api_key: Optional[str] = None
+    client_id: Optional[str] = None
+    client_secret: Optional[str] = None
+    api_version: Optional[str] = None
+    verify_ca: bool = True
+    certificate: str = ""
+    certificate_key: str = ""
+    timeout_connection_seconds: int = DEFAULT_TIMEOUT_SECONDS
+    timeout_request_seconds: int = DEFAULT_TIMEOUT_SECONDS
+    probe_timeout_seconds: float = transport.DEFAULT_PROBE_TIMEOUT_SECONDS
+    rate_limit_rps: float = 0
+    rate_limit_burst: float = 0
+    startup_jitter_seconds: float = 0
+    path_separator: str = "/"
+    decrypt: bool = True
+    postprocess_inline_threshold_bytes: int = DEFAULT_POSTPROCESS_INLINE_THRESHOLD_BYTES
+    postprocess_max_workers: int = 1
+    managed_account_max_workers: int = accounts.DEFAULT_MAX_WORKERS
+    request_duration_minutes: int = 0
+    request_lease_file: str = ""
+
+
+class SecretEntry:
+    """
+    Secret or managed account to retrieve, validated by a secret entry
+    schema.
+    """
+
+    __slots__ = ("path", "output_id", "priority", "required", "decode", "convert")
+
+    def __init__(
+        self,
+        path: str,
+        output_id: str,
+        priority: int = 0,
+        required: bool = True,
+        decode: Optional[str] = None,
+        convert: Optional[str] = None,
+    ):
+        self.path = path
+        self.output_id = output_id
+        self.priority = priority
+        self.required = required
+        self.decode = decode
+        self.convert = convert
+
+
+def secret_entry_schema(reserved_output_ids: Tuple[str, ...] = ()) -> schema.Schema:
+    """
+    Compile the schema of secret entries.
+
+    Args:
+        reserved_output_ids (Tuple[str, ...]): Output ids the entries cannot
+            use.
+
+    Returns:
+        schema.Schema: The schema, building SecretEntry records.
+    """
+    return schema.Schema(
+        SecretEntry,
+        [
+            schema.Field("path", (str,), required=True, hint="must be a string"),
+            schema.Field(
+                "output_id",
+                (str,),
+                required=True,
+                pattern=OUTPUT_ID_PATTERN,
+                reserved=reserved_output_ids,
+                hint="must be a string starting with a letter or underscore and "
+                "contain only alphanumeric characters, underscores, or hyphens",
+            ),
+            schema.Field("priority", (int,), default=0, hint="must be an integer"),
+            schema.Field(
+                "required", (bool,), default=True, hint="must be true or false"
+            ),
+            schema.Field("decode", (str,), nullable=True, choices=postprocess.DECODERS),
+            schema.Field(
+                "convert", (str,), nullable=True, choices=postprocess.CONVERTERS
+            ),
+        ],
+        "secret entry",
+    )
+
+
+SECRET_ENTRIES = secret_entry_schema()
+
+
+def schedule_entries(entries: List[SecretEntry]) -> List[SecretEntry]:
+    """
+    Order secret entries so that higher priority entries are looked up
+    first. Entries with the same priority keep their input order. Only the
+    lookup order changes, values are published after the whole batch.
+
+    Args:
+        entries (List[SecretEntry]): Secret entries.
+
+    Returns:
+        List[SecretEntry]: The entries in retrieval order.
+    """
+    return sorted(entries, key=lambda entry: -entry.priority)
+
+
+def retrieve_entries(
+    lookup,
+    entries: List[SecretEntry],
+    batch_result: batch.BatchResult,
+    logger: logging.Logger,
+) -> Tuple[List[str], List[postprocess.PostProcessJob]]:
+    """
+    Look up secret entries in priority order and record the outcome and
+    latency of every lookup. A failed lookup does not stop the remaining ones;
+    it is recorded as failed, or as skipped when the entry is marked as not
+    required. Lookups with a ``prefetch(paths)`` method retrieve the whole
+    batch first.
+
+    Args:
+        lookup: Object with a ``get_secret(path)`` method, and optionally a
+            ``prefetch(paths)`` method.
+        entries (List[SecretEntry]): Validated secret entries.
+        batch_result (batch.BatchResult): Collector for the lookup outcomes.
+        logger (logging.Logger): Logger.
+
+    Returns:
+        Tuple[List[str], List[postprocess.PostProcessJob]]: The output_ids
+        and post-processing jobs of the retrieved secrets.
+    """
+    output_ids = []
+    jobs = []
+    scheduled = schedule_entries(entries)
+    prefetch = getattr(lookup, "prefetch", None)
+    if prefetch is not None:
+        prefetch([entry.path for entry in scheduled])
+
+    for entry in scheduled:
+        output_id = entry.output_id
+        started = time.perf_counter()
+        try:
+            value = lookup.get_secret(entry.path)
+        except Exception as e:
+            latency = time.perf_counter() - started
+            if entry.required:
+                logger.error(f"Secret {output_id} failed: {e}")
+                status = batch.FAILED
+            else:
+                logger.warning(f"Optional secret {output_id} skipped: {e}")
+                status = batch.SKIPPED
+            batch_result.record(output_id, status, latency, e)
+            _log_lookup(logger, entry, started, status)
+            continue
+
+        batch_result.record(output_id, batch.SUCCESS, time.perf_counter() - started)
+        _log_lookup(logger, entry, started, batch.SUCCESS)
+        if value:
+            output_ids.append(output_id)
+            jobs.append(
+                postprocess.PostProcessJob(
+                    value, decode=entry.decode, convert=entry.convert
+                )
+            )
+
+    return output_ids, jobs
+
+
+def _log_lookup(
+    logger: logging.Logger, entry: SecretEntry, started: float, status: str
+):
+    structured_logging.log_event(
+        logger,
+        logging.DEBUG,
+        "get_secret",
+        path=entry.path,
+        started=started,
+        output_id=entry.output_id,
+        status=status,
+    )
+
+
+class SecretsSafeClient:
+    """
+    Client holding one HTTP session and one authenticated Secrets Safe
+    session. Use it as a context manager, or call sign_in() and close().
+    """
+
+    def __init__(
+        self,
+        config: ClientConfig,
+        logger: Optional[logging.Logger] = None,
+        metrics_registry: Optional[metrics.Metrics] = None,
+        trace_recorder: Optional[tracing.TraceRecorder] = None,
+    ):
+        """
+        Args:
+            config (ClientConfig): Connection settings.
+            logger (logging.Logger, optional): Logger, also used by the
+                library.
+            metrics_registry (metrics.Metrics, optional): Registry collecting
+                the HTTP and sign-in metrics.
+            trace_recorder (tracing.TraceRecorder, optional): Recorder of the
+                HTTP calls.
+        """
+        self.config = config
+        self._logger = logger or logging.getLogger(__name__)
+        self._metrics = metrics_registry
+        self._trace = trace_recorder
+        self._session: Optional[requests.Session] = None
+        self._authentication_obj: Optional[authentication.Authentication] = None
+        self._session_guard: Optional[batch.SessionGuard] = None
+        self._pending_sign_in: Optional[concurrent.futures.Future] = None
+        self._lookups: Dict[str, object] = {}
+        self._account_index: Optional[accounts.AccountIndex] = None
+        self._leases: Optional[accounts.RequestLeases] = None
+
+    def __enter__(self) -> "SecretsSafeClient":
+        if self._authentication_obj is None:
+            self.wait_signed_in()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    @property
+    def authentication_obj(self) -> authentication.Authentication:
+        """
+        The authenticated session, signing in on first use.
+        """
+        if self._authentication_obj is None:
+            self.wait_signed_in()
+        return self._authentication_obj
+
+    def _auth_config(self, api_url: str) -> dict:
+        config = self.config
+        certificate, certificate_key = utils.prepare_certificate_info(
+            config.certificate, config.certificate_key
+        )
+        auth_config = {
+            "req": self._session,
+            "timeout_connection": config.timeout_connection_seconds,
+            "timeout_request": config.timeout_request_seconds,
+            "api_url": api_url,
+            "certificate": certificate,
+            "certificate_key": certificate_key,
+            "verify_ca": config.verify_ca,
+            "logger": self._logger,
+        }
+
+        # The recommended version is 3.1. If no version is specified,
+        # the default API version 3.0 will be used
+        if config.api_version:
+            auth_config["api_version"] = config.api_version
+
+        # If api_key is set, we're using API Key authentication
+        # otherwise we're using OAuth/Client Credentials.
+        if config.api_key:
+            auth_config["api_key"] = config.api_key
+        else:
+            auth_config["client_id"] = config.client_id
+            auth_config["client_secret"] = config.client_secret
+        return auth_config
+
+    def sign_in(self) -> authentication.Authentication:
+        """
+        Open the HTTP session and sign in to Secrets Safe.
+
+        Returns:
+            authentication.Authentication: The authenticated session.
+
+        Raises:
+            exceptions.AuthenticationFailure: If signing in fails.
+        """
+        config = self.config
+        self._session = requests.Session()
+        if self._metrics is not None:
+            self._metrics.instrument_session(self._session)
+
+        # probes the nodes when api_url lists several, see transport
+        api_url = transport.mount_adapter(
+            self._session,
+            transport.parse_api_urls(config.api_url),
+            self._logger,
+            probe_timeout=config.probe_timeout_seconds,
+            verify=config.verify_ca,
+            rate_limiter=transport.build_rate_limiter(
+                config.rate_limit_rps, config.rate_limit_burst
+            ),
+            startup_jitter_seconds=config.startup_jitter_seconds,
+        )
+        if self._trace is not None:
+            self._trace.instrument_session(self._session, api_url or config.api_url)
+
+        authentication_obj = authentication.Authentication(
+            **self._auth_config(api_url or config.api_url)
+        )
+        started = time.perf_counter()
+        response = authentication_obj.get_api_access()
+        if self._metrics is not None:
+            self._metrics.observe(
+                "auth_seconds",
+                time.perf_counter() - started,
+                help_text="Latency of the sign-in to Secrets Safe.",
+            )
+
+        utils.print_log(
+            self._logger,
+            f"{secrets_safe_library.__library_name__} "
+            f"version: {secrets_safe_library.__version__}",
+            logging.DEBUG,
+        )
+
+        if response.status_code != 200:
+            self._close_session()
+            raise exceptions.AuthenticationFailure(
+                f"Please check credentials, error {response.text}"
+            )
+
+        self._authentication_obj = authentication_obj
+        self._session_guard = batch.SessionGuard(authentication_obj)
+        # a request failed over to another node signs in again there
+        transport.guard_session(self._session, self._session_guard)
+        self._lookups = {}
+        self._account_index = None
+        return authentication_obj
+
+    def start_sign_in(self) -> None:
+        """
+        Sign in on a background thread, so that the TLS handshake and the
+        sign-in overlap with local work, e.g. parsing the inputs.
+        wait_signed_in() waits for it and raises its error.
+        """
+        executor = concurrent.futures.ThreadPoolExecutor(
+            1, thread_name_prefix="sign-in"
+        )
+        self._pending_sign_in = executor.submit(self.sign_in)
+        executor.shutdown(wait=False)
+
+    def wait_signed_in(self) -> authentication.Authentication:
+        """
+        Wait for the sign-in started with start_sign_in(), or sign in now
+        when none was started.
+
+        Returns:
+            authentication.Authentication: The authenticated session.
+
+        Raises:
+            exceptions.AuthenticationFailure: If signing in fails.
+        """
+        pending, self._pending_sign_in = self._pending_sign_in, None
+        if pending is None:
+            return self.sign_in()
+        return pending.result()
+
+    def close(self) -> None:
+        """
+        Wait for a sign-in still running, store the open credential requests,
+        sign out and close the HTTP session.
+        """
+        pending, self._pending_sign_in = self._pending_sign_in, None
+        if pending is not None and pending.exception() is not None:
+            # the caller is already failing, e.g. on invalid inputs
+            self._logger.debug(f"Sign-in failed: {pending.exception()}")
+        self._close_session()
+
+    def _close_session(self) -> None:
+        if self._leases is not None:
+            self._leases.save()
+        if self._authentication_obj is not None:
+            self._authentication_obj.sign_app_out()
+            self._authentication_obj = None
+        if self._session is not None:
+            transport.log_throttling(self._session, self._logger)
+            self._session.close()
+            self._session = None
+
+    def library_lookup(self, kind: str = agent.SECRET_KIND):
+        """
+        Get the library object looking up secrets or managed accounts.
+
+        Args:
+            kind (str): agent.SECRET_KIND or agent.MANAGED_ACCOUNT_KIND.
+
+        Returns:
+            secrets_safe.SecretsSafe | managed_account.ManagedAccount: The
+            lookup object.
+        """
+        if kind not in self._lookups:
+            if kind == agent.SECRET_KIND:
+                self._lookups[kind] = secrets_safe.SecretsSafe(
+                    authentication=self.authentication_obj,
+                    logger=self._logger,
+                    separator=self.config.path_separator,
+                    decrypt=self.config.decrypt,
+                )
+            elif kind == agent.MANAGED_ACCOUNT_KIND:
+                self._lookups[kind] = managed_account.ManagedAccount(
+                    authentication=self.authentication_obj,
+                    logger=self._logger,
+                    separator=self.config.path_separator,
+                )
+            else:
+                raise ValueError(f"Unsupported lookup kind {kind!r}")
+        return self._lookups[kind]
+
+    def request_leases(self) -> Optional[accounts.RequestLeases]:
+        """
+        Get the credential requests kept open for the job, loading them on
+        first use.
+
+        Returns:
+            accounts.RequestLeases, optional: The leases, None unless both
+            request_duration_minutes and request_lease_file are set.
+        """
+        config = self.config
+        if config.request_duration_minutes <= 0 or not config.request_lease_file:
+            return None
+        if self._leases is None:
+            self._leases = accounts.RequestLeases(
+                config.request_lease_file, config.request_duration_minutes
+            ).load()
+        return self._leases
+
+    def check_in_requests(self) -> int:
+        """
+        Check in the credential requests kept open for the job.
+
+        Returns:
+            int: Number of requests that could not be checked in.
+        """
+        leases = self.request_leases()
+        if leases is None:
+            return 0
+        return leases.check_in_all(self.library_lookup(agent.MANAGED_ACCOUNT_KIND))
+
+    def lookup(
+        self, kind: str = agent.SECRET_KIND
+    ) -> batch.ResilientLookup | accounts.ManagedAccountBatch:
+        """
+        Get a lookup object that signs in again after a failed lookup. Managed
+        accounts are retrieved in batches through the account id index of the
+        client, unless managed_account_max_workers is 0, and reuse the
+        credential requests kept open for the job.
+
+        Args:
+            kind (str): agent.SECRET_KIND or agent.MANAGED_ACCOUNT_KIND.
+
+        Returns:
+            batch.ResilientLookup | accounts.ManagedAccountBatch: The lookup
+            object.
+        """
+        lookup = self.library_lookup(kind)
+        max_workers = self.config.managed_account_max_workers
+        if kind != agent.MANAGED_ACCOUNT_KIND or max_workers <= 0:
+            return batch.ResilientLookup(lookup, self._session_guard)
+
+        if self._account_index is None:
+            self._account_index = accounts.AccountIndex(
+                lookup, self.config.path_separator
+            )
+        return accounts.ManagedAccountBatch(
+            lookup,
+            self._session_guard,
+            self._account_index,
+            max_workers,
+            self._logger,
+            self.request_leases(),
+        )
+
+    def get_many(
+        self,
+        entries: List[dict],
+        kind: str = agent.SECRET_KIND,
+        batch_result: Optional[batch.BatchResult] = None,
+    ) -> Dict[str, str]:
+        """
+        Retrieve and post-process a batch of secrets or managed accounts.
+
+        Args:
+            entries (List[dict]): Secret entries with "path" and "output_id",
+                and optional "priority", "required", "decode" and "convert".
+            kind (str): agent.SECRET_KIND or agent.MANAGED_ACCOUNT_KIND.
+            batch_result (batch.BatchResult, optional): Collector for the
+                lookup outcomes, failed lookups are only reported there.
+
+        Returns:
+            Dict[str, str]: The retrieved values keyed by output_id.
+
+        Raises:
+            schema.SchemaError: If an entry is invalid, before any lookup.
+            postprocess.PostProcessError: If a value cannot be transformed.
+        """
+        if batch_result is None:
+            batch_result = batch.BatchResult()
+
+        records = SECRET_ENTRIES.parse(entries, "entries")
+        output_ids, jobs = retrieve_entries(
+            self.lookup(kind), records, batch_result, self._logger
+        )
+        processed = postprocess.run_pipeline(
+            jobs,
+            self.config.postprocess_inline_threshold_bytes,
+            self.config.postprocess_max_workers,
+        )
+        return {
+            output_id: secret.value for output_id, secret in zip(output_ids, processed)
+        }
@@ -1,24 +1,108 @@
 import json
-import logging
 import os
-import re
+import signal
+import sys
+import threading
+import time
 import uuid
 
-import requests
-import secrets_safe_library
-from requests.adapters import HTTPAdapter
-from secrets_safe_library import authentication, managed_account, secrets_safe, utils
+from secrets_safe_library import authentication, exceptions, secrets_safe
 from secrets_safe_library.integrations.github_actions.common_utils import common
-from urllib3.util.retry import Retry
+from src import (
+    accounts,
+    agent,
+    batch,
+    client,
+    metrics,
+    plan,
+    postprocess,
+    schema,
+    secret_value,
+    snapshot,
+    structured_logging,
+    tracing,
+    transport,
+)
 
 env = os.environ
 
+# invalid settings, which fall back to their defaults, reported by
+# check_settings
+INVALID_SETTINGS = []
+
+
+def number_setting(name: str, default: float, parse=float, valid=None) -> float:
+    """
+    Reads a numeric setting from the environment. A value that cannot be
+    parsed, or is rejected by valid, is recorded in INVALID_SETTINGS, to be
+    reported once the run starts, and the default is used meanwhile.
+
+    Arguments:
+        name (str): Name of the environment variable.
+        default (float): Value used when the variable is unset or empty.
+        parse (callable, optional): Conversion of the value, int or float.
+        valid (callable, optional): Check of the parsed value.
+
+    Returns:
+        float: The setting.
+    """
+
+    value = env.get(name, "").strip()
+    if not value:
+        return default
+    try:
+        number = parse(value)
+    except ValueError:
+        number = None
+    if number is None or (valid is not None and not valid(number)):
+        INVALID_SETTINGS.append(f"{name}={value!r}")
+        return default
+    return number
+
+
+def choice_setting(name: str, choices: tuple, default: str) -> str:
+    """
+    Reads a setting with a fixed set of values from the environment,
+    case-insensitively. Any other value is recorded in INVALID_SETTINGS
+    and the default is used meanwhile.
+
+    Arguments:
+        name (str): Name of the environment variable.
+        choices (tuple): The accepted values, in lower case.
+        default (str): Value used when the variable is unset or empty.
+
+    Returns:
+        str: The setting.
+    """
+
+    value = env.get(name, "").strip().lower()
+    if not value:
+        return default
+    if value not in choices:
+        INVALID_SETTINGS.append(f"{name}={value!r}")
+        return default
+    return value
+
+
 API_KEY = env.get("API_KEY")
 CLIENT_ID = env.get("CLIENT_ID")
 CLIENT_SECRET = env.get("CLIENT_SECRET")
 API_URL = env.get("API_URL")
 API_VERSION = env.get("API_VERSION")
 VERIFY_CA = env.get("VERIFY_CA", "true").lower() != "false"
+API_PROBE_TIMEOUT_SECONDS = number_setting(
+    "API_PROBE_TIMEOUT_SECONDS", transport.DEFAULT_PROBE_TIMEOUT_SECONDS
+)
+RATE_LIMIT_RPS = number_setting("RATE_LIMIT_RPS", 0.0)
+RATE_LIMIT_BURST = number_setting("RATE_LIMIT_BURST", 0.0)
+STARTUP_JITTER_SECONDS = number_setting("STARTUP_JITTER_SECONDS", 0.0)
+# Prometheus textfile metrics, written when METRICS_DIR is set
+METRICS_DIR = env.get("METRICS_DIR", "").strip()
+RUNNER_NAME = env.get("RUNNER_NAME", "").strip()
+METRICS = metrics.Metrics({"action": "get_secret", "runner": RUNNER_NAME})
+# anonymized traces of the HTTP calls, appended to TRACE_FILE when set
+TRACE_FILE = env.get("TRACE_FILE", "").strip()
+TRACE = tracing.TraceRecorder("get_secret") if TRACE_FILE else None
 DECRYPT = env.get("INPUT_DECRYPT", "true").lower() == "true"
 
 SECRET_PATH = env.get("INPUT_SECRET_PATH", "").strip() or None
@@ -26,6 +110,41 @@ MANAGED_ACCOUNT_PATH = env.get("INPUT_MANAGED_ACCOUNT_PATH", "").strip() or None
 path_sep = env.get("PATH_SEPARATOR", "/").strip()
 PATH_SEPARATOR = path_sep if len(path_sep) == 1 else "/"
 MAX_SECRETS_TO_RETRIEVE = 20
+POSTPROCESS_INLINE_THRESHOLD_BYTES = number_setting(
+    "POSTPROCESS_INLINE_THRESHOLD_BYTES", 256 * 1024, int
+)
+SECRET_BUFFER_THRESHOLD_BYTES = number_setting(
+    "SECRET_BUFFER_THRESHOLD_BYTES", 64 * 1024, int
+)
+SECRET_MAX_BYTES = number_setting("SECRET_MAX_BYTES", 64 * 1024 * 1024, int)
+POSTPROCESS_MAX_WORKERS = number_setting(
+    "POSTPROCESS_MAX_WORKERS", os.cpu_count() or 1, int
+)
+MANAGED_ACCOUNT_MAX_WORKERS = number_setting(
+    "MANAGED_ACCOUNT_MAX_WORKERS", accounts.DEFAULT_MAX_WORKERS, int
+)
+CREDENTIAL_REQUEST_MINUTES = number_setting("CREDENTIAL_REQUEST_MINUTES", 0, int)
+RUNNER_TEMP = env.get("RUNNER_TEMP", "").strip()
+REQUEST_LEASE_FILE = (
+    os.path.join(RUNNER_TEMP, "secrets_safe_requests.json") if RUNNER_TEMP else ""
+)
+
+SNAPSHOT_EXPORT = "export"
+SNAPSHOT_IMPORT = "import"
+SNAPSHOT_MODES = (SNAPSHOT_EXPORT, SNAPSHOT_IMPORT)
+SNAPSHOT_MODE = env.get("INPUT_SNAPSHOT_MODE", "").strip().lower()
+SNAPSHOT_FILE = env.get("INPUT_SNAPSHOT_FILE", "").strip() or "secrets.bundle"
+SNAPSHOT_TTL_SECONDS = number_setting("INPUT_SNAPSHOT_TTL_SECONDS", 3600, int)
+SNAPSHOT_KEY = env.get("SNAPSHOT_KEY", "")
+
+DRY_RUN = env.get("INPUT_DRY_RUN", "false").strip().lower() == "true"
+PLAN_OUTPUT = "plan"
+
+ERROR_POLICY = env.get("INPUT_ERROR_POLICY", batch.POLICY_REQUIRED).strip().lower()
+ERROR_COUNT_OUTPUT = "error_count"
+ERROR_SUMMARY_OUTPUT = "error_summary"
+RESERVED_OUTPUT_IDS = (ERROR_COUNT_OUTPUT, ERROR_SUMMARY_OUTPUT)
+SECRET_ENTRIES = client.secret_entry_schema(RESERVED_OUTPUT_IDS)
 
 LOG_LEVEL = env.get("LOG_LEVEL", "INFO").strip().upper()
 
@@ -42,12 +161,21 @@ LOG_LEVELS = {
 
 LOGGER_NAME = "custom_logger"
 
-logging.basicConfig(
-    format="%(asctime)-5s %(name)-15s %(levelname)-8s %(message)s",
-    level=LOG_LEVELS[LOG_LEVEL],
+# "text" or "json", see structured_logging
+LOG_FORMAT = choice_setting(
+    "LOG_FORMAT", structured_logging.LOG_FORMATS, structured_logging.TEXT_FORMAT
+)
+LOG_SAMPLE_RATE = number_setting(
+    "LOG_SAMPLE_RATE", 1.0, valid=lambda rate: 0 <= rate <= 1
 )
 
-logger = logging.getLogger(LOGGER_NAME)
+logger = structured_logging.configure_logging(
+    LOGGER_NAME,
+    LOG_LEVELS[LOG_LEVEL],
+    log_format=LOG_FORMAT,
+    sample_rate=LOG_SAMPLE_RATE,
+    run_id=env.get("GITHUB_RUN_ID"),
+)
 TIMEOUT_CONNECTION_SECONDS = 30
 TIMEOUT_REQUEST_SECONDS = 30
 CERTIFICATE = env.get("CERTIFICATE", "").replace(r"\n", "\n")
@@ -55,44 +183,78 @@ CERTIFICATE_KEY = env.get("CERTIFICATE_KEY", "").replace(r"\n", "\n")
 
 COMMAND_MARKER: str = "::"
 
+# resident agent
+AGENT_MODE = env.get("AGENT_MODE", "").strip().lower()
+AGENT_SOCKET = env.get("AGENT_SOCKET", "").strip() or None
+AGENT_TOKEN = env.get("AGENT_TOKEN", "")
+AGENT_POLICY_FILE = env.get("AGENT_POLICY_FILE", "").strip()
+AGENT_CACHE_TTL_SECONDS = number_setting("AGENT_CACHE_TTL_SECONDS", 300, int)
+
 
-def append_output(name: str, value: str) -> None:
+def append_output(name: str, value: str | secret_value.SecretValue) -> None:
     """
     Appends a named value to the GitHub Actions step output file.
 
     Arguments:
         name (str): The name of the output variable.
-        value (str): The content to be written as the output.
+        value (str | SecretValue): The content to be written as the output.
+        A SecretValue is written straight from its buffer.
 
     Returns:
         None
     """
 
-    with open(os.environ["GITHUB_OUTPUT"], "a") as fh:
-        delimiter = uuid.uuid4()
-        print(f"{name}<<{delimiter}", file=fh)
-        print(value, file=fh)
-        print(delimiter, file=fh)
+    with open(os.environ["GITHUB_OUTPUT"], "ab") as fh:
+        delimiter = str(uuid.uuid4()).encode("utf-8")
+        fh.write(name.encode("utf-8") + b"<<" + delimiter + b"\n")
+        if isinstance(value, secret_value.SecretValue):
+            fh.write(value.view())
+        else:
+            fh.write(value.encode("utf-8"))
+        fh.write(b"\n" + delimiter + b"\n")
 
 
-def mask_secret(command: str, secret_to_mask: str) -> None:
+def mask_secret(command: str, secret_to_mask: str | secret_value.SecretValue) -> None:
     """
     Masks a secret by modifying the command to prevent it from being printed
     in the console.
 
     Arguments:
         command (str): The command associated with the secret.
-        secret_to_mask (str): The secret text to be masked.
+        secret_to_mask (str | SecretValue): The secret text to be masked. The
+        lines of a SecretValue are written straight from its buffer.
+
+    Returns:
+        None
+    """
+
+    if isinstance(secret_to_mask, secret_value.SecretValue):
+        prefix = f"{COMMAND_MARKER}{command} {COMMAND_MARKER}".encode("utf-8")
+        sys.stdout.flush()
+        for line in secret_to_mask.mask_lines():
+            sys.stdout.buffer.write(prefix)
+            sys.stdout.buffer.write(line)
+            sys.stdout.buffer.write(b"\n")
+        sys.stdout.buffer.flush()
+        return
+
+    print_mask_commands(command, postprocess.mask_lines(secret_to_mask))
+
+
+def print_mask_commands(command: str, lines: list) -> None:
+    """
+    Prints the mask command for each of the given, already extracted, lines.
+
+    Arguments:
+        command (str): The command associated with the secret.
+        lines (list): Non-blank secret lines to be masked.
 
     Returns:
         None
     """
 
-    lines = secret_to_mask.split("\n")
     for line in lines:
-        if line.strip() != "":
-            full_command = f"{COMMAND_MARKER}{command} {COMMAND_MARKER}{line}"
-            print(full_command)
+        print(f"{COMMAND_MARKER}{command} {COMMAND_MARKER}{line}")
 
 
 def parse_secrets(secrets: str) -> list:
@@ -123,28 +285,22 @@ def parse_secrets(secrets: str) -> list:
     return data if isinstance(data, list) else [data]
 
 
-def get_secrets(
-    secret_obj: authentication.Authentication | secrets_safe.SecretsSafe, secrets: str
-) -> None:
+def load_secret_entries(secrets: str, input_name: str = "secrets") -> list:
     """
-    Retrieves secrets using the provided secret object and a JSON string of
-    secrets. Output is appended to GITHUB_OUTPUT.
+    Parses and validates every secret entry before any lookup is made. All
+    invalid entries are reported together, with their location.
 
     Arguments:
-        secret_obj (Authentication | SecretsSafe): An instance of either
-        Authentication or SecretsSafe class, handling secret operations.
         secrets (str): A JSON string containing a list of secrets or managed
         accounts.
+        input_name (str): Name of the input in error locations.
 
     Returns:
-        None
+        list: The validated SecretEntry records.
     """
 
     secrets_to_retrive = parse_secrets(secrets)
 
-    if not isinstance(secrets_to_retrive, list):
-        secrets_to_retrive = [secrets_to_retrive]
-
     if len(secrets_to_retrive) > MAX_SECRETS_TO_RETRIEVE:
         common.show_error(
             "The Secrets Safe action can request a maximum of "
@@ -153,121 +309,726 @@ def get_secrets(
             logger,
         )
 
-    for secret_to_retrieve in secrets_to_retrive:
-        if not isinstance(secret_to_retrieve, dict):
-            common.show_error(
-                "Invalid JSON, each secret entry must be a JSON object", logger
-            )
+    try:
+        return SECRET_ENTRIES.parse(secrets_to_retrive, input_name)
+    except schema.SchemaError as e:
+        common.show_error(str(e), logger)
+
 
-        if "path" not in secret_to_retrieve:
-            common.show_error("Invalid JSON, validate path attribute name", logger)
+def publish_value(output_id: str, processed: postprocess.ProcessedSecret) -> None:
+    """
+    Masks and publishes one post-processed secret.
 
-        if "output_id" not in secret_to_retrieve:
-            common.show_error("Invalid JSON, validate output_id attribute name", logger)
+    Arguments:
+        output_id (str): Output name.
+        processed (ProcessedSecret): The post-processed secret.
 
-        output_id = secret_to_retrieve["output_id"]
-        if not isinstance(output_id, str) or not re.fullmatch(
-            r"[a-zA-Z_][a-zA-Z0-9_-]*", output_id
-        ):
-            common.show_error(
-                f"Invalid output_id {repr(output_id)}: must be a string starting "
-                "with a letter or underscore and contain only alphanumeric "
-                "characters, underscores, or hyphens",
-                logger,
+    Returns:
+        None
+    """
+
+    if len(processed.value) >= SECRET_BUFFER_THRESHOLD_BYTES:
+        # Large values are published from a zeroizable buffer instead of
+        # going through further str copies. This is best effort: the str
+        # copies made before this point remain in memory.
+        with secret_value.SecretValue(
+            processed.value, max_bytes=SECRET_MAX_BYTES
+        ) as value:
+            mask_secret("add-mask", value)
+            append_output(output_id, value)
+    elif processed.mask_lines is None:
+        mask_secret("add-mask", processed.value)
+        append_output(output_id, processed.value)
+    else:
+        print_mask_commands("add-mask", processed.mask_lines)
+        append_output(output_id, processed.value)
+
+
+def publish_secrets(output_ids: list, jobs: list, sink: dict = None) -> None:
+    """
+    Post-processes retrieved secrets, then masks and publishes them in order.
+
+    Arguments:
+        output_ids (list): Output names, one per job.
+        jobs (list): Post-processing jobs holding the retrieved values.
+        sink (dict, optional): When given, the values are stored in it by
+        output_id instead of being published.
+
+    Returns:
+        None
+    """
+
+    try:
+        processed_secrets = postprocess.run_pipeline(
+            jobs, POSTPROCESS_INLINE_THRESHOLD_BYTES, POSTPROCESS_MAX_WORKERS
+        )
+    except postprocess.PostProcessError as e:
+        common.show_error(f"Error post-processing secret: {e}", logger)
+
+    for output_id, processed in zip(output_ids, processed_secrets):
+        if sink is not None:
+            sink[output_id] = processed.value
+        else:
+            publish_value(output_id, processed)
+
+
+def get_secrets(
+    secret_obj: authentication.Authentication | secrets_safe.SecretsSafe,
+    secrets: str | list,
+    batch_result: batch.BatchResult = None,
+    sink: dict = None,
+) -> batch.BatchResult:
+    """
+    Retrieves secrets using the provided secret object and a JSON string of
+    secrets. Output is appended to GITHUB_OUTPUT.
+
+    Every entry is validated before the first lookup. Entries are looked up
+    by descending priority and every lookup is recorded in the batch result,
+    so one failed lookup does not discard the others. Once every lookup is
+    done, the retrieved values go through the post-processing stage (decode,
+    convert, mask extraction) before being masked and published.
+
+    Arguments:
+        secret_obj (Authentication | SecretsSafe): An instance of either
+        Authentication or SecretsSafe class, handling secret operations.
+        secrets (str | list): A JSON string containing a list of secrets or
+        managed accounts, or their SecretEntry records already loaded.
+        batch_result (BatchResult, optional): Collector shared across calls.
+        A new one is created when not provided.
+        sink (dict, optional): Collects the values by output_id instead of
+        publishing them, used to export a snapshot bundle.
+
+    Returns:
+        BatchResult: The collector holding the outcome of every lookup.
+    """
+
+    if batch_result is None:
+        batch_result = batch.BatchResult()
+
+    secrets_to_retrieve = (
+        secrets if isinstance(secrets, list) else load_secret_entries(secrets)
+    )
+    output_ids, jobs = client.retrieve_entries(
+        secret_obj, secrets_to_retrieve, batch_result, logger
+    )
+    publish_secrets(output_ids, jobs, sink)
+
+    return batch_result
+
+
+def record_batch_metrics(batch_result: batch.BatchResult) -> None:
+    """
+    Records the latency of every lookup and the errors by type.
+
+    Arguments:
+        batch_result (BatchResult): The outcome of every lookup in the run.
+
+    Returns:
+        None
+    """
+
+    for result in batch_result.results:
+        METRICS.observe(
+            "lookup_seconds",
+            result.latency_seconds,
+            help_text="Latency of the secret lookups.",
+            status=result.status,
+        )
+        if result.error_type:
+            METRICS.inc(
+                "errors_total",
+                help_text="Errors by exception type.",
+                type=result.error_type,
             )
 
-        get_secret_response = secret_obj.get_secret(secret_to_retrieve["path"])
-        if get_secret_response:
-            mask_secret("add-mask", get_secret_response)
-            append_output(output_id, get_secret_response)
 
+def report_batch_result(batch_result: batch.BatchResult) -> None:
+    """
+    Publishes the error count and structured error summary outputs, then
+    fails the step if the configured error policy requires it.
 
-def main() -> None:
+    Arguments:
+        batch_result (BatchResult): The outcome of every lookup in the run.
+
+    Returns:
+        None
+    """
+
+    record_batch_metrics(batch_result)
+    error_summary = batch_result.error_summary()
+    append_output(ERROR_COUNT_OUTPUT, str(batch_result.error_count))
+    append_output(ERROR_SUMMARY_OUTPUT, json.dumps(error_summary))
+
+    if batch_result.skipped:
+        skipped = ", ".join(result.output_id for result in batch_result.skipped)
+        logger.warning(f"Skipped optional secrets: {skipped}")
+
+    if batch_result.should_fail(ERROR_POLICY):
+        failed = ", ".join(result["output_id"] for result in error_summary)
+        common.show_error(
+            f"{batch_result.error_count} secret lookups failed: {failed}", logger
+        )
+
+
+def build_client_config() -> client.ClientConfig:
+    """
+    Builds the client settings from the action environment variables.
+
+    Returns:
+        ClientConfig: The client settings.
+    """
+
+    return client.ClientConfig(
+        api_url=API_URL,
+        api_key=API_KEY,
+        client_id=CLIENT_ID,
+        client_secret=CLIENT_SECRET,
+        api_version=API_VERSION,
+        verify_ca=VERIFY_CA,
+        certificate=CERTIFICATE,
+        certificate_key=CERTIFICATE_KEY,
+        timeout_connection_seconds=TIMEOUT_CONNECTION_SECONDS,
+        timeout_request_seconds=TIMEOUT_REQUEST_SECONDS,
+        probe_timeout_seconds=API_PROBE_TIMEOUT_SECONDS,
+        rate_limit_rps=RATE_LIMIT_RPS,
+        rate_limit_burst=RATE_LIMIT_BURST,
+        startup_jitter_seconds=STARTUP_JITTER_SECONDS,
+        path_separator=PATH_SEPARATOR,
+        decrypt=DECRYPT,
+        postprocess_inline_threshold_bytes=POSTPROCESS_INLINE_THRESHOLD_BYTES,
+        postprocess_max_workers=POSTPROCESS_MAX_WORKERS,
+        managed_account_max_workers=MANAGED_ACCOUNT_MAX_WORKERS,
+        request_duration_minutes=CREDENTIAL_REQUEST_MINUTES,
+        request_lease_file=REQUEST_LEASE_FILE,
+    )
+
+
+def start_client() -> client.SecretsSafeClient:
+    """
+    Creates the Secrets Safe client of the action and starts signing in on a
+    background thread, see open_client.
+
+    Returns:
+        SecretsSafeClient: The client signing in.
+    """
+
+    secrets_client = client.SecretsSafeClient(
+        build_client_config(), logger, METRICS, TRACE
+    )
+    secrets_client.start_sign_in()
+    return secrets_client
+
+
+def open_client(
+    secrets_client: client.SecretsSafeClient = None,
+) -> client.SecretsSafeClient:
+    """
+    Creates the Secrets Safe client of the action and signs in, or waits for
+    the sign-in of a client returned by start_client.
+
+    Arguments:
+        secrets_client (SecretsSafeClient, optional): Client signing in.
+
+    Returns:
+        SecretsSafeClient: The signed in client.
+    """
+
+    if secrets_client is None:
+        secrets_client = client.SecretsSafeClient(
+            build_client_config(), logger, METRICS, TRACE
+        )
     try:
-        with requests.Session() as session:
-            retry_strategy = Retry(
-                total=3,
-                backoff_factor=0.2,
-                status_forcelist=[400, 408, 500, 502, 503, 504],
-                allowed_methods=["GET", "POST"],
+        secrets_client.wait_signed_in()
+    except exceptions.AuthenticationFailure as e:
+        common.show_error(str(e), logger)
+
+    return secrets_client
+
+
+def serve_agent() -> None:
+    """
+    Runs the action as a resident agent that keeps one authenticated session
+    open and serves lookups over the AGENT_SOCKET Unix socket until it
+    receives SIGTERM or SIGINT.
+
+    Returns:
+        None
+    """
+    if not AGENT_SOCKET or not AGENT_POLICY_FILE:
+        common.show_error(
+            "Agent mode requires AGENT_SOCKET and AGENT_POLICY_FILE", logger
+        )
+
+    policy = agent.AgentPolicy.from_file(AGENT_POLICY_FILE)
+
+    with open_client() as secrets_client:
+        lookups = {
+            kind: secrets_client.library_lookup(kind)
+            for kind in (agent.SECRET_KIND, agent.MANAGED_ACCOUNT_KIND)
+        }
+
+        with agent.SecretsAgent(
+            AGENT_SOCKET,
+            lookups,
+            policy,
+            secrets_client.authentication_obj,
+            logger,
+            cache_ttl_seconds=AGENT_CACHE_TTL_SECONDS,
+        ) as server:
+
+            def stop(*_):
+                # shutdown() blocks until serve_forever() returns, so it must
+                # run outside the thread that is serving.
+                threading.Thread(target=server.shutdown).start()
+
+            signal.signal(signal.SIGTERM, stop)
+            signal.signal(signal.SIGINT, stop)
+
+            logger.info("Secrets agent listening")
+            server.serve_forever()
+
+
+def retrieve_from_agent(
+    secrets: list,
+    managed_accounts: list,
+    batch_result: batch.BatchResult,
+    sink: dict = None,
+) -> None:
+    """
+    Retrieves the requested secrets through the resident agent, which already
+    holds an authenticated session.
+
+    Arguments:
+        secrets (list): SecretEntry records of the secrets.
+        managed_accounts (list): SecretEntry records of the managed accounts.
+        batch_result (BatchResult): Collector for the lookup outcomes.
+        sink (dict, optional): Collects the values instead of publishing them.
+
+    Returns:
+        None
+    """
+
+    clients = []
+    if secrets:
+        clients.append(agent.AgentClient(AGENT_SOCKET, AGENT_TOKEN, agent.SECRET_KIND))
+        get_secrets(clients[-1], secrets, batch_result, sink)
+
+    if managed_accounts:
+        clients.append(
+            agent.AgentClient(AGENT_SOCKET, AGENT_TOKEN, agent.MANAGED_ACCOUNT_KIND)
+        )
+        get_secrets(clients[-1], managed_accounts, batch_result, sink)
+
+    METRICS.inc(
+        "cache_hits_total",
+        sum(client.cache_hits for client in clients),
+        help_text="Lookups served from the cache of the resident agent.",
+    )
+
+
+def retrieve_from_secrets_safe(
+    secrets: list,
+    managed_accounts: list,
+    batch_result: batch.BatchResult,
+    sink: dict = None,
+    secrets_client: client.SecretsSafeClient = None,
+) -> None:
+    """
+    Signs in to Secrets Safe and retrieves the requested secrets and managed
+    accounts.
+
+    Arguments:
+        secrets (list): SecretEntry records of the secrets.
+        managed_accounts (list): SecretEntry records of the managed accounts.
+        batch_result (BatchResult): Collector for the lookup outcomes.
+        sink (dict, optional): Collects the values instead of publishing them.
+        secrets_client (SecretsSafeClient, optional): Client already signing
+            in, see start_client.
+
+    Returns:
+        None
+    """
+
+    with open_client(secrets_client) as secrets_client:
+        if secrets:
+            get_secrets(
+                secrets_client.lookup(agent.SECRET_KIND),
+                secrets,
+                batch_result,
+                sink,
             )
-            adapter = HTTPAdapter(max_retries=retry_strategy)
-            session.mount("https://", adapter)
-            session.mount("http://", adapter)
 
-            certificate, certificate_key = utils.prepare_certificate_info(
-                CERTIFICATE, CERTIFICATE_KEY
+        if managed_accounts:
+            get_secrets(
+                secrets_client.lookup(agent.MANAGED_ACCOUNT_KIND),
+                managed_accounts,
+                batch_result,
+                sink,
             )
 
-            auth_config = {
-                "req": session,
-                "timeout_connection": TIMEOUT_CONNECTION_SECONDS,
-                "timeout_request": TIMEOUT_REQUEST_SECONDS,
-                "api_url": API_URL,
-                "certificate": certificate,
-                "certificate_key": certificate_key,
-                "verify_ca": VERIFY_CA,
-                "logger": logger,
-            }
-
-            # The recommended version is 3.1. If no version is specified,
-            # the default API version 3.0 will be used
-            if API_VERSION:
-                auth_config.update({"api_version": API_VERSION})
-
-            # If API_KEY is set, we're using API Key authentication
-            # otherwise we're using OAuth/Client Credentials.
-            if API_KEY:
-                auth_config.update({"api_key": API_KEY})
-            else:
-                auth_config.update(
-                    {"client_id": CLIENT_ID, "client_secret": CLIENT_SECRET}
-                )
-
-            authentication_obj = authentication.Authentication(**auth_config)
-            get_api_access_response = authentication_obj.get_api_access()
-
-            utils.print_log(
+
+def import_snapshot() -> None:
+    """
+    Publishes the outputs stored in a snapshot bundle, masked and written
+    exactly as retrieved secrets, without signing in to Secrets Safe.
+
+    Returns:
+        None
+    """
+
+    try:
+        values = snapshot.read_bundle(
+            SNAPSHOT_FILE, SNAPSHOT_KEY, snapshot.default_audience(env)
+        )
+    except (OSError, ValueError, snapshot.SnapshotError) as e:
+        common.show_error(f"Error importing snapshot bundle: {e}", logger)
+
+    for output_id, value in values.items():
+        publish_value(output_id, postprocess.ProcessedSecret(value))
+
+    report_batch_result(batch.BatchResult())
+    logger.info(f"Imported {len(values)} secrets from snapshot bundle")
+
+
+def export_snapshot(values: dict) -> None:
+    """
+    Writes the retrieved secrets to an encrypted snapshot bundle bound to the
+    current workflow run.
+
+    Arguments:
+        values (dict): Retrieved values by output_id.
+
+    Returns:
+        None
+    """
+
+    try:
+        snapshot.write_bundle(
+            SNAPSHOT_FILE,
+            values,
+            SNAPSHOT_KEY,
+            snapshot.default_audience(env),
+            SNAPSHOT_TTL_SECONDS,
+        )
+    except (OSError, snapshot.SnapshotError) as e:
+        common.show_error(f"Error exporting snapshot bundle: {e}", logger)
+
+    logger.info(f"Exported {len(values)} secrets to snapshot bundle")
+
+
+def validate_run_inputs() -> None:
+    """
+    Validates the inputs of a run retrieving secrets.
+
+    Returns:
+        None
+    """
+
+    if ERROR_POLICY not in batch.ERROR_POLICIES:
+        common.show_error(
+            f"Invalid error_policy {repr(ERROR_POLICY)}, supported values: "
+            f"{', '.join(batch.ERROR_POLICIES)}",
+            logger,
+        )
+
+    if not SECRET_PATH and not MANAGED_ACCOUNT_PATH:
+        error_message = "Nothing to do, SECRET and MANAGED_ACCOUNT parameters are empty"
+        common.show_error(error_message, logger)
+
+
+def load_run_entries() -> tuple:
+    """
+    Parses and validates the secret_path and managed_account_path inputs, once
+    and before any lookup is made.
+
+    Returns:
+        tuple: The SecretEntry records of the secrets and of the managed
+        accounts, empty for an empty input.
+    """
+
+    secrets = load_secret_entries(SECRET_PATH, "secret_path") if SECRET_PATH else []
+    managed_accounts = (
+        load_secret_entries(MANAGED_ACCOUNT_PATH, "managed_account_path")
+        if MANAGED_ACCOUNT_PATH
+        else []
+    )
+    return secrets, managed_accounts
+
+
+def start_run() -> tuple:
+    """
+    Starts signing in to Secrets Safe, unless the secrets are read through the
+    resident agent, and parses the inputs meanwhile, so that the TLS handshake
+    and the sign-in overlap with the parsing. Invalid inputs are reported
+    right away, the session is then closed once the sign-in is over.
+
+    Returns:
+        tuple: The SecretEntry records of the secrets and of the managed
+        accounts, and the client signing in, None with the resident agent.
+    """
+
+    secrets_client = None if AGENT_SOCKET else start_client()
+    try:
+        secrets, managed_accounts = load_run_entries()
+    except BaseException:
+        if secrets_client is not None:
+            secrets_client.close()
+        raise
+    return secrets, managed_accounts, secrets_client
+
+
+def plan_managed_accounts(run_plan: plan.Plan, paths: list) -> None:
+    """
+    Adds the calls retrieving managed accounts to a plan.
+
+    Arguments:
+        run_plan (Plan): The plan.
+        paths (list): Managed account paths.
+
+    Returns:
+        None
+    """
+
+    count = len(set(paths))
+    if MANAGED_ACCOUNT_MAX_WORKERS <= 0:
+        run_plan.add(plan.LOOKUPS, "GET", "ManagedAccounts", count)
+        run_plan.add(plan.REQUESTS, "POST", "Requests", count)
+        run_plan.add(plan.LOOKUPS, "GET", "Credentials/{requestId}", count)
+        run_plan.add(plan.CHECKINS, "PUT", "Requests/{requestId}/checkin", count)
+        return
+
+    index = accounts.AccountIndex(None, PATH_SEPARATOR)
+    systems = {names[0] for names in map(index.split, paths) if names}
+    workers = MANAGED_ACCOUNT_MAX_WORKERS
+    leased = CREDENTIAL_REQUEST_MINUTES > 0 and bool(REQUEST_LEASE_FILE)
+    run_plan.add(
+        plan.LOOKUPS,
+        "GET",
+        "ManagedAccounts",
+        len(systems),
+        note="one listing per managed system",
+    )
+    run_plan.add(
+        plan.REQUESTS,
+        "POST",
+        "Requests",
+        count,
+        workers,
+        note="requests still open from a previous step are reused" if leased else "",
+    )
+    run_plan.add(plan.LOOKUPS, "GET", "Credentials/{requestId}", count, workers)
+    if not leased:
+        run_plan.add(
+            plan.CHECKINS, "PUT", "Requests/{requestId}/checkin", count, workers
+        )
+
+
+def build_plan() -> plan.Plan:
+    """
+    Validates every input and builds the plan of the API calls the run would
+    make, without signing in.
+
+    Returns:
+        Plan: The plan.
+    """
+
+    run_plan = plan.Plan("get_secret")
+    if SNAPSHOT_MODE == SNAPSHOT_IMPORT:
+        return run_plan
+
+    validate_run_inputs()
+    secrets, managed_accounts = load_run_entries()
+
+    if AGENT_SOCKET:
+        run_plan.add(
+            plan.LOOKUPS,
+            "AGENT",
+            AGENT_SOCKET,
+            len(secrets) + len(managed_accounts),
+            note="served by the resident agent",
+        )
+        return run_plan
+
+    plan.sign_in_calls(run_plan, bool(API_KEY), transport.parse_api_urls(API_URL))
+    run_plan.add(
+        plan.LOOKUPS,
+        "GET",
+        "Secrets-Safe/secrets",
+        len(secrets),
+        note="file secrets add a download call",
+    )
+    plan_managed_accounts(run_plan, [entry.path for entry in managed_accounts])
+    run_plan.add(plan.SIGN_OUT, "POST", "Auth/Signout")
+    return run_plan
+
+
+def report_plan() -> None:
+    """
+    Logs the plan of the run and publishes it as the plan output. Latencies
+    are estimated from the metrics of the previous run, when available.
+
+    Returns:
+        None
+    """
+
+    run_plan = build_plan()
+    estimates = plan.LatencyEstimates()
+    if METRICS_DIR:
+        estimates = plan.load_estimates(
+            os.path.join(METRICS_DIR, metrics.textfile_name("get_secret", RUNNER_NAME))
+        )
+    run_plan.log(logger, estimates, RATE_LIMIT_RPS)
+    append_output(PLAN_OUTPUT, run_plan.to_json(estimates, RATE_LIMIT_RPS))
+
+
+def write_metrics(started: float, succeeded: bool) -> None:
+    """
+    Writes the metrics of the run to METRICS_DIR, if set. Failing to write
+    them does not fail the step.
+
+    Arguments:
+        started (float): time.perf_counter() value when the run started.
+        succeeded (bool): Whether the run succeeded.
+
+    Returns:
+        None
+    """
+
+    # a dry run would replace the latencies its estimates are based on
+    if not METRICS_DIR or DRY_RUN:
+        return
+
+    METRICS.set(
+        "run_duration_seconds",
+        time.perf_counter() - started,
+        help_text="Duration of the run.",
+    )
+    METRICS.set("run_success", int(succeeded), help_text="1 if the run succeeded.")
+    METRICS.set("run_timestamp_seconds", time.time(), help_text="End time of the run.")
+    try:
+        METRICS.write(
+            os.path.join(METRICS_DIR, metrics.textfile_name("get_secret", RUNNER_NAME))
+        )
+    except OSError as e:
+        logger.warning(f"Metrics could not be written: {e}")
+
+
+def write_trace() -> None:
+    """
+    Appends the trace of the HTTP calls of the run to TRACE_FILE, if set.
+    Failing to write it does not fail the step.
+
+    Returns:
+        None
+    """
+
+    if TRACE is None:
+        return
+
+    try:
+        TRACE.write(TRACE_FILE)
+    except OSError as e:
+        logger.warning(f"Trace could not be written: {e}")
+
+
+def run() -> None:
+    """
+    Runs the action: serves the resident agent, plans a dry run, imports a
+    snapshot, or retrieves the requested secrets.
+
+    Returns:
+        None
+    """
+    try:
+        check_settings()
+
+        if AGENT_MODE == "serve":
+            serve_agent()
+            return
+
+        if SNAPSHOT_MODE and SNAPSHOT_MODE not in SNAPSHOT_MODES:
+            common.show_error(
+                f"Invalid snapshot_mode {repr(SNAPSHOT_MODE)}, supported values: "
+                f"{', '.join(SNAPSHOT_MODES)}",
                 logger,
-                f"{secrets_safe_library.__library_name__} "
-                f"version: {secrets_safe_library.__version__}",
-                logging.DEBUG,
             )
 
-            if get_api_access_response.status_code != 200:
-                error_message = (
-                    f"Please check credentials, error {get_api_access_response.text}"
-                )
-                common.show_error(error_message, logger)
-
-            if not SECRET_PATH and not MANAGED_ACCOUNT_PATH:
-                error_message = (
-                    "Nothing to do, SECRET and MANAGED_ACCOUNT parameters are empty"
-                )
-                common.show_error(error_message, logger)
-
-            if SECRET_PATH:
-                secrets_safe_obj = secrets_safe.SecretsSafe(
-                    authentication=authentication_obj,
-                    logger=logger,
-                    separator=PATH_SEPARATOR,
-                    decrypt=DECRYPT,
-                )
-                get_secrets(secrets_safe_obj, SECRET_PATH)
-
-            if MANAGED_ACCOUNT_PATH:
-                managed_account_obj = managed_account.ManagedAccount(
-                    authentication=authentication_obj,
-                    logger=logger,
-                    separator=PATH_SEPARATOR,
-                )
-                get_secrets(managed_account_obj, MANAGED_ACCOUNT_PATH)
-
-            authentication_obj.sign_app_out()
+        if DRY_RUN:
+            report_plan()
+            return
+
+        if SNAPSHOT_MODE == SNAPSHOT_IMPORT:
+            import_snapshot()
+            return
+
+        validate_run_inputs()
+        secrets, managed_accounts, secrets_client = start_run()
+
+        batch_result = batch.BatchResult()
+        sink = {} if SNAPSHOT_MODE == SNAPSHOT_EXPORT else None
+
+        if secrets_client is None:
+            retrieve_from_agent(secrets, managed_accounts, batch_result, sink)
+        else:
+            retrieve_from_secrets_safe(
+                secrets, managed_accounts, batch_result, sink, secrets_client
+            )
+
+        report_batch_result(batch_result)
+
+        if sink is not None:
+            export_snapshot(sink)
 
     except Exception as e:
+        METRICS.inc(
+            "errors_total", help_text="Errors by exception type.", type=type(e).__name__
+        )
         common.show_error(e, logger)
 
 
+def check_settings() -> None:
+    """
+    Reports the invalid settings, which fell back to their defaults.
+
+    Returns:
+        None
+    """
+
+    if INVALID_SETTINGS:
+        common.show_error(f"Invalid settings: {', '.join(INVALID_SETTINGS)}", logger)
+
+
+def check_in_requests() -> None:
+    """
+    Checks in the credential requests kept open by the steps of the job. Runs
+    as the post step of the action, when the job ends.
+
+    Returns:
+        None
+    """
+
+    if not REQUEST_LEASE_FILE or not os.path.exists(REQUEST_LEASE_FILE):
+        return
+
+    with open_client() as secrets_client:
+        failed = secrets_client.check_in_requests()
+    if failed:
+        logger.warning(
+            f"{failed} managed account requests could not be checked in, "
+            "they expire on their own"
+        )
+
+
+def main() -> None:
+    started = time.perf_counter()
+    succeeded = False
+    try:
+        run()
+        succeeded = True
+    finally:
+        write_metrics(started, succeeded)
+        write_trace()
+
+
 if __name__ == "__main__":
     main()
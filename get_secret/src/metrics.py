@@ -0,0 +1,262 @@
+"""
+Prometheus metrics of an action run.
+
+The metrics of a run are collected in memory and written at the end of the
+run, in the Prometheus text format, to a .prom file read by the textfile
+collector of node_exporter. The file is replaced atomically, so the collector
+never reads a partially written file, and writing it needs no network.
+
+HTTP metrics are collected with a response hook on the requests session, so
+every request made by the library is counted along with its retries and the
+size of its response body, both as received, possibly compressed, and once
+decoded.
+"""
+
+import os
+import re
+import tempfile
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import requests
+from urllib3.response import BaseHTTPResponse
+
+METRIC_PREFIX = "secrets_safe_action_"
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+FILE_MODE = 0o644
+
+COUNTER = "counter"
+GAUGE = "gauge"
+HISTOGRAM = "histogram"
+
+_UNSAFE_FILE_CHARACTERS = re.compile(r"[^A-Za-z0-9_.-]")
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def textfile_name(action: str, runner: Optional[str]) -> str:
+    """
+    Build the name of the metrics file of an action on a runner, so runners
+    sharing a textfile directory do not overwrite each other's metrics.
+
+    Args:
+        action (str): Name of the action.
+        runner (str, optional): Name of the runner.
+
+    Returns:
+        str: The file name.
+    """
+    name = f"secrets_safe_{action}_{runner}" if runner else f"secrets_safe_{action}"
+    return _UNSAFE_FILE_CHARACTERS.sub("_", name) + ".prom"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: Iterable[Tuple[str, str]]) -> str:
+    content = ",".join(f'{name}="{_escape(str(value))}"' for name, value in labels)
+    return f"{{{content}}}" if content else ""
+
+
+def _received_bytes(response: requests.Response) -> int:
+    # the raw response counts the bytes read from the connection, before
+    # they are decompressed
+    if isinstance(response.raw, BaseHTTPResponse):
+        return response.raw.tell()
+    length = response.headers.get("Content-Length")
+    return int(length) if length else len(response.content)
+
+
+def _format_value(value: float) -> str:
+    if value == int(value):
+        return str(int(value))
+    return repr(float(value))
+
+
+class Metrics:
+    """
+    Thread-safe registry of the counters, gauges and histograms of a run.
+    """
+
+    def __init__(
+        self,
+        labels: Optional[Dict[str, str]] = None,
+        buckets: Tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        """
+        Args:
+            labels (Dict[str, str], optional): Labels added to every sample,
+                e.g. the action and runner names.
+            buckets (Tuple[float, ...]): Upper bounds of the histogram buckets
+                in seconds.
+        """
+        self.labels = dict(labels or {})
+        self.buckets = tuple(sorted(buckets))
+        self._families: Dict[str, Tuple[str, str]] = {}
+        self._values: Dict[Tuple[str, Labels], float] = {}
+        self._histograms: Dict[Tuple[str, Labels], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, name: str, kind: str, help_text: str, labels: dict):
+        family = self._families.setdefault(name, (kind, help_text))
+        if family[0] != kind:
+            raise ValueError(f"Metric {name} is a {family[0]}, not a {kind}")
+        return name, tuple(sorted(labels.items()))
+
+    def inc(self, name: str, value: float = 1, help_text: str = "", **labels):
+        """
+        Increase a counter.
+
+        Args:
+            name (str): Metric name, without the prefix.
+            value (float): Increment.
+            help_text (str): Description of the metric.
+            labels: Labels of the sample.
+        """
+        with self._lock:
+            key = self._key(name, COUNTER, help_text, labels)
+            self._values[key] = self._values.get(key, 0) + value
+
+    def set(self, name: str, value: float, help_text: str = "", **labels):
+        """
+        Set a gauge.
+
+        Args:
+            name (str): Metric name, without the prefix.
+            value (float): Value.
+            help_text (str): Description of the metric.
+            labels: Labels of the sample.
+        """
+        with self._lock:
+            self._values[self._key(name, GAUGE, help_text, labels)] = value
+
+    def observe(self, name: str, value: float, help_text: str = "", **labels):
+        """
+        Add an observation to a histogram.
+
+        Args:
+            name (str): Metric name, without the prefix.
+            value (float): Observed value.
+            help_text (str): Description of the metric.
+            labels: Labels of the sample.
+        """
+        with self._lock:
+            key = self._key(name, HISTOGRAM, help_text, labels)
+            # one count per bucket, then the sum and the total count
+            counts = self._histograms.setdefault(key, [0] * (len(self.buckets) + 2))
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+            counts[-2] += value
+            counts[-1] += 1
+
+    def render(self) -> str:
+        """
+        Render the metrics in the Prometheus text format.
+
+        Returns:
+            str: The exposition text.
+        """
+        common = tuple(self.labels.items())
+        lines = []
+        with self._lock:
+            for name, (kind, help_text) in self._families.items():
+                full_name = METRIC_PREFIX + name
+                if help_text:
+                    lines.append(f"# HELP {full_name} {help_text}")
+                lines.append(f"# TYPE {full_name} {kind}")
+
+                for (sample_name, labels), value in self._values.items():
+                    if sample_name == name:
+                        lines.append(
+                            f"{full_name}{_format_labels(common + labels)} "
+                            f"{_format_value(value)}"
+                        )
+
+                for (sample_name, labels), counts in self._histograms.items():
+                    if sample_name != name:
+                        continue
+                    label_text = _format_labels(common + labels)
+                    for bound, count in zip(self.buckets, counts):
+                        bucket_labels = common + labels + (("le", repr(bound)),)
+                        lines.append(
+                            f"{full_name}_bucket{_format_labels(bucket_labels)} "
+                            f"{count}"
+                        )
+                    inf_labels = common + labels + (("le", "+Inf"),)
+                    lines.append(
+                        f"{full_name}_bucket{_format_labels(inf_labels)} {counts[-1]}"
+                    )
+                    lines.append(
+                        f"{full_name}_sum{label_text} {_format_value(counts[-2])}"
+                    )
+                    lines.append(f"{full_name}_count{label_text} {counts[-1]}")
+
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: str) -> None:
+        """
+        Write the metrics to a file, replacing it atomically.
+
+        Args:
+            path (str): Path of the .prom file.
+        """
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".metrics-")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as fh:
+                fh.write(self.render())
+            os.chmod(temp_path, FILE_MODE)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+    def instrument_session(self, session: requests.Session) -> None:
+        """
+        Count the requests, retries, and received and decoded response bytes
+        of a session.
+
+        Args:
+            session (requests.Session): Requests session used for HTTP calls.
+        """
+
+        def record(response: requests.Response, *args, **kwargs):
+            self.inc(
+                "http_requests_total",
+                help_text="HTTP requests sent to Secrets Safe.",
+                method=response.request.method,
+                code=str(response.status_code),
+            )
+            self.observe(
+                "http_request_seconds",
+                response.elapsed.total_seconds(),
+                help_text="Latency of the HTTP requests sent to Secrets Safe.",
+            )
+
+            retries = getattr(response.raw, "retries", None)
+            if retries is not None and retries.history:
+                self.inc(
+                    "http_retries_total",
+                    len(retries.history),
+                    help_text="HTTP requests retried by the retry policy.",
+                )
+
+            # reading the body decodes it, so the received bytes are known
+            decoded = len(response.content)
+            encoding = response.headers.get("Content-Encoding") or "identity"
+            self.inc(
+                "http_response_bytes_total",
+                _received_bytes(response),
+                help_text="Bytes of the HTTP response bodies as received.",
+                encoding=encoding,
+            )
+            self.inc(
+                "http_response_decoded_bytes_total",
+                decoded,
+                help_text="Bytes of the HTTP response bodies once decompressed.",
+                encoding=encoding,
+            )
+
+        session.hooks["response"].append(record)
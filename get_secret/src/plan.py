@@ -0,0 +1,263 @@
+"""
+Dry-run plans of an action run.
+
+With dry_run enabled, the action parses and validates every input and builds
+the list of Secrets Safe API calls the run would make, without signing in or
+reading any secret value. Latencies are estimated from the metrics file
+written by a previous run on the same runner, see metrics, or from default
+values when there is none.
+"""
+
+import json
+import logging
+import math
+import re
+from typing import Dict, List, NamedTuple, Optional
+
+from src import metrics
+
+DEFAULT_AUTH_SECONDS = 0.5
+DEFAULT_REQUEST_SECONDS = 0.2
+DEFAULTS_SOURCE = "defaults"
+
+# Stages of the call graph, in the order calls are made
+AUTH = "auth"
+PROBE = "probe"
+FOLDERS = "folders"
+LOOKUPS = "lookups"
+REQUESTS = "requests"
+WRITES = "writes"
+CHECKINS = "checkins"
+SIGN_OUT = "sign_out"
+
+_SAMPLE = re.compile(r"^(?P<name>[a-z_]+)(?:\{[^}]*\})?\s+(?P<value>\S+)$")
+
+
+class LatencyEstimates(NamedTuple):
+    """
+    Latencies used to estimate the duration of a plan.
+    """
+
+    auth_seconds: float = DEFAULT_AUTH_SECONDS
+    request_seconds: float = DEFAULT_REQUEST_SECONDS
+    source: str = DEFAULTS_SOURCE
+
+
+def load_estimates(path: str) -> LatencyEstimates:
+    """
+    Read the mean sign-in and request latencies from a metrics file.
+
+    Args:
+        path (str): Path of the .prom file of a previous run.
+
+    Returns:
+        LatencyEstimates: The latencies, the defaults for those missing from
+        the file or when it cannot be read.
+    """
+    totals: Dict[str, float] = {}
+    try:
+        with open(path, encoding="utf-8") as fh:
+            for line in fh:
+                match = _SAMPLE.match(line.strip())
+                if match:
+                    name = match.group("name")
+                    totals[name] = totals.get(name, 0) + float(match.group("value"))
+    except (OSError, ValueError):
+        return LatencyEstimates()
+
+    def mean(name: str) -> Optional[float]:
+        count = totals.get(f"{metrics.METRIC_PREFIX}{name}_count")
+        if not count:
+            return None
+        return totals[f"{metrics.METRIC_PREFIX}{name}_sum"] / count
+
+    auth_seconds = mean("auth_seconds")
+    request_seconds = mean("http_request_seconds")
+    if auth_seconds is None and request_seconds is None:
+        return LatencyEstimates()
+    return LatencyEstimates(
+        DEFAULT_AUTH_SECONDS if auth_seconds is None else auth_seconds,
+        DEFAULT_REQUEST_SECONDS if request_seconds is None else request_seconds,
+        path,
+    )
+
+
+class PlannedCall(NamedTuple):
+    """
+    API calls of one kind made by a run.
+    """
+
+    stage: str
+    method: str
+    endpoint: str
+    count: int = 1
+    concurrency: int = 1
+    note: str = ""
+
+    def estimated_seconds(self, estimates: LatencyEstimates) -> float:
+        """
+        Estimate the time taken by the calls.
+
+        Args:
+            estimates (LatencyEstimates): The latencies.
+
+        Returns:
+            float: Estimated duration in seconds.
+        """
+        if self.stage == AUTH:
+            # the measured sign-in latency covers every sign-in call
+            return estimates.auth_seconds
+        rounds = math.ceil(self.count / max(1, self.concurrency))
+        return rounds * estimates.request_seconds
+
+
+class Plan:
+    """
+    API calls a run would make, in call order.
+    """
+
+    def __init__(self, action: str):
+        """
+        Args:
+            action (str): Name of the action.
+        """
+        self.action = action
+        self.calls: List[PlannedCall] = []
+
+    def add(
+        self,
+        stage: str,
+        method: str,
+        endpoint: str,
+        count: int = 1,
+        concurrency: int = 1,
+        note: str = "",
+    ) -> None:
+        """
+        Add calls to the plan, ignored when count is 0.
+
+        Args:
+            stage (str): Stage of the call graph, e.g. AUTH or LOOKUPS.
+            method (str): HTTP method.
+            endpoint (str): Endpoint, relative to the API URL.
+            count (int): Number of calls.
+            concurrency (int): Calls made at once.
+            note (str): Remark on the calls, e.g. conditional extra calls.
+        """
+        if count > 0:
+            self.calls.append(
+                PlannedCall(stage, method, endpoint, count, concurrency, note)
+            )
+
+    @property
+    def request_count(self) -> int:
+        """
+        Number of API calls of the plan.
+        """
+        return sum(call.count for call in self.calls)
+
+    def estimated_seconds(
+        self, estimates: LatencyEstimates, rate_limit_rps: float = 0
+    ) -> float:
+        """
+        Estimate the duration of the run.
+
+        Args:
+            estimates (LatencyEstimates): The latencies.
+            rate_limit_rps (float): Client-side rate limit, 0 when disabled.
+
+        Returns:
+            float: Estimated duration in seconds.
+        """
+        seconds = sum(call.estimated_seconds(estimates) for call in self.calls)
+        if rate_limit_rps > 0:
+            seconds = max(seconds, self.request_count / rate_limit_rps)
+        return seconds
+
+    def to_dict(self, estimates: LatencyEstimates, rate_limit_rps: float = 0) -> dict:
+        """
+        Describe the plan as a JSON-serializable dict.
+
+        Args:
+            estimates (LatencyEstimates): The latencies.
+            rate_limit_rps (float): Client-side rate limit, 0 when disabled.
+
+        Returns:
+            dict: The plan.
+        """
+        return {
+            "action": self.action,
+            "requests": self.request_count,
+            "estimated_seconds": round(
+                self.estimated_seconds(estimates, rate_limit_rps), 3
+            ),
+            "latency_source": estimates.source,
+            "calls": [
+                dict(
+                    call._asdict(),
+                    estimated_seconds=round(call.estimated_seconds(estimates), 3),
+                )
+                for call in self.calls
+            ],
+        }
+
+    def to_json(self, estimates: LatencyEstimates, rate_limit_rps: float = 0) -> str:
+        """
+        Serialize the plan to JSON.
+
+        Args:
+            estimates (LatencyEstimates): The latencies.
+            rate_limit_rps (float): Client-side rate limit, 0 when disabled.
+
+        Returns:
+            str: The plan as a JSON object.
+        """
+        return json.dumps(self.to_dict(estimates, rate_limit_rps))
+
+    def log(
+        self,
+        logger: logging.Logger,
+        estimates: LatencyEstimates,
+        rate_limit_rps: float = 0,
+    ) -> None:
+        """
+        Log the call graph and the estimated duration.
+
+        Args:
+            logger (logging.Logger): Logger.
+            estimates (LatencyEstimates): The latencies.
+            rate_limit_rps (float): Client-side rate limit, 0 when disabled.
+        """
+        logger.info(f"Dry run plan of {self.action}, no secret is read:")
+        for call in self.calls:
+            concurrency = ""
+            if call.concurrency > 1:
+                concurrency = f", {call.concurrency} at once"
+            note = f" ({call.note})" if call.note else ""
+            logger.info(
+                f"  {call.stage}: {call.count} x {call.method} {call.endpoint}"
+                f"{concurrency}, ~{call.estimated_seconds(estimates):.3f} s{note}"
+            )
+        logger.info(
+            f"{self.request_count} API calls, "
+            f"~{self.estimated_seconds(estimates, rate_limit_rps):.3f} s "
+            f"(latencies from {estimates.source})"
+        )
+
+
+def sign_in_calls(plan: Plan, api_key: bool, api_urls: List[str]) -> None:
+    """
+    Add the probe and sign-in calls of the action to a plan.
+
+    Args:
+        plan (Plan): The plan.
+        api_key (bool): Whether an API key is used instead of client
+            credentials.
+        api_urls (List[str]): API URLs of the Secrets Safe nodes.
+    """
+    if len(api_urls) > 1:
+        plan.add(PROBE, "HEAD", "<API URL>", len(api_urls), len(api_urls))
+    if api_key:
+        plan.add(AUTH, "POST", "Auth/SignAppIn")
+    else:
+        plan.add(AUTH, "POST", "Auth/connect/token, Auth/SignAppIn", 2)
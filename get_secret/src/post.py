@@ -0,0 +1,7 @@
+#!/usr/bin/env python
+"""Post step of the action, run when the job ends even if it failed."""
+
+from src import main
+
+if __name__ == "__main__":
+    main.check_in_requests()
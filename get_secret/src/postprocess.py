@@ -0,0 +1,185 @@
+"""
+Post-processing stage applied to retrieved secrets before they are published.
+
+This module is responsible for:
+- Decoding encoded secret values (for example base64 keystores)
+- Converting PEM material into other formats (PKCS12, DER)
+- Extracting the lines that must be masked on the runner
+- Fanning large values out across a process pool while keeping small values
+  inline, so that small secrets never pay the cost of spawning processes
+"""
+
+import base64
+import binascii
+import re
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+from cryptography import x509
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.serialization import pkcs12
+
+PRIVATE_KEY_PATTERN = re.compile(
+    r"-----BEGIN (?:[A-Z]+ )?PRIVATE KEY-----"
+    r".+?"
+    r"-----END (?:[A-Z]+ )?PRIVATE KEY-----",
+    re.DOTALL,
+)
+
+
+class PostProcessError(Exception):
+    """
+    Raised when a secret value cannot be decoded or converted.
+    """
+
+
+class PostProcessJob(NamedTuple):
+    """
+    A retrieved secret value and the transformations requested for it.
+    """
+
+    value: str
+    decode: Optional[str] = None
+    convert: Optional[str] = None
+
+
+class ProcessedSecret(NamedTuple):
+    """
+    A transformed secret value. ``mask_lines`` is only precomputed for values
+    processed out of process; inline values leave it as None.
+    """
+
+    value: str
+    mask_lines: Optional[List[str]] = None
+
+
+def _decode_base64(value: str) -> str:
+    try:
+        return base64.b64decode(value, validate=True).decode("utf-8")
+    except (binascii.Error, UnicodeDecodeError) as e:
+        raise PostProcessError(f"Secret is not valid base64 encoded text: {e}")
+
+
+def _pem_to_pkcs12(value: str) -> str:
+    data = value.encode("utf-8")
+    key_match = PRIVATE_KEY_PATTERN.search(value)
+    try:
+        certificates = x509.load_pem_x509_certificates(data)
+        if not key_match:
+            raise ValueError("no private key found")
+        key = serialization.load_pem_private_key(
+            key_match.group(0).encode("utf-8"), password=None
+        )
+    except ValueError as e:
+        raise PostProcessError(f"Secret is not a PEM key and certificate: {e}")
+
+    bundle = pkcs12.serialize_key_and_certificates(
+        None,
+        key,
+        certificates[0],
+        certificates[1:] or None,
+        serialization.NoEncryption(),
+    )
+    return base64.b64encode(bundle).decode("ascii")
+
+
+def _pem_to_der(value: str) -> str:
+    try:
+        certificate = x509.load_pem_x509_certificate(value.encode("utf-8"))
+    except ValueError as e:
+        raise PostProcessError(f"Secret is not a PEM certificate: {e}")
+
+    der = certificate.public_bytes(serialization.Encoding.DER)
+    return base64.b64encode(der).decode("ascii")
+
+
+DECODERS: Dict[str, Callable[[str], str]] = {"base64": _decode_base64}
+
+CONVERTERS: Dict[str, Callable[[str], str]] = {
+    "pkcs12": _pem_to_pkcs12,
+    "der": _pem_to_der,
+}
+
+
+def mask_lines(value: str) -> List[str]:
+    """
+    Extract the non-blank lines of a secret that must be masked.
+
+    Args:
+        value (str): The secret value.
+
+    Returns:
+        list: Lines to register as masks.
+    """
+    return [line for line in value.split("\n") if line.strip() != ""]
+
+
+def transform(job: PostProcessJob) -> str:
+    """
+    Apply the decode and convert steps requested for a job.
+
+    Args:
+        job (PostProcessJob): The value and requested transformations.
+
+    Returns:
+        str: The transformed value.
+
+    Raises:
+        PostProcessError: If a step fails.
+    """
+    value = job.value
+    if job.decode:
+        value = DECODERS[job.decode](value)
+    if job.convert:
+        value = CONVERTERS[job.convert](value)
+    return value
+
+
+def _process_out_of_process(job: PostProcessJob) -> ProcessedSecret:
+    value = transform(job)
+    return ProcessedSecret(value, mask_lines(value))
+
+
+def run_pipeline(
+    jobs: List[PostProcessJob], inline_threshold_bytes: int, max_workers: int
+) -> List[ProcessedSecret]:
+    """
+    Post-process a batch of secrets, preserving order.
+
+    Values smaller than ``inline_threshold_bytes`` and values that need no
+    transformation are processed in the current process. The rest are spread
+    across a process pool, which is only started when at least one value
+    needs it.
+
+    Args:
+        jobs (list): Jobs to process.
+        inline_threshold_bytes (int): Size below which work stays inline.
+        max_workers (int): Maximum number of worker processes.
+
+    Returns:
+        list: One ProcessedSecret per job, in the same order.
+
+    Raises:
+        PostProcessError: If any value cannot be transformed.
+    """
+    results: List[Optional[ProcessedSecret]] = [None] * len(jobs)
+    offloaded = []
+
+    for index, job in enumerate(jobs):
+        needs_work = job.decode or job.convert
+        if needs_work and len(job.value) >= inline_threshold_bytes:
+            offloaded.append(index)
+        else:
+            value = transform(job) if needs_work else job.value
+            results[index] = ProcessedSecret(value)
+
+    if offloaded:
+        workers = max(1, min(max_workers, len(offloaded)))
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            processed = executor.map(
+                _process_out_of_process, [jobs[index] for index in offloaded]
+            )
+            for index, result in zip(offloaded, processed):
+                results[index] = result
+
+    return results
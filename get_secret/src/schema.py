@@ -0,0 +1,182 @@
+"""
+Compiled schemas of the JSON action inputs.
+
+A Schema is compiled once, at import time, from its fields into a list of
+checks. Inputs are decoded once and validated as a whole before any API call
+is made: every invalid field of every entry is reported together, located by
+the input name and the entry index, e.g. ``secrets[3].output_id``. Valid
+entries are built into typed records, so the rest of the run reads
+attributes instead of looking keys up in dicts.
+"""
+
+import json
+import re
+from typing import Any, Callable, Collection, List, NamedTuple, Optional, Tuple
+
+# errors reported beyond this are only counted, to keep the message readable
+MAX_REPORTED_ERRORS = 10
+
+_MISSING = object()
+
+
+class SchemaError(ValueError):
+    """
+    Invalid input, with the location and message of every error found.
+    """
+
+    def __init__(self, errors: List[Tuple[str, str]]):
+        """
+        Args:
+            errors (List[Tuple[str, str]]): Location and message of every
+                error.
+        """
+        self.errors = errors
+        shown = [
+            f"{location}: {message}"
+            for location, message in errors[:MAX_REPORTED_ERRORS]
+        ]
+        if len(errors) > MAX_REPORTED_ERRORS:
+            shown.append(f"and {len(errors) - MAX_REPORTED_ERRORS} more errors")
+        super().__init__("; ".join(shown))
+
+
+class Field(NamedTuple):
+    """
+    Field of the JSON objects of an input.
+    """
+
+    name: str
+    types: Tuple[type, ...]
+    required: bool = False
+    default: Any = None
+    nullable: bool = False
+    choices: Optional[Collection] = None
+    pattern: Optional[re.Pattern] = None
+    reserved: Collection = ()
+    hint: str = ""
+
+
+def _compile(field: Field) -> Callable[[Any], Optional[str]]:
+    # JSON values have exact types, so bool is not accepted as an int
+    types = frozenset(field.types)
+    choices = None if field.choices is None else frozenset(field.choices)
+    fullmatch = field.pattern.fullmatch if field.pattern is not None else None
+    reserved = frozenset(field.reserved)
+
+    def check(value: Any) -> Optional[str]:
+        if value is None and field.nullable:
+            return None
+        if type(value) not in types or (fullmatch and not fullmatch(value)):
+            return f"Invalid {field.name} {value!r}: {field.hint}"
+        if choices is not None and value not in choices:
+            return (
+                f"Invalid {field.name} {value!r}, supported values: "
+                f"{', '.join(field.choices)}"
+            )
+        if value in reserved:
+            return f"Invalid {field.name} {value!r}: reserved for the action"
+        return None
+
+    return check
+
+
+class Schema:
+    """
+    Compiled schema of an input holding a JSON object or a list of them.
+    """
+
+    def __init__(
+        self,
+        record: Optional[Callable[..., Any]],
+        fields: List[Field],
+        entry: str = "entry",
+    ):
+        """
+        Args:
+            record (Callable[..., Any], optional): Record type, built with the
+                field values in field order, None to keep the validated
+                objects as they are, e.g. payloads passed on to the API.
+            fields (List[Field]): Fields of the objects.
+            entry (str): Name of an object in error messages.
+        """
+        self._record = record
+        self._entry = entry
+        self._checks = [
+            (field.name, field.required, field.default, _compile(field))
+            for field in fields
+        ]
+
+    def parse(self, items: Any, location: str) -> list:
+        """
+        Validate decoded JSON and build the records.
+
+        Args:
+            items (Any): A JSON object or a list of them.
+            location (str): Name of the input, prefixed to error locations.
+
+        Returns:
+            list: One record, or object, per object, in input order.
+
+        Raises:
+            SchemaError: If any object is invalid.
+        """
+        if type(items) is not list:
+            items = [items]
+
+        records = []
+        errors: List[Tuple[str, str]] = []
+        for index, item in enumerate(items):
+            if type(item) is not dict:
+                errors.append(
+                    (
+                        f"{location}[{index}]",
+                        f"Invalid JSON, each {self._entry} must be a JSON object",
+                    )
+                )
+                continue
+
+            found = len(errors)
+            values = []
+            for name, required, default, check in self._checks:
+                value = item.get(name, _MISSING)
+                if value is _MISSING:
+                    if required:
+                        errors.append(
+                            (
+                                f"{location}[{index}]",
+                                f"Invalid JSON, validate {name} attribute name",
+                            )
+                        )
+                    values.append(default)
+                    continue
+                message = check(value)
+                if message is not None:
+                    errors.append((f"{location}[{index}].{name}", message))
+                values.append(value)
+            if len(errors) == found:
+                records.append(item if self._record is None else self._record(*values))
+
+        if errors:
+            raise SchemaError(errors)
+        return records
+
+    def loads(self, value: Any, location: str) -> list:
+        """
+        Decode a JSON input, validate it and build the records.
+
+        Args:
+            value (Any): The JSON input.
+            location (str): Name of the input, prefixed to error locations.
+
+        Returns:
+            list: One record, or object, per object, in input order.
+
+        Raises:
+            SchemaError: If the input is not valid JSON or any object is
+                invalid.
+        """
+        try:
+            items = json.loads(value)
+        except (json.JSONDecodeError, TypeError) as e:
+            raise SchemaError([(location, f"Invalid JSON input: {e}")])
+        return self.parse(items, location)
@@ -0,0 +1,120 @@
+"""
+Mutable container for secret values on the mask and output path.
+
+Python ``str`` objects are immutable and cannot be wiped, and every
+``split``/f-string on the mask and output path creates another copy of the
+secret. SecretValue keeps the value in a single ``bytearray`` that is written
+out through ``memoryview`` slices and overwritten with zeros once published,
+so the mask and output path adds no copies of its own. A ``str`` is encoded
+into the buffer a chunk at a time, so no full-size ``bytes`` copy is made.
+
+This is best effort: the ``str`` the value was retrieved and post-processed
+as, and any ``str`` a SecretValue is built from, are not wiped and remain in
+memory until the interpreter reuses it.
+"""
+
+import re
+from typing import Iterator, Union
+
+MASKABLE_LINE_PATTERN = re.compile(rb"^[^\n]*\S[^\n]*$", re.MULTILINE)
+# characters encoded, and bytes zeroed, at a time in the buffer
+ENCODE_CHUNK_CHARS = 16 * 1024
+ZEROS = bytes(ENCODE_CHUNK_CHARS)
+
+
+def _chunks(text: str) -> Iterator[bytes]:
+    for start in range(0, len(text), ENCODE_CHUNK_CHARS):
+        end = start + ENCODE_CHUNK_CHARS
+        yield text[start:end].encode("utf-8")
+
+
+def _encoded_size(text: str) -> int:
+    if text.isascii():
+        return len(text)
+    return sum(len(chunk) for chunk in _chunks(text))
+
+
+def _encode_into(text: str, buffer: bytearray) -> None:
+    position = 0
+    with memoryview(buffer) as view:
+        for chunk in _chunks(text):
+            end = position + len(chunk)
+            view[position:end] = chunk
+            position = end
+
+
+def _zeroize(buffer: bytearray) -> None:
+    # in place, without allocating zeros as large as the buffer
+    with memoryview(buffer) as view:
+        for start in range(0, len(buffer), len(ZEROS)):
+            end = min(start + len(ZEROS), len(buffer))
+            view[start:end] = ZEROS[: end - start]
+
+
+class SecretValue:
+    """
+    A secret held in a bounded, zeroizable ``bytearray``.
+
+    Zeroizing wipes only this buffer, not the ``str`` it was built from.
+    """
+
+    __slots__ = ("_buffer",)
+
+    def __init__(self, data: Union[str, bytes, bytearray], max_bytes: int = 0):
+        """
+        Args:
+            data (str | bytes | bytearray): The secret. A ``bytearray`` is
+                adopted as the buffer without copying.
+            max_bytes (int): Maximum accepted size, 0 for no limit.
+
+        Raises:
+            ValueError: If the secret is larger than ``max_bytes``.
+        """
+        size = _encoded_size(data) if isinstance(data, str) else len(data)
+        if max_bytes and size > max_bytes:
+            if isinstance(data, bytearray):
+                _zeroize(data)
+            raise ValueError(
+                f"Secret of {size} bytes exceeds the limit of {max_bytes} bytes"
+            )
+
+        if isinstance(data, str):
+            self._buffer = bytearray(size)
+            _encode_into(data, self._buffer)
+        elif isinstance(data, bytearray):
+            self._buffer = data
+        else:
+            self._buffer = bytearray(data)
+
+    def __len__(self) -> int:
+        return len(self._buffer)
+
+    def __repr__(self) -> str:
+        return f"SecretValue(<redacted {len(self._buffer)} bytes>)"
+
+    def __enter__(self) -> "SecretValue":
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.zeroize()
+
+    def view(self) -> memoryview:
+        """
+        Return a read-only view of the whole buffer.
+        """
+        return memoryview(self._buffer).toreadonly()
+
+    def mask_lines(self) -> Iterator[memoryview]:
+        """
+        Yield a view of each non-blank line, without copying the buffer.
+        """
+        view = self.view()
+        for match in MASKABLE_LINE_PATTERN.finditer(self._buffer):
+            start, end = match.span()
+            yield view[start:end]
+
+    def zeroize(self) -> None:
+        """
+        Overwrite the buffer with zeros.
+        """
+        _zeroize(self._buffer)
@@ -0,0 +1,165 @@
+"""
+Encrypted secret bundles for fan-out workflows.
+
+A setup job exports the retrieved secrets to a bundle file, which jobs of the
+same workflow run import to publish the outputs without signing in to
+Secrets Safe. The bundle is encrypted with AES-256-GCM under a key derived
+from a passphrase with scrypt. Its header, holding the audience the bundle is
+bound to and its expiry time, is stored in clear but authenticated as
+associated data, so it cannot be altered without failing decryption. Only
+the scrypt parameters this module writes are accepted, so a crafted header
+cannot make the import spend unbounded time or memory deriving the key.
+"""
+
+import base64
+import json
+import os
+import tempfile
+import time
+from typing import Dict
+
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.scrypt import Scrypt
+
+MAGIC = b"SSBUNDLE1\n"
+FORMAT_VERSION = 1
+KEY_LENGTH_BYTES = 32
+SALT_LENGTH_BYTES = 16
+NONCE_LENGTH_BYTES = 12
+SCRYPT_N = 2**15
+SCRYPT_R = 8
+SCRYPT_P = 1
+
+
+class SnapshotError(Exception):
+    """Raised when a bundle cannot be written, decrypted or accepted."""
+
+
+def default_audience(environ: Dict[str, str]) -> str:
+    """
+    Get the audience of the current job: the repository and the workflow
+    run, shared by every job and attempt of the run.
+
+    Args:
+        environ (Dict[str, str]): Environment variables.
+
+    Returns:
+        str: The audience.
+    """
+    return environ.get("SNAPSHOT_AUDIENCE") or (
+        f"{environ.get('GITHUB_REPOSITORY', '')}/{environ.get('GITHUB_RUN_ID', '')}"
+    )
+
+
+def _derive_key(passphrase: str, salt: bytes, n: int, r: int, p: int) -> bytes:
+    kdf = Scrypt(salt=salt, length=KEY_LENGTH_BYTES, n=n, r=r, p=p)
+    return kdf.derive(passphrase.encode("utf-8"))
+
+
+def write_bundle(
+    path: str,
+    values: Dict[str, str],
+    passphrase: str,
+    audience: str,
+    ttl_seconds: int,
+) -> None:
+    """
+    Encrypt output values into a bundle file, replacing it atomically. The
+    file is only readable by its owner.
+
+    Args:
+        path (str): Path of the bundle file.
+        values (Dict[str, str]): Output values keyed by output_id.
+        passphrase (str): Passphrase the key is derived from.
+        audience (str): Audience the bundle is bound to.
+        ttl_seconds (int): Time the bundle can be imported for.
+    """
+    if not passphrase:
+        raise SnapshotError("A passphrase is required to encrypt the bundle")
+
+    salt = os.urandom(SALT_LENGTH_BYTES)
+    nonce = os.urandom(NONCE_LENGTH_BYTES)
+    header = json.dumps(
+        {
+            "version": FORMAT_VERSION,
+            "audience": audience,
+            "expires_at": int(time.time()) + ttl_seconds,
+            "kdf": {"n": SCRYPT_N, "r": SCRYPT_R, "p": SCRYPT_P},
+            "salt": base64.b64encode(salt).decode("ascii"),
+            "nonce": base64.b64encode(nonce).decode("ascii"),
+        }
+    ).encode("utf-8")
+    associated_data = MAGIC + header + b"\n"
+
+    key = _derive_key(passphrase, salt, SCRYPT_N, SCRYPT_R, SCRYPT_P)
+    ciphertext = AESGCM(key).encrypt(
+        nonce, json.dumps(values).encode("utf-8"), associated_data
+    )
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".bundle-")
+    try:
+        with os.fdopen(fd, "wb") as fh:
+            fh.write(associated_data)
+            fh.write(ciphertext)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+def read_bundle(path: str, passphrase: str, audience: str) -> Dict[str, str]:
+    """
+    Decrypt a bundle file and check it was issued for this audience and has
+    not expired.
+
+    Args:
+        path (str): Path of the bundle file.
+        passphrase (str): Passphrase the key is derived from.
+        audience (str): Audience of the current job.
+
+    Returns:
+        Dict[str, str]: Output values keyed by output_id.
+
+    Raises:
+        SnapshotError: If the bundle is invalid, was tampered with, was
+            encrypted with another passphrase, is bound to another audience
+            or has expired.
+    """
+    with open(path, "rb") as fh:
+        content = fh.read()
+
+    header_start = len(MAGIC)
+    header_end = content.find(b"\n", header_start)
+    if not content.startswith(MAGIC) or header_end < 0:
+        raise SnapshotError("Not a secrets bundle")
+
+    body_start = header_end + 1
+    associated_data = content[:body_start]
+    try:
+        header = json.loads(content[header_start:header_end])
+        if header["kdf"] != {"n": SCRYPT_N, "r": SCRYPT_R, "p": SCRYPT_P}:
+            raise ValueError("unsupported scrypt parameters")
+        key = _derive_key(
+            passphrase,
+            base64.b64decode(header["salt"]),
+            SCRYPT_N,
+            SCRYPT_R,
+            SCRYPT_P,
+        )
+        nonce = base64.b64decode(header["nonce"])
+    except (ValueError, KeyError, TypeError) as e:
+        raise SnapshotError(f"Invalid bundle header: {e}")
+
+    try:
+        plaintext = AESGCM(key).decrypt(nonce, content[body_start:], associated_data)
+    except InvalidTag:
+        raise SnapshotError("Bundle cannot be decrypted, check the passphrase")
+
+    if header.get("audience") != audience:
+        raise SnapshotError("Bundle was issued for another audience")
+    if header.get("expires_at", 0) <= time.time():
+        raise SnapshotError("Bundle has expired")
+
+    return json.loads(plaintext)
@@ -0,0 +1,120 @@
+"""Performance regression benchmarks for Main module"""
+
+import contextlib
+import json
+import os
+import time
+from unittest.mock import patch
+
+from src import main, secret_value
+from tests.benchmark import harness
+
+LOOKUP_LATENCY_SECONDS = 0.0002
+LARGE_SECRET_LINES = 20_000
+
+
+class StubLookup:
+    """
+    Lookup answering every path after a simulated network latency, keeping
+    the time slept so the benchmark only compares the rest.
+    """
+
+    def __init__(self):
+        self.slept = 0.0
+
+    def get_secret(self, path):
+        started = time.perf_counter()
+        time.sleep(LOOKUP_LATENCY_SECONDS)
+        self.slept += time.perf_counter() - started
+        return f"value of {path}"
+
+
+def secret_entries(count):
+    return [
+        {"path": f"folder_{index}/title_{index}", "output_id": f"secret_{index}"}
+        for index in range(count)
+    ]
+
+
+def multiline_secret():
+    return "\n".join(
+        f"line {index} of a certificate-like secret value"
+        for index in range(LARGE_SECRET_LINES)
+    )
+
+
+@patch.dict(os.environ, {"GITHUB_OUTPUT": os.devnull})
+class TestBenchmarkMain(harness.BenchmarkTestCase):
+    """
+    Benchmarks for Main module
+    """
+
+    def setUp(self):
+        """Discard the workflow commands printed while measuring"""
+        # a null device, not a growing buffer, so the printed commands are
+        # not counted in the peak memory
+        devnull = open(os.devnull, "w", encoding="utf-8")
+        self.addCleanup(devnull.close)
+        stdout = contextlib.redirect_stdout(devnull)
+        stdout.__enter__()
+        self.addCleanup(stdout.__exit__, None, None, None)
+
+    def test_parse_secrets_large_input(self):
+        secrets = json.dumps(secret_entries(10_000))
+        self.assertNoRegression(
+            "parse_secrets_large_input", lambda: main.parse_secrets(secrets), 10
+        )
+
+    def test_validate_secret_entries_large_manifest(self):
+        secrets = json.dumps(
+            [
+                dict(entry, priority=index % 3, decode="base64")
+                for index, entry in enumerate(secret_entries(10_000))
+            ]
+        )
+        self.assertNoRegression(
+            "validate_secret_entries_large_manifest",
+            lambda: main.SECRET_ENTRIES.loads(secrets, "secret_path"),
+            10,
+        )
+
+    def test_get_secrets_simulated_latency(self):
+        secrets = json.dumps(secret_entries(main.MAX_SECRETS_TO_RETRIEVE))
+        lookup = StubLookup()
+        self.assertNoRegression(
+            "get_secrets_simulated_latency",
+            lambda: main.get_secrets(lookup, secrets),
+            5,
+            idle=lambda: lookup.slept,
+        )
+
+    def test_mask_secret_multiline(self):
+        secret = multiline_secret()
+        self.assertNoRegression(
+            "mask_secret_multiline",
+            lambda: main.mask_secret("add-mask", secret),
+            5,
+        )
+
+    def test_mask_secret_multiline_buffer(self):
+        secret = multiline_secret()
+
+        def mask():
+            with secret_value.SecretValue(secret) as value:
+                main.mask_secret("add-mask", value)
+
+        result = self.assertNoRegression("mask_secret_multiline_buffer", mask, 5)
+
+        # the buffer path must not use more memory than the str path
+        str_baseline = harness.load_baselines(self.baselines_file)
+        self.assertLessEqual(
+            result.peak_bytes, str_baseline["mask_secret_multiline"]["peak_bytes"]
+        )
+
+    def test_append_output_throughput(self):
+        secret = "x" * 4096
+        self.assertNoRegression(
+            "append_output_throughput",
+            lambda: main.append_output("secret", secret),
+            200,
+        )
@@ -0,0 +1,397 @@
+"""
+Local stand-in of the Secrets Safe API for trace replays.
+
+The stand-in answers every call made by the actions with a minimal valid
+response. Calls whose operation appears in the replayed trace take as long,
+and return as many bytes, as the recorded calls, cycling through the
+recorded samples; other calls are answered at once. With a capacity set,
+calls beyond it are refused with a 503, like an overloaded appliance, so the
+retries of the actions show up in the report.
+
+For unit tests, the stand-in can also check the session cookie set at
+sign-in, refusing with a 401 the calls made out of session like the API, and
+fail chosen calls with a 403, which the actions do not retry.
+"""
+
+import http.cookies
+import http.server
+import itertools
+import json
+import secrets
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from src import tracing
+
+BASE_PATH = "/BeyondTrust/api/public/v3"
+FOLDER_ID = "7f1a6b0e-5c1d-4c7e-9d0a-2b3c4d5e6f70"
+SECRET_ID = "4b2e8c1a-9f3d-4a6b-8c7e-1d2f3a4b5c6d"
+REQUEST_ID = 1
+LISTED_ACCOUNTS = 10
+LISTED_SECRETS = 10
+SESSION_COOKIE = "ASP.NET_SessionId"
+SIGN_IN = "POST auth/signappin"
+SIGN_OUT = "POST auth/signout"
+# calls answered with or without a session, like probes
+OUT_OF_SESSION = ("POST auth/connect/token", SIGN_IN, SIGN_OUT)
+
+Sample = Tuple[float, int]
+Response = Tuple[int, object]
+Route = Callable[[Dict[str, str], int], Response]
+
+
+class Profiles:
+    """
+    Recorded latency and response size of the operations of a trace.
+    """
+
+    def __init__(self, records: Iterable[dict]):
+        """
+        Args:
+            records (Iterable[dict]): Trace records.
+        """
+        samples: Dict[str, List[Sample]] = {}
+        for entry in records:
+            samples.setdefault(entry["op"], []).append(
+                (entry["seconds"], entry["received"])
+            )
+        self._cycles = {op: itertools.cycle(values) for op, values in samples.items()}
+        self._lock = threading.Lock()
+
+    def next(self, op: str) -> Optional[Sample]:
+        """
+        Get the next recorded sample of an operation.
+
+        Args:
+            op (str): The operation.
+
+        Returns:
+            Tuple[float, int], optional: Latency in seconds and response size
+            in bytes, None when the operation was not recorded.
+        """
+        with self._lock:
+            cycle = self._cycles.get(op)
+            return next(cycle) if cycle is not None else None
+
+
+class Stats:
+    """
+    Thread-safe counts and latencies of the calls served by the stand-in.
+    """
+
+    def __init__(self):
+        self.calls: Dict[str, int] = {}
+        self.rejected = 0
+        self.latencies: List[float] = []
+        self._lock = threading.Lock()
+
+    def served(self, op: str, seconds: float) -> None:
+        """
+        Count a call served in the given time.
+        """
+        with self._lock:
+            self.calls[op] = self.calls.get(op, 0) + 1
+            self.latencies.append(seconds)
+
+    def refused(self, op: str) -> None:
+        """
+        Count a call refused over capacity.
+        """
+        with self._lock:
+            self.calls[op] = self.calls.get(op, 0) + 1
+            self.rejected += 1
+
+    @property
+    def total(self) -> int:
+        """
+        Number of calls received.
+        """
+        with self._lock:
+            return sum(self.calls.values())
+
+
+def _pad(value: str, size: int) -> str:
+    return value + "x" * max(0, size - len(value))
+
+
+def _list_secrets(params: Dict[str, str], size: int) -> Response:
+    if "folderid" in params:
+        return 200, [
+            {
+                "Id": SECRET_ID,
+                "Title": f"rotate_{index}",
+                "Username": "replay",
+                "SecretType": "Credential",
+            }
+            for index in range(LISTED_SECRETS)
+        ]
+    secret = {
+        "Id": SECRET_ID,
+        "Title": params.get("title", ""),
+        "SecretType": "Credential",
+        "Password": _pad("", size),
+    }
+    return 200, [secret]
+
+
+def _list_managed_accounts(params: Dict[str, str], size: int) -> Response:
+    if "accountname" in params:
+        return 200, {"SystemId": 1, "AccountId": 1}
+    return 200, [
+        {
+            "SystemName": params.get("systemname", ""),
+            "AccountName": f"account_{index}",
+            "SystemId": 1,
+            "AccountId": index + 1,
+        }
+        for index in range(LISTED_ACCOUNTS)
+    ]
+
+
+def _reply(status: int, body: object = None) -> Route:
+    return lambda params, size: (status, body)
+
+
+def _padded(params: Dict[str, str], size: int) -> Response:
+    return 200, _pad("", size)
+
+
+def _text(params: Dict[str, str], size: int) -> Response:
+    return 200, {"Id": SECRET_ID, "Username": "replay", "Text": _pad("", size)}
+
+
+ROUTES: Dict[str, Route] = {
+    "POST auth/connect/token": _reply(
+        200, {"access_token": "replay", "expires_in": 3600}
+    ),
+    "POST auth/signappin": _reply(200, {"UserId": 1, "UserName": "replay"}),
+    "POST auth/signout": _reply(200),
+    "GET secrets-safe/secrets": _list_secrets,
+    "GET secrets-safe/secrets/{id}": _text,
+    "GET secrets-safe/secrets/{id}/text": _text,
+    "GET secrets-safe/secrets/{id}/file/download": _padded,
+    "GET secrets-safe/folders": lambda params, size: (
+        200,
+        [{"Id": FOLDER_ID, "Name": params.get("foldername", "")}],
+    ),
+    "POST secrets-safe/folders/{id}/secrets": _reply(201, {"Id": SECRET_ID}),
+    "POST secrets-safe/folders/{id}/secrets/text": _reply(201, {"Id": SECRET_ID}),
+    "POST secrets-safe/folders/{id}/secrets/file": _reply(201, {"Id": SECRET_ID}),
+    "PUT secrets-safe/secrets/{id}": _reply(200, {"Id": SECRET_ID}),
+    "PUT secrets-safe/secrets/{id}/text": _reply(200, {"Id": SECRET_ID}),
+    "PUT secrets-safe/secrets/{id}/file": _reply(204),
+    "GET passwordrules/{id}": _reply(200, {}),
+    "GET managedaccounts": _list_managed_accounts,
+    "POST requests": _reply(201, REQUEST_ID),
+    "GET credentials/{id}": _padded,
+    "PUT requests/{id}/checkin": _reply(204),
+}
+
+
+def respond(method: str, path: str, query: str, size: int) -> Response:
+    """
+    Build the response of a call.
+
+    Args:
+        method (str): HTTP method.
+        path (str): Path of the call, without the API URL path.
+        query (str): Query string of the call.
+        size (int): Recorded response size, secret values are padded to it.
+
+    Returns:
+        Tuple[int, object]: Status code and JSON body, None for no body.
+    """
+    if method == "HEAD":
+        return 200, None
+    op = tracing.operation(method, path)
+    route = ROUTES.get(op)
+    if route is None:
+        return 404, {"error": f"{op} is not served by the stand-in"}
+    # query parameter names are case-insensitive for the API
+    params = {name.lower(): values[0] for name, values in parse_qs(query).items()}
+    return route(params, size)
+
+
+class StandIn(http.server.ThreadingHTTPServer):
+    """
+    HTTP server standing in for Secrets Safe on a local port.
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        profiles: Profiles,
+        latency_scale: float = 1.0,
+        capacity: int = 0,
+        port: int = 0,
+        check_sessions: bool = False,
+        failures: Iterable[Tuple[str, int]] = (),
+    ):
+        """
+        Args:
+            profiles (Profiles): Recorded latencies and sizes.
+            latency_scale (float): Factor applied to the recorded latencies.
+            capacity (int): Calls served at once, 0 for no limit.
+            port (int): Local port, 0 for any free port.
+            check_sessions (bool): Refuse with a 401 the calls made without
+                the cookie of a session signed in and not signed out.
+            failures (Iterable[Tuple[str, int]]): Calls to fail with a 403,
+                as an operation and the number of the call of that operation,
+                counted from 1.
+        """
+        super().__init__(("127.0.0.1", port), _Handler)
+        self.profiles = profiles
+        self.latency_scale = latency_scale
+        self.stats = Stats()
+        self.check_sessions = check_sessions
+        self.failures = set(failures)
+        self.sessions: Set[str] = set()
+        self._call_numbers: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(capacity) if capacity > 0 else None
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def api_url(self) -> str:
+        """
+        API URL of the stand-in.
+        """
+        return f"http://127.0.0.1:{self.server_address[1]}{BASE_PATH}"
+
+    def acquire(self) -> bool:
+        """
+        Take a call slot, False when the stand-in is at capacity.
+        """
+        return self._slots is None or self._slots.acquire(blocking=False)
+
+    def release(self) -> None:
+        """
+        Give a call slot back.
+        """
+        if self._slots is not None:
+            self._slots.release()
+
+    def call_number(self, op: str) -> int:
+        """
+        Count a call of an operation, returning its number from 1.
+        """
+        with self._lock:
+            self._call_numbers[op] = self._call_numbers.get(op, 0) + 1
+            return self._call_numbers[op]
+
+    def open_session(self) -> str:
+        """
+        Start a session, returning its cookie value.
+        """
+        session_id = secrets.token_hex(16)
+        with self._lock:
+            self.sessions.add(session_id)
+        return session_id
+
+    def close_session(self, session_id: Optional[str]) -> None:
+        """
+        End a session, if open.
+        """
+        with self._lock:
+            self.sessions.discard(session_id)
+
+    def in_session(self, session_id: Optional[str]) -> bool:
+        """
+        Whether a session is open, always True without session checks.
+        """
+        with self._lock:
+            return not self.check_sessions or session_id in self.sessions
+
+    def __enter__(self) -> "StandIn":
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.shutdown()
+        self.server_close()
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # headers and bodies are written apart, Nagle would delay every response
+    disable_nagle_algorithm = True
+    server: StandIn
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+    def _read_body(self) -> None:
+        if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+            while True:
+                size = int(self.rfile.readline().split(b";")[0], 16)
+                self.rfile.read(size + 2)
+                if size == 0:
+                    return
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            self.rfile.read(length)
+
+    def _send(
+        self, status: int, body: object, headers: Optional[Dict[str, str]] = None
+    ) -> None:
+        content = b"" if body is None else json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        if content:
+            self.send_header("Content-Type", "application/json")
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        if content and self.command != "HEAD":
+            self.wfile.write(content)
+
+    def _session_id(self) -> Optional[str]:
+        cookie = http.cookies.SimpleCookie(self.headers.get("Cookie", ""))
+        morsel = cookie.get(SESSION_COOKIE)
+        return morsel.value if morsel else None
+
+    def _respond(self, op: str, size: int) -> None:
+        server = self.server
+        session_id = self._session_id()
+        headers = {}
+        if (op, server.call_number(op)) in server.failures:
+            status, body = 403, {"error": "failed by the stand-in"}
+        elif (
+            self.command != "HEAD"
+            and op not in OUT_OF_SESSION
+            and not server.in_session(session_id)
+        ):
+            status, body = 401, {"error": "not signed in"}
+        else:
+            parts = urlsplit(self.path)
+            path = parts.path.split(BASE_PATH, 1)[-1]
+            status, body = respond(self.command, path, parts.query, size)
+            if op == SIGN_IN:
+                headers["Set-Cookie"] = (
+                    f"{SESSION_COOKIE}={server.open_session()}; Path=/"
+                )
+            elif op == SIGN_OUT:
+                server.close_session(session_id)
+        self._send(status, body, headers)
+
+    def _handle(self) -> None:
+        started = time.perf_counter()
+        self._read_body()
+        op = tracing.operation(self.command, self.path, BASE_PATH)
+        if not self.server.acquire():
+            self.server.stats.refused(op)
+            self._send(503, {"error": "over capacity"})
+            return
+        try:
+            seconds, size = self.server.profiles.next(op) or (0.0, 0)
+            time.sleep(seconds * self.server.latency_scale)
+            self._respond(op, size)
+        finally:
+            self.server.release()
+        self.server.stats.served(op, time.perf_counter() - started)
+
+    do_GET = do_POST = do_PUT = do_DELETE = do_HEAD = _handle
@@ -0,0 +1,242 @@
+"""Unit tests for Accounts module"""
+
+import inspect
+import os
+import tempfile
+import unittest
+from unittest.mock import MagicMock
+
+from secrets_safe_library import exceptions, managed_account
+from src import accounts, batch
+
+LISTING = {
+    "db01": [
+        {"SystemName": "db01", "AccountName": "admin", "SystemId": 1, "AccountId": 10},
+        {"SystemName": "db01", "AccountName": "app", "SystemId": 1, "AccountId": 11},
+    ],
+    "db02": {
+        "SystemName": "db02",
+        "AccountName": "admin",
+        "SystemId": 2,
+        "AccountId": 20,
+    },
+}
+
+
+class TestManagedAccountBatch(unittest.TestCase):
+    """
+    Tests for AccountIndex and ManagedAccountBatch
+    """
+
+    def setUp(self):
+        self.lookup = MagicMock()
+        self.lookup.get_managed_accounts.side_effect = (
+            lambda system_name, limit, offset: LISTING[system_name]
+        )
+        self.lookup.get_request_id.side_effect = lambda system_id, account_id: (
+            account_id * 100
+        )
+        self.lookup.get_credential_by_request_id.side_effect = lambda request_id: (
+            f"credential-{request_id}"
+        )
+        self.lookup.get_secret.return_value = "searched"
+        self.authentication_obj = MagicMock()
+        self.authentication_obj.get_api_access.return_value.status_code = 200
+        self.guard = batch.SessionGuard(self.authentication_obj)
+        self.index = accounts.AccountIndex(self.lookup)
+        self.batch = accounts.ManagedAccountBatch(self.lookup, self.guard, self.index)
+
+    def test_prefetch(self):
+        """Test systems are listed once and every request is checked in"""
+        paths = ["db01/admin", "db02/admin", "db01/app"]
+        self.batch.prefetch(paths)
+
+        self.assertEqual(self.lookup.get_managed_accounts.call_count, 2)
+        self.assertEqual(
+            [self.batch.get_secret(path) for path in paths],
+            ["credential-1000", "credential-2000", "credential-1100"],
+        )
+        self.assertEqual(
+            sorted(call.args[0] for call in self.lookup.request_check_in.mock_calls),
+            [1000, 1100, 2000],
+        )
+        self.lookup.get_secret.assert_not_called()
+
+        self.batch.prefetch(["db01/admin"])
+        self.assertEqual(self.lookup.get_managed_accounts.call_count, 2)
+
+    def test_unresolved_paths_are_searched(self):
+        """Test accounts missing from the listing use the per-path flow"""
+        self.lookup.get_managed_accounts.side_effect = exceptions.LookupError("404")
+        self.batch.prefetch(["db03/admin", "invalid"])
+
+        self.assertEqual(self.batch.get_secret("db03/admin"), "searched")
+        self.assertEqual(self.batch.get_secret("invalid"), "searched")
+        self.lookup.get_request_id.assert_not_called()
+        self.authentication_obj.get_api_access.assert_called_once()
+
+    def test_failed_request_is_retried(self):
+        """Test a failed credential request is retried by the per-path flow"""
+        self.lookup.get_credential_by_request_id.side_effect = lambda request_id: (
+            self.fail_request(request_id)
+        )
+        self.batch.prefetch(["db01/admin", "db01/app"])
+
+        self.assertEqual(self.batch.get_secret("db01/admin"), "credential-1000")
+        self.assertEqual(self.batch.get_secret("db01/app"), "searched")
+        self.assertEqual(self.lookup.request_check_in.call_count, 2)
+        self.authentication_obj.get_api_access.assert_called_once()
+
+    def test_signed_out_requests_are_retried_once(self):
+        """Test requests failed by another one signing out are retried in batch"""
+        calls = []
+
+        def get_credential(request_id):
+            calls.append(request_id)
+            if (
+                request_id == 1100
+                or calls.count(request_id) == 1
+                and request_id == 1000
+            ):
+                raise exceptions.LookupError("signed out")
+            return f"credential-{request_id}"
+
+        self.lookup.get_credential_by_request_id.side_effect = get_credential
+        self.batch.prefetch(["db01/admin", "db01/app", "db02/admin"])
+
+        self.assertEqual(self.batch.get_secret("db01/admin"), "credential-1000")
+        self.assertEqual(self.batch.get_secret("db01/app"), "searched")
+        self.assertEqual(self.batch.get_secret("db02/admin"), "credential-2000")
+        self.assertEqual(sorted(calls), [1000, 1000, 1100, 1100, 2000])
+        self.assertEqual(self.lookup.get_request_id.call_count, 3)
+        self.assertEqual(self.lookup.request_check_in.call_count, 3)
+        self.assertEqual(self.authentication_obj.get_api_access.call_count, 2)
+
+    def fail_request(self, request_id):
+        if request_id == 1100:
+            raise exceptions.LookupError("denied")
+        return f"credential-{request_id}"
+
+
+class TestRequestLeases(unittest.TestCase):
+    """
+    Tests for RequestLeases
+    """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.path = os.path.join(self.directory.name, "requests.json")
+        self.now = 1000.0
+        self.leases = accounts.RequestLeases(self.path, 10, clock=lambda: self.now)
+
+    def test_save_and_load(self):
+        """Test leases are shared through the file until they expire"""
+        self.leases.add((1, 10), 1000)
+        self.leases.save()
+
+        loaded = accounts.RequestLeases(self.path, 10, clock=lambda: self.now).load()
+        self.assertEqual(loaded.get((1, 10)), 1000)
+        self.assertIsNone(loaded.get((1, 11)))
+
+        self.now += 600 - accounts.LEASE_MARGIN_SECONDS
+        self.assertIsNone(loaded.get((1, 10)))
+
+        loaded.discard((1, 10))
+        loaded.save()
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_check_in_all(self):
+        """Test only unexpired requests are checked in, and all are forgotten"""
+        lookup = MagicMock()
+        lookup.request_check_in.side_effect = [None, exceptions.LookupError("gone")]
+        for account_id in (10, 11, 12):
+            self.now += 300
+            self.leases.add((1, account_id), account_id * 100)
+
+        self.assertEqual(self.leases.check_in_all(lookup), 1)
+        self.assertEqual(
+            [call.args[0] for call in lookup.request_check_in.mock_calls], [1100, 1200]
+        )
+        self.assertIsNone(self.leases.get((1, 12)))
+
+    def test_batch_reuses_leases(self):
+        """Test a leased request is reused and not checked in by the batch"""
+        lookup = MagicMock()
+        lookup.get_managed_accounts.return_value = LISTING["db02"]
+        lookup._run_post_request.return_value.json.return_value = 2000
+        lookup.get_credential_by_request_id.return_value = "credential"
+        guard = batch.SessionGuard(MagicMock())
+        account_batch = accounts.ManagedAccountBatch(
+            lookup, guard, accounts.AccountIndex(lookup), leases=self.leases
+        )
+
+        for _ in range(2):
+            account_batch.prefetch(["db02/admin"])
+            self.assertEqual(account_batch.get_secret("db02/admin"), "credential")
+
+        lookup._run_post_request.assert_called_once()
+        self.assertEqual(
+            lookup._run_post_request.call_args.kwargs["payload"]["DurationMinutes"], 10
+        )
+        self.assertEqual(lookup.get_credential_by_request_id.call_count, 2)
+        lookup.request_check_in.assert_not_called()
+        self.assertEqual(self.leases.get((2, 20)), 2000)
+
+    def test_failed_lease_is_checked_in(self):
+        """Test a leased request whose credential failed is checked in"""
+        lookup = MagicMock()
+        lookup.get_managed_accounts.return_value = LISTING["db02"]
+        lookup.get_credential_by_request_id.side_effect = exceptions.LookupError(
+            "denied"
+        )
+        lookup.get_secret.return_value = "searched"
+        authentication_obj = MagicMock()
+        authentication_obj.get_api_access.return_value.status_code = 200
+        guard = batch.SessionGuard(authentication_obj)
+        account_batch = accounts.ManagedAccountBatch(
+            lookup, guard, accounts.AccountIndex(lookup), leases=self.leases
+        )
+        self.leases.add((2, 20), 2000)
+
+        account_batch.prefetch(["db02/admin"])
+
+        lookup.request_check_in.assert_called_once_with(2000)
+        self.assertIsNone(self.leases.get((2, 20)))
+        self.assertEqual(account_batch.get_secret("db02/admin"), "searched")
+
+    def test_library_compatibility(self):
+        """
+        Test the request sent through the compatibility shim matches the one
+        of ManagedAccount.create_request, but for its duration, so a change of
+        the library internals it relies on fails here
+        """
+        parameters = inspect.signature(
+            managed_account.ManagedAccount._run_post_request
+        ).parameters
+        self.assertLessEqual(
+            {"endpoint", "payload", "include_api_version", "expected_status_code"},
+            set(parameters),
+        )
+
+        authentication_obj = MagicMock(_api_url="https://example.com/api")
+        authentication_obj._req.post.return_value = MagicMock(
+            status_code=201, json=lambda: 42
+        )
+        managed_account_obj = managed_account.ManagedAccount(
+            authentication_obj, rotate_on_checkin=False
+        )
+
+        managed_account_obj.create_request(1, 10)
+        library_call = authentication_obj._req.post.call_args.kwargs
+        request_id = accounts.create_request(managed_account_obj, (1, 10), 30)
+        call = authentication_obj._req.post.call_args.kwargs
+
+        self.assertEqual(request_id, 42)
+        self.assertEqual(call["url"], library_call["url"])
+        self.assertEqual(call["json"], dict(library_call["json"], DurationMinutes=30))
+        self.assertIs(call["json"]["RotateOnCheckin"], False)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,165 @@
+"""Unit tests for Agent module"""
+
+import json
+import os
+import shutil
+import stat
+import tempfile
+import threading
+import unittest
+from unittest.mock import MagicMock, patch
+
+from secrets_safe_library import exceptions
+from src import agent
+
+
+class TestSecretCache(unittest.TestCase):
+    """
+    Tests for SecretCache
+    """
+
+    @patch("src.agent.time.monotonic")
+    def test_cache_expires_after_ttl(self, mock_monotonic):
+        """Test cached values are dropped once the TTL elapses"""
+        mock_monotonic.return_value = 100
+        cache = agent.SecretCache(10)
+        cache.put("secret", "folder/title", "value")
+
+        mock_monotonic.return_value = 105
+        self.assertEqual(cache.get("secret", "folder/title"), "value")
+
+        mock_monotonic.return_value = 111
+        self.assertIsNone(cache.get("secret", "folder/title"))
+
+    def test_cache_disabled_with_zero_ttl(self):
+        """Test a zero TTL disables caching"""
+        cache = agent.SecretCache(0)
+        cache.put("secret", "folder/title", "value")
+        self.assertIsNone(cache.get("secret", "folder/title"))
+
+
+class TestAgentPolicy(unittest.TestCase):
+    """
+    Tests for AgentPolicy
+    """
+
+    def setUp(self):
+        self.policy = agent.AgentPolicy(
+            {"job-token": {"secret": ["ci/*"], "managed_account": ["db01/app"]}}
+        )
+
+    def test_is_allowed_matching_pattern(self):
+        """Test a token may read paths matching its patterns"""
+        self.assertTrue(self.policy.is_allowed("job-token", "secret", "ci/token"))
+        self.assertTrue(
+            self.policy.is_allowed("job-token", "managed_account", "db01/app")
+        )
+
+    def test_is_allowed_rejects_other_paths_and_tokens(self):
+        """Test paths outside the scope and unknown tokens are rejected"""
+        self.assertFalse(self.policy.is_allowed("job-token", "secret", "prod/token"))
+        self.assertFalse(self.policy.is_allowed("other", "secret", "ci/token"))
+        self.assertFalse(self.policy.is_allowed(None, "secret", "ci/token"))
+
+    def test_from_file_rejects_invalid_policy(self):
+        """Test loading a policy that is not a token to scope mapping"""
+        with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False) as fh:
+            json.dump(["not", "a", "policy"], fh)
+        self.addCleanup(os.unlink, fh.name)
+
+        with self.assertRaises(ValueError):
+            agent.AgentPolicy.from_file(fh.name)
+
+
+class TestSecretsAgent(unittest.TestCase):
+    """
+    End-to-end tests for SecretsAgent and AgentClient over a Unix socket
+    """
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.socket_path = os.path.join(self.temp_dir, "agent.sock")
+
+        self.secret_lookup = MagicMock()
+        self.secret_lookup.get_secret.return_value = "secret_value"
+        self.authentication_obj = MagicMock()
+        self.authentication_obj.get_api_access.return_value.status_code = 200
+
+        self.server = agent.SecretsAgent(
+            self.socket_path,
+            {agent.SECRET_KIND: self.secret_lookup},
+            agent.AgentPolicy({"job-token": {"secret": ["ci/*"]}}),
+            self.authentication_obj,
+            MagicMock(),
+            cache_ttl_seconds=60,
+        )
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.thread.join()
+        self.server.server_close()
+        shutil.rmtree(self.temp_dir)
+
+    def test_socket_is_private_when_bound(self):
+        """Test the socket is only accessible to its owner as soon as it exists"""
+        modes = []
+        server_bind = agent.SecretsAgent.server_bind
+
+        def bind(server):
+            server_bind(server)
+            modes.append(stat.S_IMODE(os.stat(server.server_address).st_mode))
+
+        umask = os.umask(0o022)
+        try:
+            with patch.object(agent.SecretsAgent, "server_bind", bind):
+                server = agent.SecretsAgent(
+                    os.path.join(self.temp_dir, "other.sock"),
+                    {},
+                    agent.AgentPolicy({}),
+                    self.authentication_obj,
+                    MagicMock(),
+                )
+            server.server_close()
+            self.assertEqual(os.umask(umask), 0o022)
+        finally:
+            os.umask(umask)
+
+        self.assertEqual(modes, [0o600])
+
+    def test_client_get_secret_is_cached(self):
+        """Test repeated lookups are served from the agent cache"""
+        client = agent.AgentClient(self.socket_path, "job-token", agent.SECRET_KIND)
+
+        self.assertEqual(client.get_secret("ci/token"), "secret_value")
+        self.assertEqual(client.get_secret("ci/token"), "secret_value")
+
+        self.secret_lookup.get_secret.assert_called_once_with("ci/token")
+
+    def test_client_get_secret_denied(self):
+        """Test lookups outside the job scope raise LookupError"""
+        client = agent.AgentClient(self.socket_path, "job-token", agent.SECRET_KIND)
+
+        with self.assertRaises(exceptions.LookupError):
+            client.get_secret("prod/token")
+
+        self.secret_lookup.get_secret.assert_not_called()
+
+    def test_failed_lookup_reauthenticates(self):
+        """Test the agent signs in again after a failed lookup"""
+        client = agent.AgentClient(self.socket_path, "job-token", agent.SECRET_KIND)
+        self.secret_lookup.get_secret.side_effect = [
+            exceptions.LookupError("not found"),
+            "secret_value",
+        ]
+
+        with self.assertRaises(exceptions.LookupError):
+            client.get_secret("ci/missing")
+
+        self.assertEqual(client.get_secret("ci/token"), "secret_value")
+        self.authentication_obj.get_api_access.assert_called_once()
+
+
+if __name__ == "__main__":
+    unittest.main()
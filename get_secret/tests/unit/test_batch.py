@@ -0,0 +1,78 @@
+"""Unit tests for Batch module"""
+
+import unittest
+from unittest.mock import MagicMock
+
+from secrets_safe_library import exceptions
+from src import batch
+
+
+class TestBatchResult(unittest.TestCase):
+    """
+    Tests for BatchResult
+    """
+
+    def setUp(self):
+        self.batch_result = batch.BatchResult()
+        self.batch_result.record("ok", batch.SUCCESS, 0.01)
+        self.batch_result.record("optional", batch.SKIPPED, 0.5, Exception("timeout"))
+
+    def test_should_fail_by_policy(self):
+        """Test each error policy with only an optional lookup skipped"""
+        self.assertFalse(self.batch_result.should_fail(batch.POLICY_REQUIRED))
+        self.assertTrue(self.batch_result.should_fail(batch.POLICY_ANY))
+        self.assertFalse(self.batch_result.should_fail(batch.POLICY_NEVER))
+
+    def test_error_summary(self):
+        """Test the summary only lists unsuccessful lookups"""
+        self.assertEqual(self.batch_result.error_count, 1)
+        self.assertEqual(
+            self.batch_result.error_summary(),
+            [
+                {
+                    "output_id": "optional",
+                    "status": batch.SKIPPED,
+                    "latency_ms": 500.0,
+                    "error": "timeout",
+                }
+            ],
+        )
+
+
+class TestResilientLookup(unittest.TestCase):
+    """
+    Tests for SessionGuard and ResilientLookup
+    """
+
+    def setUp(self):
+        self.authentication_obj = MagicMock()
+        self.authentication_obj.get_api_access.return_value.status_code = 200
+        self.session_guard = batch.SessionGuard(self.authentication_obj)
+
+    def test_signs_in_again_after_failure(self):
+        """Test a failed lookup on one object re-authenticates the shared session"""
+        secrets = MagicMock()
+        secrets.get_secret.side_effect = exceptions.LookupError("not found")
+        accounts = MagicMock()
+        accounts.get_secret.return_value = "account_value"
+
+        with self.assertRaises(exceptions.LookupError):
+            batch.ResilientLookup(secrets, self.session_guard).get_secret("a/b")
+
+        self.authentication_obj.get_api_access.assert_not_called()
+        value = batch.ResilientLookup(accounts, self.session_guard).get_secret("c/d")
+
+        self.assertEqual(value, "account_value")
+        self.authentication_obj.get_api_access.assert_called_once()
+
+    def test_failed_reauthentication_raises(self):
+        """Test a rejected sign-in raises AuthenticationFailure"""
+        self.authentication_obj.get_api_access.return_value.status_code = 401
+        self.session_guard.invalidate()
+
+        with self.assertRaises(exceptions.AuthenticationFailure):
+            batch.ResilientLookup(MagicMock(), self.session_guard).get_secret("a/b")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,171 @@
+"""Unit tests for Client module"""
+
+import os
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch
+
+from secrets_safe_library import exceptions
+from src import accounts, agent, batch, client
+
+CONFIG = client.ClientConfig(
+    api_url="https://example.com/BeyondTrust/api/public/v3",
+    client_id="456126543212456126543212456126543212",
+    client_secret="123321654234123321654234123321654234",
+)
+
+
+@patch("src.client.authentication.Authentication.sign_app_out")
+@patch("src.client.authentication.Authentication.get_api_access")
+class TestClient(unittest.TestCase):
+    """
+    Unit tests for client module:
+    - retrieve_entries
+    - SecretsSafeClient
+    """
+
+    @patch("src.client.secrets_safe.SecretsSafe.get_secret")
+    def test_get_many(self, mock_get_secret, mock_get_api_access, mock_sign_out):
+        """
+        Verify that a batch is retrieved under one sign-in, by priority, with
+        failed lookups recorded and the others post-processed.
+        """
+        mock_get_api_access.return_value = MagicMock(status_code=200)
+        values = {"a/one": "b25l", "a/two": "two"}
+        mock_get_secret.side_effect = lambda path: values[path]
+        batch_result = batch.BatchResult()
+
+        with client.SecretsSafeClient(CONFIG) as secrets_client:
+            result = secrets_client.get_many(
+                [
+                    {"path": "a/one", "output_id": "one", "decode": "base64"},
+                    {"path": "a/two", "output_id": "two", "priority": 1},
+                    {"path": "a/missing", "output_id": "missing", "required": False},
+                ],
+                batch_result=batch_result,
+            )
+
+        self.assertEqual(result, {"two": "two", "one": "one"})
+        self.assertEqual(list(result), ["two", "one"])
+        self.assertEqual([r.output_id for r in batch_result.skipped], ["missing"])
+        mock_get_api_access.assert_called_once()
+        mock_sign_out.assert_called_once()
+
+    def test_sign_in_failure(self, mock_get_api_access, mock_sign_out):
+        """
+        Verify that a failed sign-in raises AuthenticationFailure.
+        """
+        mock_get_api_access.return_value = MagicMock(status_code=401, text="denied")
+
+        with self.assertRaises(exceptions.AuthenticationFailure) as context:
+            client.SecretsSafeClient(CONFIG).sign_in()
+
+        self.assertIn("Please check credentials", str(context.exception))
+        mock_sign_out.assert_not_called()
+
+    def test_background_sign_in(self, mock_get_api_access, mock_sign_out):
+        """
+        Verify that a sign-in started in the background is waited for, once,
+        and that its failure is raised by wait_signed_in.
+        """
+        mock_get_api_access.return_value = MagicMock(status_code=200)
+        secrets_client = client.SecretsSafeClient(CONFIG)
+        secrets_client.start_sign_in()
+
+        with secrets_client:
+            self.assertIsNotNone(secrets_client.authentication_obj)
+
+        mock_get_api_access.assert_called_once()
+        mock_sign_out.assert_called_once()
+
+        mock_get_api_access.return_value = MagicMock(status_code=401, text="denied")
+        secrets_client = client.SecretsSafeClient(CONFIG)
+        secrets_client.start_sign_in()
+
+        with self.assertRaises(exceptions.AuthenticationFailure):
+            secrets_client.wait_signed_in()
+
+    def test_close_during_background_sign_in(self, mock_get_api_access, mock_sign_out):
+        """
+        Verify that closing the client waits for the sign-in, signs out and
+        does not raise the sign-in failure.
+        """
+        mock_get_api_access.return_value = MagicMock(status_code=200)
+        secrets_client = client.SecretsSafeClient(CONFIG)
+        secrets_client.start_sign_in()
+        secrets_client.close()
+
+        mock_sign_out.assert_called_once()
+
+        mock_get_api_access.return_value = MagicMock(status_code=401, text="denied")
+        secrets_client = client.SecretsSafeClient(CONFIG)
+        secrets_client.start_sign_in()
+        secrets_client.close()
+
+        mock_sign_out.assert_called_once()
+
+    def test_library_lookup(self, mock_get_api_access, mock_sign_out):
+        """
+        Verify that lookup objects are created once per kind and unknown
+        kinds are rejected.
+        """
+        mock_get_api_access.return_value = MagicMock(status_code=200)
+
+        with client.SecretsSafeClient(CONFIG) as secrets_client:
+            lookup = secrets_client.library_lookup(agent.MANAGED_ACCOUNT_KIND)
+            self.assertIs(
+                secrets_client.library_lookup(agent.MANAGED_ACCOUNT_KIND), lookup
+            )
+            with self.assertRaises(ValueError):
+                secrets_client.library_lookup("unknown")
+
+    def test_managed_account_lookup(self, mock_get_api_access, mock_sign_out):
+        """
+        Verify that managed accounts are looked up in batches sharing one
+        account index, unless disabled.
+        """
+        mock_get_api_access.return_value = MagicMock(status_code=200)
+
+        with client.SecretsSafeClient(CONFIG) as secrets_client:
+            lookup = secrets_client.lookup(agent.MANAGED_ACCOUNT_KIND)
+            self.assertIsInstance(lookup, accounts.ManagedAccountBatch)
+            self.assertIs(
+                secrets_client.lookup(agent.MANAGED_ACCOUNT_KIND)._index,
+                lookup._index,
+            )
+
+        config = CONFIG._replace(managed_account_max_workers=0)
+        with client.SecretsSafeClient(config) as secrets_client:
+            self.assertIsInstance(
+                secrets_client.lookup(agent.MANAGED_ACCOUNT_KIND), batch.ResilientLookup
+            )
+
+    def test_check_in_requests(self, mock_get_api_access, mock_sign_out):
+        """
+        Verify that the requests kept open for the job are checked in and
+        the lease file is removed.
+        """
+        mock_get_api_access.return_value = MagicMock(status_code=200)
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "requests.json")
+            leases = accounts.RequestLeases(path, 10)
+            leases.add((1, 10), 1000)
+            leases.save()
+            config = CONFIG._replace(
+                request_duration_minutes=10, request_lease_file=path
+            )
+
+            with client.SecretsSafeClient(config) as secrets_client:
+                lookup = secrets_client.library_lookup(agent.MANAGED_ACCOUNT_KIND)
+                with patch.object(lookup, "request_check_in") as mock_check_in:
+                    self.assertEqual(secrets_client.check_in_requests(), 0)
+
+            mock_check_in.assert_called_once_with(1000)
+            self.assertFalse(os.path.exists(path))
+
+        self.assertEqual(client.SecretsSafeClient(CONFIG).check_in_requests(), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -3,6 +3,7 @@
 import json
 import os
 import tempfile
+import threading
 import unittest
 from unittest.mock import MagicMock, call, patch
 
@@ -33,9 +34,9 @@ class TestMain(unittest.TestCase):
             os.unlink(self.temp_file.name)
 
     @patch("src.main.append_output")
-    @patch("src.main.managed_account.ManagedAccount.get_secret")
-    @patch("src.main.secrets_safe.SecretsSafe.get_secret")
-    @patch("src.main.authentication.Authentication.get_api_access")
+    @patch("src.client.managed_account.ManagedAccount.get_secret")
+    @patch("src.client.secrets_safe.SecretsSafe.get_secret")
+    @patch("src.client.authentication.Authentication.get_api_access")
     def test_main(
         self,
         get_api_access_mock,
@@ -213,8 +214,12 @@ class TestMain(unittest.TestCase):
 
     @patch("src.main.common.show_error")
     @patch("src.main.append_output")
-    def test_get_secrets_invalid_output_id_with_newline(self, mock_append, mock_show_error):
-        """Test get_secrets rejects output_id containing a newline (injection attempt)"""
+    def test_get_secrets_invalid_output_id_with_newline(
+        self, mock_append, mock_show_error
+    ):
+        """
+        Test get_secrets rejects output_id containing a newline (injection attempt)
+        """
         mock_show_error.side_effect = SystemExit(1)
         secret_obj = MagicMock()
         secret_obj.get_secret.return_value = "test_secret"
@@ -236,8 +241,12 @@ class TestMain(unittest.TestCase):
 
     @patch("src.main.common.show_error")
     @patch("src.main.append_output")
-    def test_get_secrets_invalid_output_id_trailing_newline(self, mock_append, mock_show_error):
-        """Test get_secrets rejects output_id with a trailing newline (regex $ bypass)"""
+    def test_get_secrets_invalid_output_id_trailing_newline(
+        self, mock_append, mock_show_error
+    ):
+        """
+        Test get_secrets rejects output_id with a trailing newline (regex $ bypass)
+        """
         mock_show_error.side_effect = SystemExit(1)
         secret_obj = MagicMock()
         secret_obj.get_secret.return_value = "test_secret"
@@ -259,7 +268,9 @@ class TestMain(unittest.TestCase):
 
     @patch("src.main.common.show_error")
     @patch("src.main.append_output")
-    def test_get_secrets_invalid_output_id_special_chars(self, mock_append, mock_show_error):
+    def test_get_secrets_invalid_output_id_special_chars(
+        self, mock_append, mock_show_error
+    ):
         """Test get_secrets rejects output_id with disallowed special characters"""
         mock_show_error.side_effect = SystemExit(1)
         secret_obj = MagicMock()
@@ -279,7 +290,9 @@ class TestMain(unittest.TestCase):
 
     @patch("src.main.common.show_error")
     @patch("src.main.append_output")
-    def test_get_secrets_invalid_output_id_non_string(self, mock_append, mock_show_error):
+    def test_get_secrets_invalid_output_id_non_string(
+        self, mock_append, mock_show_error
+    ):
         """Test get_secrets rejects non-string output_id (e.g., null, number)"""
         mock_show_error.side_effect = SystemExit(1)
         secret_obj = MagicMock()
@@ -338,7 +351,7 @@ class TestMain(unittest.TestCase):
         mock_append.assert_any_call("id2", "secret2")
 
     @patch("src.main.common.show_error")
-    @patch("src.main.authentication.Authentication.get_api_access")
+    @patch("src.client.authentication.Authentication.get_api_access")
     def test_main_auth_failure(self, mock_get_api_access, mock_show_error):
         """Test main function with authentication failure"""
         # Mock show_error to raise SystemExit to simulate sys.exit(1)
@@ -363,10 +376,378 @@ class TestMain(unittest.TestCase):
         # Mock show_error to raise SystemExit to simulate sys.exit(1)
         mock_show_error.side_effect = SystemExit(1)
 
-        with patch("src.main.requests.Session") as mock_session:
+        with patch("src.client.requests.Session") as mock_session:
             mock_session.side_effect = Exception("Test exception")
 
             with self.assertRaises(SystemExit):
                 main.main()
 
             mock_show_error.assert_called_once()
+
+    @patch("src.main.common.show_error")
+    def test_main_writes_metrics(self, mock_show_error):
+        """Test main writes the run metrics even when the run fails"""
+        mock_show_error.side_effect = SystemExit(1)
+        metrics_dir = tempfile.mkdtemp()
+
+        with patch("src.main.METRICS_DIR", metrics_dir), patch(
+            "src.main.METRICS", main.metrics.Metrics({"action": "get_secret"})
+        ), patch("src.client.requests.Session") as mock_session:
+            mock_session.side_effect = Exception("Test exception")
+            with self.assertRaises(SystemExit):
+                main.main()
+
+        path = os.path.join(metrics_dir, "secrets_safe_get_secret.prom")
+        with open(path, encoding="utf-8") as fh:
+            content = fh.read()
+        os.unlink(path)
+        os.rmdir(metrics_dir)
+
+        self.assertIn('run_success{action="get_secret"} 0', content)
+        self.assertIn('errors_total{action="get_secret",type="Exception"} 1', content)
+
+    @patch("src.main.common.show_error")
+    def test_invalid_numeric_settings(self, mock_show_error):
+        """Test invalid settings fall back at import and fail the run"""
+        mock_show_error.side_effect = SystemExit(1)
+        invalid = []
+
+        with patch("src.main.INVALID_SETTINGS", invalid), patch.dict(
+            os.environ,
+            {
+                "RATE_LIMIT_RPS": "fast",
+                "AGENT_CACHE_TTL_SECONDS": " 60 ",
+                "LOG_SAMPLE_RATE": "nan",
+                "LOG_FORMAT": "JSON",
+            },
+        ):
+            self.assertEqual(main.number_setting("RATE_LIMIT_RPS", 0.0), 0.0)
+            self.assertEqual(
+                main.number_setting("AGENT_CACHE_TTL_SECONDS", 300, int), 60
+            )
+            self.assertEqual(main.number_setting("UNSET_SETTING", 5, int), 5)
+            self.assertEqual(
+                main.number_setting("LOG_SAMPLE_RATE", 1.0, valid=lambda r: r <= 1),
+                1.0,
+            )
+            self.assertEqual(
+                main.choice_setting("LOG_FORMAT", ("text", "json"), "text"), "json"
+            )
+            self.assertEqual(
+                invalid, ["RATE_LIMIT_RPS='fast'", "LOG_SAMPLE_RATE='nan'"]
+            )
+
+            with patch("src.main.open_client") as mock_open_client:
+                with self.assertRaises(SystemExit):
+                    main.run()
+
+        self.assertIn("RATE_LIMIT_RPS='fast'", mock_show_error.call_args.args[0])
+        mock_open_client.assert_not_called()
+
+    @patch("src.main.open_client")
+    def test_check_in_requests(self, mock_open_client):
+        """Test the post step only signs in when requests were kept open"""
+        secrets_client = mock_open_client.return_value.__enter__.return_value
+        secrets_client.check_in_requests.return_value = 0
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "secrets_safe_requests.json")
+            with patch("src.main.REQUEST_LEASE_FILE", path):
+                main.check_in_requests()
+                mock_open_client.assert_not_called()
+
+                with open(path, "w", encoding="utf-8") as fh:
+                    fh.write("[]")
+                main.check_in_requests()
+
+        secrets_client.check_in_requests.assert_called_once()
+
+    @patch("src.main.report_batch_result")
+    @patch("src.client.requests.Session")
+    @patch("src.main.get_secrets")
+    def test_main_uses_agent_socket(self, mock_get_secrets, mock_session, mock_report):
+        """Test main retrieves through the resident agent without signing in"""
+        with patch("src.main.AGENT_SOCKET", "/tmp/agent.sock"), patch(
+            "src.main.AGENT_TOKEN", "job-token"
+        ):
+            main.main()
+
+        self.assertEqual(mock_get_secrets.call_count, 2)
+        secret_client = mock_get_secrets.call_args_list[0].args[0]
+        self.assertIsInstance(secret_client, main.agent.AgentClient)
+        mock_session.assert_not_called()
+
+    @patch("src.main.append_output")
+    @patch("src.main.mask_secret")
+    def test_get_secrets_decodes_before_publishing(self, mock_mask, mock_append):
+        """Test get_secrets publishes the post-processed value"""
+        secret_obj = MagicMock()
+        secret_obj.get_secret.return_value = "ZGVjb2RlZA=="
+
+        secrets_json = json.dumps(
+            {"path": "test_path", "output_id": "test_id", "decode": "base64"}
+        )
+
+        main.get_secrets(secret_obj, secrets_json)
+
+        mock_mask.assert_called_once_with("add-mask", "decoded")
+        mock_append.assert_called_once_with("test_id", "decoded")
+
+    @patch("src.main.common.show_error")
+    def test_get_secrets_invalid_convert(self, mock_show_error):
+        """Test get_secrets rejects unsupported conversions before any lookup"""
+        mock_show_error.side_effect = SystemExit(1)
+        secret_obj = MagicMock()
+
+        secrets_json = json.dumps(
+            {"path": "test_path", "output_id": "test_id", "convert": "jks"}
+        )
+
+        with self.assertRaises(SystemExit):
+            main.get_secrets(secret_obj, secrets_json)
+
+        args, _ = mock_show_error.call_args
+        self.assertIn("Invalid convert", args[0])
+        secret_obj.get_secret.assert_not_called()
+
+    @patch("src.main.append_output")
+    @patch("src.main.mask_secret")
+    def test_get_secrets_priority_order(self, mock_mask, mock_append):
+        """Test higher priority entries are fetched and published first"""
+        secret_obj = MagicMock()
+        secret_obj.get_secret.side_effect = lambda path: f"value-{path}"
+
+        secrets_json = json.dumps(
+            [
+                {"path": "low", "output_id": "low"},
+                {"path": "high", "output_id": "high", "priority": 10},
+                {"path": "default", "output_id": "default"},
+            ]
+        )
+
+        main.get_secrets(secret_obj, secrets_json)
+
+        self.assertEqual(
+            [c.args[0] for c in secret_obj.get_secret.call_args_list],
+            ["high", "low", "default"],
+        )
+        self.assertEqual(
+            [c.args[0] for c in mock_append.call_args_list],
+            ["high", "low", "default"],
+        )
+
+    @patch("src.main.append_output")
+    @patch("src.main.mask_secret")
+    def test_get_secrets_skips_optional_failures(self, mock_mask, mock_append):
+        """Test optional entries that fail are skipped without failing the run"""
+        secret_obj = MagicMock()
+        secret_obj.get_secret.side_effect = [Exception("timeout"), "required_value"]
+
+        secrets_json = json.dumps(
+            [
+                {"path": "optional", "output_id": "optional", "required": False},
+                {"path": "required", "output_id": "required"},
+            ]
+        )
+
+        batch_result = main.get_secrets(secret_obj, secrets_json)
+
+        self.assertEqual([r.output_id for r in batch_result.skipped], ["optional"])
+        self.assertFalse(batch_result.should_fail("required"))
+        mock_append.assert_called_once_with("required", "required_value")
+
+    @patch("src.main.append_output")
+    @patch("src.main.mask_secret")
+    def test_get_secrets_required_failure_keeps_other_outputs(
+        self, mock_mask, mock_append
+    ):
+        """Test a failing required entry is recorded and others still published"""
+        secret_obj = MagicMock()
+        secret_obj.get_secret.side_effect = [Exception("not found"), "value2"]
+
+        secrets_json = json.dumps(
+            [
+                {"path": "path1", "output_id": "id1"},
+                {"path": "path2", "output_id": "id2"},
+            ]
+        )
+
+        batch_result = main.get_secrets(secret_obj, secrets_json)
+
+        self.assertEqual([r.output_id for r in batch_result.failed], ["id1"])
+        self.assertTrue(batch_result.should_fail("required"))
+        self.assertFalse(batch_result.should_fail("never"))
+        mock_append.assert_called_once_with("id2", "value2")
+
+    @patch("src.main.common.show_error")
+    @patch("src.main.append_output")
+    def test_report_batch_result_fails_on_required_error(
+        self, mock_append, mock_show_error
+    ):
+        """Test the error outputs are published before failing the step"""
+        mock_show_error.side_effect = SystemExit(1)
+        batch_result = main.batch.BatchResult()
+        batch_result.record("id1", main.batch.SUCCESS, 0.1)
+        batch_result.record("id2", main.batch.FAILED, 0.2, Exception("not found"))
+
+        with self.assertRaises(SystemExit):
+            main.report_batch_result(batch_result)
+
+        mock_append.assert_any_call("error_count", "1")
+        summary = json.loads(mock_append.call_args_list[1].args[1])
+        self.assertEqual(summary[0]["output_id"], "id2")
+        self.assertEqual(summary[0]["error"], "not found")
+        args, _ = mock_show_error.call_args
+        self.assertIn("1 secret lookups failed: id2", args[0])
+
+    @patch("src.main.common.show_error")
+    @patch("src.main.append_output")
+    def test_report_batch_result_policy_never(self, mock_append, mock_show_error):
+        """Test the never policy publishes errors without failing the step"""
+        batch_result = main.batch.BatchResult()
+        batch_result.record("id1", main.batch.FAILED, 0.2, Exception("not found"))
+
+        with patch("src.main.ERROR_POLICY", "never"):
+            main.report_batch_result(batch_result)
+
+        mock_append.assert_any_call("error_count", "1")
+        mock_show_error.assert_not_called()
+
+    @patch("src.main.append_output")
+    @patch("src.main.mask_secret")
+    def test_publish_secrets_large_value_uses_buffer(self, mock_mask, mock_append):
+        """Test values above the buffer threshold are published and zeroized"""
+        published = []
+        mock_append.side_effect = lambda name, value: published.append(
+            bytes(value.view())
+        )
+
+        with patch("src.main.SECRET_BUFFER_THRESHOLD_BYTES", 4):
+            main.publish_secrets(
+                ["large"], [main.postprocess.PostProcessJob("large_value")]
+            )
+
+        self.assertEqual(published, [b"large_value"])
+        value = mock_mask.call_args.args[1]
+        self.assertIsInstance(value, main.secret_value.SecretValue)
+        self.assertEqual(bytes(value.view()), bytes(len("large_value")))
+
+    def test_build_plan_managed_account_batches(self):
+        """Test the plan lists each managed system once and reuses leases"""
+        managed_accounts = json.dumps(
+            [
+                {"path": "system_a/account_1", "output_id": "a1"},
+                {"path": "system_a/account_2", "output_id": "a2"},
+                {"path": "system_b/account_1", "output_id": "b1"},
+            ]
+        )
+        with patch("src.main.MANAGED_ACCOUNT_PATH", managed_accounts), patch(
+            "src.main.API_KEY", ""
+        ), patch("src.main.MANAGED_ACCOUNT_MAX_WORKERS", 4), patch(
+            "src.main.CREDENTIAL_REQUEST_MINUTES", 30
+        ), patch(
+            "src.main.REQUEST_LEASE_FILE", "requests.json"
+        ):
+            run_plan = main.build_plan()
+
+        calls = {(c.stage, c.endpoint): c for c in run_plan.calls}
+        self.assertEqual(calls[("lookups", "ManagedAccounts")].count, 2)
+        self.assertEqual(calls[("requests", "Requests")].count, 3)
+        self.assertEqual(calls[("requests", "Requests")].concurrency, 4)
+        self.assertEqual(calls[("lookups", "Secrets-Safe/secrets")].count, 1)
+        self.assertNotIn("checkins", {c.stage for c in run_plan.calls})
+        self.assertEqual(
+            run_plan.calls[0].endpoint, "Auth/connect/token, Auth/SignAppIn"
+        )
+        self.assertEqual(run_plan.calls[-1].stage, "sign_out")
+
+    @patch("src.main.write_metrics")
+    @patch("src.main.append_output")
+    @patch("src.main.open_client")
+    def test_run_dry_run(self, mock_open_client, mock_append, mock_write_metrics):
+        """Test a dry run publishes its plan without signing in"""
+        with patch("src.main.DRY_RUN", True), patch("src.main.METRICS_DIR", ""):
+            main.run()
+
+        mock_open_client.assert_not_called()
+        output_id, value = mock_append.call_args.args
+        self.assertEqual(output_id, "plan")
+        self.assertEqual(json.loads(value)["action"], "get_secret")
+        self.assertEqual(json.loads(value)["latency_source"], "defaults")
+
+    @patch("src.main.common.show_error")
+    def test_get_secrets_reports_every_invalid_entry(self, mock_show_error):
+        """Test every invalid entry is reported at once, with its location"""
+        mock_show_error.side_effect = SystemExit(1)
+        secret_obj = MagicMock()
+        secrets_json = json.dumps(
+            [
+                {"path": "a/one", "output_id": "one"},
+                {"path": "a/two", "output_id": "two", "priority": "high"},
+                {"path": "a/three", "output_id": "error_count", "decode": "hex"},
+            ]
+        )
+
+        with self.assertRaises(SystemExit):
+            main.get_secrets(secret_obj, secrets_json)
+
+        mock_show_error.assert_called_once()
+        message = mock_show_error.call_args.args[0]
+        self.assertIn("secrets[1].priority: Invalid priority 'high'", message)
+        self.assertIn("secrets[2].output_id: Invalid output_id 'error_count'", message)
+        self.assertIn("secrets[2].decode: Invalid decode 'hex'", message)
+        secret_obj.get_secret.assert_not_called()
+
+    @patch("src.main.write_metrics")
+    @patch("src.main.open_client")
+    @patch("src.main.start_client")
+    @patch("src.main.common.show_error")
+    def test_run_validates_inputs_while_signing_in(
+        self, mock_show_error, mock_start_client, mock_open_client, mock_write_metrics
+    ):
+        """Test an invalid managed_account_path fails the run before any lookup"""
+        mock_show_error.side_effect = SystemExit(1)
+
+        with patch("src.main.MANAGED_ACCOUNT_PATH", '[{"path": "system/account"}]'):
+            with self.assertRaises(SystemExit):
+                main.run()
+
+        self.assertIn(
+            "managed_account_path[0]: Invalid JSON, validate output_id",
+            mock_show_error.call_args.args[0],
+        )
+        mock_start_client.return_value.close.assert_called_once()
+        mock_open_client.assert_not_called()
+
+    @patch("src.main.common.show_error")
+    @patch("src.client.authentication.Authentication.sign_app_out")
+    @patch("src.client.authentication.Authentication.get_api_access")
+    def test_run_signs_in_while_parsing_inputs(
+        self, mock_get_api_access, mock_sign_out, mock_show_error
+    ):
+        """Test the sign-in runs while the inputs are parsed"""
+        mock_show_error.side_effect = SystemExit(1)
+        parsing = threading.Event()
+        signed_in = threading.Event()
+
+        def get_api_access():
+            parsing.wait(5)
+            signed_in.set()
+            return MagicMock(status_code=200)
+
+        def load_run_entries():
+            parsing.set()
+            self.assertTrue(signed_in.wait(5))
+            return [], []
+
+        mock_get_api_access.side_effect = get_api_access
+        with patch("src.main.load_run_entries", load_run_entries), patch(
+            "src.main.SECRET_PATH", "folder/title"
+        ), patch("src.main.AGENT_SOCKET", None), patch.dict(
+            os.environ, {"GITHUB_OUTPUT": os.devnull}
+        ):
+            main.run()
+
+        mock_get_api_access.assert_called_once()
+        mock_sign_out.assert_called_once()
+        mock_show_error.assert_not_called()
@@ -0,0 +1,154 @@
+"""Unit tests for Metrics module"""
+
+import gzip
+import io
+import os
+import stat
+import tempfile
+import unittest
+from unittest.mock import MagicMock
+
+import requests
+from src import metrics
+from urllib3.response import HTTPResponse
+
+
+class TestMetrics(unittest.TestCase):
+    """
+    Unit tests for metrics module:
+    - textfile_name
+    - Metrics
+    """
+
+    def test_textfile_name(self):
+        """
+        Verify that the runner name is part of the file name and sanitized.
+        """
+        self.assertEqual(
+            metrics.textfile_name("get_secret", "runner 1/a"),
+            "secrets_safe_get_secret_runner_1_a.prom",
+        )
+        self.assertEqual(
+            metrics.textfile_name("get_secret", ""), "secrets_safe_get_secret.prom"
+        )
+
+    def test_render(self):
+        """
+        Verify the text format of counters, gauges and cumulative histogram
+        buckets, with the common labels and escaped label values.
+        """
+        registry = metrics.Metrics({"action": "get_secret"}, buckets=(0.1, 1.0))
+        registry.inc("errors_total", help_text="Errors.", type='Lookup"Error')
+        registry.inc("errors_total", type='Lookup"Error')
+        registry.set("run_success", 1)
+        registry.observe("lookup_seconds", 0.05)
+        registry.observe("lookup_seconds", 0.5)
+
+        text = registry.render()
+
+        self.assertIn("# HELP secrets_safe_action_errors_total Errors.\n", text)
+        self.assertIn("# TYPE secrets_safe_action_errors_total counter\n", text)
+        self.assertIn(
+            'secrets_safe_action_errors_total{action="get_secret",'
+            'type="Lookup\\"Error"} 2\n',
+            text,
+        )
+        self.assertIn('secrets_safe_action_run_success{action="get_secret"} 1\n', text)
+        prefix = 'secrets_safe_action_lookup_seconds_bucket{action="get_secret",le='
+        self.assertIn(prefix + '"0.1"} 1\n', text)
+        self.assertIn(prefix + '"1.0"} 2\n', text)
+        self.assertIn(prefix + '"+Inf"} 2\n', text)
+        self.assertIn(
+            'secrets_safe_action_lookup_seconds_sum{action="get_secret"} 0.55\n', text
+        )
+        self.assertIn(
+            'secrets_safe_action_lookup_seconds_count{action="get_secret"} 2\n', text
+        )
+
+        with self.assertRaises(ValueError):
+            registry.set("errors_total", 1)
+
+    def test_write(self):
+        """
+        Verify that the file is written readable by the collector and that
+        no temporary file is left behind.
+        """
+        directory = tempfile.mkdtemp()
+        path = os.path.join(directory, "secrets_safe_get_secret.prom")
+        registry = metrics.Metrics()
+        registry.set("run_success", 1)
+
+        registry.write(path)
+
+        with open(path, encoding="utf-8") as fh:
+            self.assertIn("secrets_safe_action_run_success 1", fh.read())
+        self.assertEqual(stat.S_IMODE(os.stat(path).st_mode), metrics.FILE_MODE)
+        self.assertEqual(os.listdir(directory), ["secrets_safe_get_secret.prom"])
+        os.unlink(path)
+        os.rmdir(directory)
+
+    def test_instrument_session(self):
+        """
+        Verify that the response hook counts requests, retries and bytes.
+        """
+        registry = metrics.Metrics()
+        session = requests.Session()
+        registry.instrument_session(session)
+
+        response = requests.Response()
+        response.status_code = 200
+        response.request = requests.Request("GET", "https://example.com").prepare()
+        response.headers["Content-Length"] = "42"
+        response._content = b"x" * 42
+        response.raw = MagicMock()
+        response.raw.retries.history = (object(), object())
+        response.elapsed = MagicMock()
+        response.elapsed.total_seconds.return_value = 0.2
+        session.hooks["response"][0](response)
+
+        text = registry.render()
+        self.assertIn(
+            'secrets_safe_action_http_requests_total{code="200",method="GET"} 1', text
+        )
+        self.assertIn("secrets_safe_action_http_retries_total 2", text)
+        self.assertIn(
+            'secrets_safe_action_http_response_bytes_total{encoding="identity"} 42',
+            text,
+        )
+
+    def test_instrument_session_compressed(self):
+        """
+        Verify that compressed responses count the received and the decoded
+        bytes.
+        """
+        registry = metrics.Metrics()
+        session = requests.Session()
+        registry.instrument_session(session)
+
+        body = b"secret line\n" * 1000
+        compressed = gzip.compress(body)
+        response = requests.Response()
+        response.status_code = 200
+        response.request = requests.Request("GET", "https://example.com").prepare()
+        response.headers["Content-Encoding"] = "gzip"
+        response.raw = HTTPResponse(
+            io.BytesIO(compressed),
+            headers={"Content-Encoding": "gzip"},
+            preload_content=False,
+        )
+        response.elapsed = MagicMock()
+        response.elapsed.total_seconds.return_value = 0.2
+        session.hooks["response"][0](response)
+
+        text = registry.render()
+        self.assertEqual(response.content, body)
+        self.assertIn(
+            f'http_response_bytes_total{{encoding="gzip"}} {len(compressed)}', text
+        )
+        self.assertIn(
+            f'http_response_decoded_bytes_total{{encoding="gzip"}} {len(body)}', text
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
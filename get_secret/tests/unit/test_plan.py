@@ -0,0 +1,88 @@
+"""Unit tests for Plan module"""
+
+import os
+import tempfile
+import unittest
+
+from src import metrics, plan
+
+
+class TestPlan(unittest.TestCase):
+    """
+    Unit tests for plan module:
+    - load_estimates
+    - Plan
+    - sign_in_calls
+    """
+
+    def test_load_estimates(self):
+        """
+        Verify that the mean latencies are read from the metrics of a run,
+        summing the samples of every label set.
+        """
+        prefix = metrics.METRIC_PREFIX
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "run.prom")
+            with open(path, "w", encoding="utf-8") as fh:
+                fh.write(
+                    f"# TYPE {prefix}auth_seconds histogram\n"
+                    f'{prefix}auth_seconds_sum{{action="get_secret"}} 0.8\n'
+                    f'{prefix}auth_seconds_count{{action="get_secret"}} 1\n'
+                    f'{prefix}http_request_seconds_sum{{method="GET"}} 0.3\n'
+                    f'{prefix}http_request_seconds_count{{method="GET"}} 2\n'
+                    f'{prefix}http_request_seconds_sum{{method="POST"}} 0.1\n'
+                    f'{prefix}http_request_seconds_count{{method="POST"}} 2\n'
+                )
+
+            estimates = plan.load_estimates(path)
+
+        self.assertAlmostEqual(estimates.auth_seconds, 0.8)
+        self.assertAlmostEqual(estimates.request_seconds, 0.1)
+        self.assertEqual(estimates.source, path)
+
+    def test_load_estimates_missing_file(self):
+        """
+        Verify that the default latencies are used without metrics.
+        """
+        self.assertEqual(
+            plan.load_estimates("/nonexistent/run.prom"), plan.LatencyEstimates()
+        )
+
+    def test_estimated_seconds(self):
+        """
+        Verify that concurrent calls are estimated in rounds and that the
+        rate limit bounds the estimate.
+        """
+        run_plan = plan.Plan("get_secret")
+        plan.sign_in_calls(run_plan, True, ["https://a", "https://b"])
+        run_plan.add(plan.REQUESTS, "POST", "Requests", 10, 4)
+        run_plan.add(plan.CHECKINS, "PUT", "Requests/{requestId}/checkin", 0)
+        estimates = plan.LatencyEstimates(1.0, 0.5, "test")
+
+        self.assertEqual(run_plan.request_count, 13)
+        # probe round, sign in, then 3 rounds of requests
+        self.assertAlmostEqual(run_plan.estimated_seconds(estimates), 3.0)
+        self.assertAlmostEqual(run_plan.estimated_seconds(estimates, 1), 13.0)
+
+    def test_to_dict(self):
+        """
+        Verify the description of the plan and of its calls.
+        """
+        run_plan = plan.Plan("get_secret")
+        plan.sign_in_calls(run_plan, False, ["https://a"])
+        run_plan.add(plan.LOOKUPS, "GET", "Secrets-Safe/secrets", 2, note="file")
+
+        described = run_plan.to_dict(plan.LatencyEstimates(1.0, 0.25, "test"))
+
+        self.assertEqual(described["requests"], 4)
+        self.assertEqual(described["estimated_seconds"], 1.5)
+        self.assertEqual(described["latency_source"], "test")
+        self.assertEqual(
+            [call["stage"] for call in described["calls"]], [plan.AUTH, plan.LOOKUPS]
+        )
+        self.assertEqual(described["calls"][1]["note"], "file")
+        self.assertEqual(described["calls"][1]["estimated_seconds"], 0.5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,132 @@
+"""Unit tests for SecretValue module"""
+
+import io
+import os
+import tempfile
+import tracemalloc
+import unittest
+from unittest.mock import patch
+
+from src import main, secret_value
+
+LARGE_SECRET_BYTES = 8 * 1024 * 1024
+
+
+class TestSecretValue(unittest.TestCase):
+    """
+    Tests for SecretValue
+    """
+
+    def test_mask_lines_skips_blank_lines(self):
+        """Test mask_lines yields the same lines as the str implementation"""
+        value = secret_value.SecretValue("line1\n\n  \nline3\n")
+        lines = [bytes(line) for line in value.mask_lines()]
+        self.assertEqual(lines, [b"line1", b"line3"])
+
+    def test_zeroize(self):
+        """Test zeroize overwrites the buffer in place"""
+        buffer = bytearray(b"s3cr3t")
+        value = secret_value.SecretValue(buffer)
+
+        with value:
+            self.assertEqual(bytes(value.view()), b"s3cr3t")
+
+        self.assertEqual(buffer, bytearray(6))
+
+    def test_max_bytes(self):
+        """Test oversized secrets are rejected and wiped"""
+        buffer = bytearray(b"too long")
+        with self.assertRaises(ValueError):
+            secret_value.SecretValue(buffer, max_bytes=4)
+        self.assertEqual(buffer, bytearray(8))
+
+    def test_str_is_encoded_into_the_buffer(self):
+        """Test a str is encoded and zeroized without a full-size copy"""
+        text = "héllo wörld €\n" * 10_000
+        with secret_value.SecretValue(text) as value:
+            self.assertEqual(bytes(value.view()), text.encode("utf-8"))
+
+        text = "x" * LARGE_SECRET_BYTES
+        tracemalloc.start()
+        try:
+            value = secret_value.SecretValue(text)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            value.zeroize()
+            _, zeroize_peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        self.assertLess(peak, LARGE_SECRET_BYTES * 1.1)
+        self.assertLess(zeroize_peak, LARGE_SECRET_BYTES * 1.1)
+        self.assertEqual(bytes(value.view()), bytes(LARGE_SECRET_BYTES))
+        with self.assertRaises(ValueError):
+            secret_value.SecretValue("é" * 3, max_bytes=5)
+
+    def test_repr_redacts_value(self):
+        """Test repr never contains the secret"""
+        self.assertNotIn("s3cr3t", repr(secret_value.SecretValue("s3cr3t")))
+
+
+class TestSecretValuePublishing(unittest.TestCase):
+    """
+    Tests publishing a SecretValue through mask_secret and append_output,
+    including the peak memory used to publish a large secret
+    """
+
+    def setUp(self):
+        self.temp_file = tempfile.NamedTemporaryFile(mode="w", delete=False)
+        self.temp_file.close()
+        self.addCleanup(os.unlink, self.temp_file.name)
+        self.stdout = io.TextIOWrapper(io.BytesIO(), encoding="utf-8")
+
+    def publish(self, value):
+        with patch.dict(os.environ, {"GITHUB_OUTPUT": self.temp_file.name}), patch(
+            "sys.stdout", self.stdout
+        ):
+            main.mask_secret("add-mask", value)
+            main.append_output("large", value)
+
+    def measure_peak(self, value) -> int:
+        # Discard console output so only the publishing path is measured
+        self.stdout = open(os.devnull, "w")
+        self.addCleanup(self.stdout.close)
+        tracemalloc.start()
+        try:
+            tracemalloc.reset_peak()
+            baseline, _ = tracemalloc.get_traced_memory()
+            self.publish(value)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        return peak - baseline
+
+    def test_publish_matches_str_output(self):
+        """Test a SecretValue is published exactly like the same str"""
+        with secret_value.SecretValue("line1\n\nline3") as value:
+            self.publish(value)
+
+        self.stdout.flush()
+        self.assertEqual(
+            self.stdout.buffer.getvalue(),
+            b"::add-mask ::line1\n::add-mask ::line3\n",
+        )
+        with open(self.temp_file.name, "r") as fh:
+            self.assertIn("\nline1\n\nline3\n", fh.read())
+
+    def test_publish_large_secret_peak_memory(self):
+        """Test publishing a large SecretValue does not copy the secret"""
+        line = "x" * 63 + "\n"
+        text = line * (LARGE_SECRET_BYTES // len(line))
+
+        str_peak = self.measure_peak(text)
+        value = secret_value.SecretValue(text)
+        buffer_peak = self.measure_peak(value)
+        value.zeroize()
+
+        self.assertGreater(str_peak, LARGE_SECRET_BYTES)
+        self.assertLess(buffer_peak, LARGE_SECRET_BYTES // 10)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+"""Unit tests for Snapshot module"""
+
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from src import snapshot
+
+
+@patch("src.snapshot.SCRYPT_N", 2**10)
+class TestSnapshot(unittest.TestCase):
+    """
+    Tests for write_bundle and read_bundle
+    """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.path = os.path.join(self.directory.name, "secrets.bundle")
+        self.values = {"db": "s3cr3t", "cert": "line1\nline2"}
+
+    def test_round_trip(self):
+        """Test a bundle decrypts to the exported values"""
+        snapshot.write_bundle(self.path, self.values, "passphrase", "repo/1", 60)
+
+        self.assertEqual(os.stat(self.path).st_mode & 0o777, 0o600)
+        with open(self.path, "rb") as fh:
+            self.assertNotIn(b"s3cr3t", fh.read())
+        self.assertEqual(
+            snapshot.read_bundle(self.path, "passphrase", "repo/1"), self.values
+        )
+
+    def test_rejects_wrong_passphrase_audience_and_expiry(self):
+        """Test a bundle is only accepted with its passphrase, audience and TTL"""
+        snapshot.write_bundle(self.path, self.values, "passphrase", "repo/1", 60)
+
+        with self.assertRaisesRegex(snapshot.SnapshotError, "decrypted"):
+            snapshot.read_bundle(self.path, "other", "repo/1")
+        with self.assertRaisesRegex(snapshot.SnapshotError, "audience"):
+            snapshot.read_bundle(self.path, "passphrase", "repo/2")
+
+        snapshot.write_bundle(self.path, self.values, "passphrase", "repo/1", -1)
+        with self.assertRaisesRegex(snapshot.SnapshotError, "expired"):
+            snapshot.read_bundle(self.path, "passphrase", "repo/1")
+
+    def test_rejects_tampered_header(self):
+        """Test extending the expiry in the clear header fails decryption"""
+        snapshot.write_bundle(self.path, self.values, "passphrase", "repo/1", 60)
+        with open(self.path, "rb") as fh:
+            content = fh.read()
+
+        header_start = len(snapshot.MAGIC)
+        header_end = content.index(b"\n", header_start)
+        header = content[header_start:header_end]
+        tampered = header.replace(b'"expires_at": 1', b'"expires_at": 9')
+        with open(self.path, "wb") as fh:
+            fh.write(content.replace(header, tampered))
+
+        with self.assertRaises(snapshot.SnapshotError):
+            snapshot.read_bundle(self.path, "passphrase", "repo/1")
+
+    def test_rejects_other_scrypt_parameters(self):
+        """Test a header asking for other scrypt costs is refused before deriving"""
+        snapshot.write_bundle(self.path, self.values, "passphrase", "repo/1", 60)
+        with open(self.path, "rb") as fh:
+            content = fh.read()
+
+        for field in (b'"n": 1024', b'"r": 8', b'"p": 1'):
+            name, _ = field.split(b": ")
+            with self.subTest(field=field):
+                with open(self.path, "wb") as fh:
+                    fh.write(content.replace(field, name + b": 1048576"))
+
+                with patch("src.snapshot._derive_key") as mock_derive_key:
+                    with self.assertRaisesRegex(snapshot.SnapshotError, "scrypt"):
+                        snapshot.read_bundle(self.path, "passphrase", "repo/1")
+                mock_derive_key.assert_not_called()
+
+    def test_default_audience(self):
+        """Test the audience is the repository and workflow run"""
+        environ = {"GITHUB_REPOSITORY": "org/repo", "GITHUB_RUN_ID": "42"}
+        self.assertEqual(snapshot.default_audience(environ), "org/repo/42")
+        environ["SNAPSHOT_AUDIENCE"] = "custom"
+        self.assertEqual(snapshot.default_audience(environ), "custom")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,101 @@
+"""Unit tests for Structured Logging module"""
+
+import io
+import json
+import logging
+import time
+import unittest
+from unittest.mock import patch
+
+from src import structured_logging
+
+
+class TestStructuredLogging(unittest.TestCase):
+    """
+    Unit tests for structured_logging module:
+    - log_event
+    - JsonFormatter
+    - SamplingFilter
+    """
+
+    def setUp(self):
+        self.stream = io.StringIO()
+        handler = logging.StreamHandler(self.stream)
+        handler.setFormatter(structured_logging.JsonFormatter(run_id="42"))
+        self.logger = logging.getLogger("test_structured_logging")
+        self.logger.addHandler(handler)
+        self.logger.setLevel(logging.DEBUG)
+        self.logger.propagate = False
+        self.addCleanup(self.logger.removeHandler, handler)
+
+    def _records(self):
+        return [json.loads(line) for line in self.stream.getvalue().splitlines()]
+
+    def test_log_event_json(self):
+        """
+        Verify that events are written as JSON with the run id, the hashed
+        path and the latency, and that unknown fields such as a password are
+        dropped.
+        """
+        structured_logging.log_event(
+            self.logger,
+            logging.INFO,
+            "get_secret",
+            path="folder/secret",
+            started=time.perf_counter(),
+            status="success",
+            password="P@ssw0rd",
+        )
+
+        (record,) = self._records()
+        self.assertEqual(record["run_id"], "42")
+        self.assertEqual(record["operation"], "get_secret")
+        self.assertEqual(
+            record["path_hash"], structured_logging.path_hash("folder/secret")
+        )
+        self.assertEqual(record["status"], "success")
+        self.assertGreaterEqual(record["latency_ms"], 0)
+        self.assertNotIn("P@ssw0rd", self.stream.getvalue())
+        self.assertNotIn("folder/secret", self.stream.getvalue())
+
+    def test_log_event_disabled_level(self):
+        """
+        Verify that nothing is logged or hashed when the level is disabled.
+        """
+        self.logger.setLevel(logging.INFO)
+        with patch.object(structured_logging, "path_hash") as mock_hash:
+            structured_logging.log_event(
+                self.logger, logging.DEBUG, "get_secret", path="folder/secret"
+            )
+
+        mock_hash.assert_not_called()
+        self.assertEqual(self.stream.getvalue(), "")
+
+    def test_sampling_filter(self):
+        """
+        Verify that DEBUG records are sampled and other records always kept.
+        """
+        values = iter([0.1, 0.9])
+        self.logger.addFilter(
+            structured_logging.SamplingFilter(0.5, random_fn=lambda: next(values))
+        )
+
+        self.logger.debug("kept")
+        self.logger.debug("dropped")
+        self.logger.info("always kept")
+
+        messages = [record["message"] for record in self._records()]
+        self.assertEqual(messages, ["kept", "always kept"])
+
+    def test_configure_logging_invalid(self):
+        """
+        Verify that an unknown format or sample rate is rejected.
+        """
+        with self.assertRaises(ValueError):
+            structured_logging.configure_logging("test", logging.INFO, "xml")
+        with self.assertRaises(ValueError):
+            structured_logging.configure_logging("test", logging.INFO, sample_rate=2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,192 @@
+"""Unit tests for Tracing module"""
+
+import json
+import os
+import stat
+import tempfile
+import unittest
+
+import requests
+from src import tracing
+from tests.replay import replay, standin
+
+SECRET_ID = "4b2e8c1a-9f3d-4a6b-8c7e-1d2f3a4b5c6d"
+
+
+def record(run, op, key="k", seconds=0.01, received=10, sent=0, retries=0):
+    return {
+        "action": replay.ACTION,
+        "run": run,
+        "op": op,
+        "key": key,
+        "start": 0.0,
+        "seconds": seconds,
+        "status": 200,
+        "retries": retries,
+        "sent": sent,
+        "received": received,
+    }
+
+
+class TestTracing(unittest.TestCase):
+    """
+    Unit tests for tracing module:
+    - operation
+    - path_key
+    - TraceRecorder
+    - load
+    """
+
+    def test_operation(self):
+        """
+        Verify that ids and the API URL path are removed from operations.
+        """
+        base_path = "/BeyondTrust/api/public/v3"
+        cases = [
+            (
+                f"https://host{base_path}/Secrets-Safe/Secrets/{SECRET_ID}/text",
+                "GET secrets-safe/secrets/{id}/text",
+            ),
+            (
+                f"https://host{base_path}/secrets-safe/secrets?title=db&path=team",
+                "GET secrets-safe/secrets",
+            ),
+            (f"https://host{base_path}/Credentials/42", "GET credentials/{id}"),
+        ]
+        for url, expected in cases:
+            with self.subTest(url=url):
+                self.assertEqual(tracing.operation("get", url, base_path), expected)
+
+    def test_path_key(self):
+        """
+        Verify that paths are hashed, case-insensitively, with their query
+        string, and are not kept in clear.
+        """
+        key = tracing.path_key("https://host/secrets?title=database&path=team")
+
+        self.assertEqual(len(key), tracing.KEY_LENGTH)
+        self.assertNotIn("database", key)
+        self.assertEqual(
+            key, tracing.path_key("https://HOST/Secrets?title=database&path=team")
+        )
+        self.assertNotEqual(
+            key, tracing.path_key("https://host/secrets?title=other&path=team")
+        )
+
+    def test_recorder(self):
+        """
+        Verify that the calls of an instrumented session are recorded and
+        appended to a file readable only by its owner.
+        """
+        recorder = tracing.TraceRecorder("get_secret")
+        with standin.StandIn(standin.Profiles([])) as server:
+            session = requests.Session()
+            recorder.instrument_session(session, server.api_url)
+            session.get(f"{server.api_url}/secrets-safe/secrets?title=database")
+            session.put(f"{server.api_url}/Requests/7/checkin", data="{}")
+
+        self.assertEqual(
+            [entry["op"] for entry in recorder.records],
+            ["GET secrets-safe/secrets", "PUT requests/{id}/checkin"],
+        )
+        lookup, checkin = recorder.records
+        self.assertEqual(lookup["status"], 200)
+        self.assertGreater(lookup["received"], 0)
+        self.assertEqual(checkin["sent"], 2)
+        self.assertEqual(checkin["status"], 204)
+        self.assertNotIn("database", json.dumps(recorder.records))
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "trace.jsonl")
+            recorder.write(path)
+            recorder.write(path)
+            tracing.TraceRecorder("create_secret").write(path)
+
+            self.assertEqual(stat.S_IMODE(os.stat(path).st_mode), tracing.FILE_MODE)
+            self.assertEqual(len(tracing.load(path)), 4)
+            self.assertEqual(len(tracing.load(path, "create_secret")), 0)
+
+
+class TestReplay(unittest.TestCase):
+    """
+    Unit tests for the replay of traces:
+    - standin.Profiles
+    - standin.respond
+    - replay.build_runs
+    - replay.saturation_point
+    """
+
+    def test_profiles(self):
+        """
+        Verify that the recorded samples of an operation are served in turn.
+        """
+        profiles = standin.Profiles(
+            [
+                record("a", "GET credentials/{id}", seconds=0.1, received=5),
+                record("b", "GET credentials/{id}", seconds=0.2, received=6),
+            ]
+        )
+
+        self.assertEqual(
+            [profiles.next("GET credentials/{id}") for _ in range(3)],
+            [(0.1, 5), (0.2, 6), (0.1, 5)],
+        )
+        self.assertIsNone(profiles.next("GET secrets-safe/folders"))
+
+    def test_respond(self):
+        """
+        Verify that secret values are padded to the recorded size and that
+        unknown calls are not served.
+        """
+        status, body = standin.respond("GET", "/secrets-safe/secrets", "title=db", 8)
+        self.assertEqual(status, 200)
+        self.assertEqual(body[0]["Password"], "x" * 8)
+
+        status, _ = standin.respond("PUT", "/Requests/3/checkin", "", 0)
+        self.assertEqual(status, 204)
+
+        status, _ = standin.respond("DELETE", "/secrets-safe/folders/3", "", 0)
+        self.assertEqual(status, 404)
+
+    def test_build_runs(self):
+        """
+        Verify that runs are grouped and that runs without lookups or writes
+        are left out.
+        """
+        records = [
+            record("a", "POST auth/signappin"),
+            record("a", "GET secrets-safe/secrets", key="k1"),
+            record("a", "GET secrets-safe/secrets", key="k2"),
+            record("a", "GET credentials/{id}"),
+            record("a", "POST secrets-safe/folders/{id}/secrets/text", sent=12),
+            record("b", "POST auth/signappin"),
+        ]
+
+        runs = replay.build_runs(records, "get_secret")
+        self.assertEqual([run.run for run in runs], ["a"])
+        self.assertEqual(len(json.loads(runs[0].inputs["INPUT_SECRET_PATH"])), 2)
+        self.assertEqual(
+            len(json.loads(runs[0].inputs["INPUT_MANAGED_ACCOUNT_PATH"])), 1
+        )
+
+        runs = replay.build_runs(records, "create_secret")
+        self.assertEqual([run.run for run in runs], ["a"])
+        self.assertEqual(runs[0].inputs["INPUT_TEXT"], "x" * 12)
+
+    def test_saturation_point(self):
+        """
+        Verify that the saturation point is the level past which the
+        throughput stops growing.
+        """
+        levels = [
+            {"concurrency": 1, "runs_per_second": 2.0},
+            {"concurrency": 10, "runs_per_second": 15.0},
+            {"concurrency": 100, "runs_per_second": 15.5},
+        ]
+
+        self.assertEqual(replay.saturation_point(levels), 10)
+        self.assertIsNone(replay.saturation_point(levels[:2]))
+
+
+if __name__ == "__main__":
+    unittest.main()